@@ -0,0 +1,366 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import os
+
+import numpy as np
+
+from .DataManagement import *
+
+
+def convertPowerToVoltage(power, resistance=50):
+    """Converts Power (dBm) to Voltage (peak-to-zero).
+
+    Args:
+        power (float): Power in dBm.
+        resistance (float, optional): Resistance in Ohm. Defaults to 50.
+
+    Returns:
+        float: Voltage (peak-to-zero)
+    """    
+    power_mW = np.power(10, power/10)
+    voltageRMS = np.sqrt(power_mW * resistance / np.power(10, 3))
+    voltagePeak = np.sqrt(2) * voltageRMS
+    return voltagePeak
+
+def convertVoltageToPower(voltage, resistance=50):
+    """Converts Voltage (peak-to-zero) to Power.
+
+    Args:
+        voltage (float): Voltage (peak-to-zero) in V.
+        resistance (float, optional): Resistance in Ohm. Defaults to 50.
+
+    Returns:
+        float: Power (dBm)
+    """    
+    voltageRMS = voltage / np.sqrt(2)
+    power_mW = np.power(voltageRMS, 2) * np.power(10, 3) / resistance
+    power = 10 * np.log10(power_mW)
+    return power
+
+def calculatePowerConstantJunctionAmplitude(frequency, junctionVoltage, transferFunctionFrequency, transferFunctionTransmission):
+    """Calculates the output powers to apply a constant junction amplitude based on the transfer function.
+
+    Args:
+        frequency (ndarray): Frequencies at which a constant junction amplitude is to be applied.
+        junctionVoltage (float): Junction amplitude in V.
+        transferFunctionFrequency (ndarray): Frequencies from the transfer function.
+        transferFunctionTransmission (ndarray): Tranmission values from the transfer function.
+
+    Returns:
+        ndarray: Output powers to generate a constant amplitude..
+    """    
+    junctionVoltage = np.abs(junctionVoltage)
+    transmission = np.interp(frequency, transferFunctionFrequency, transferFunctionTransmission)
+    sourceVoltages = junctionVoltage / transmission
+    sourcePower = convertVoltageToPower(sourceVoltages)
+
+    # plt.figure()
+    # plt.plot(frequency, sourcePower, '.')
+    # plt.xlabel('Frequency (Hz)')
+    # plt.ylabel('Source Power (dBm)')
+    # plt.show()
+
+    return sourcePower
+
+def loadTransferFunction(generalSettings):
+    """Loads the transfer function data.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+
+    Returns:
+        ndarray, ndarray, ndarray, float: Frequencies, Transmissionvalues, Coefficients for polynomial fit (lock-in voltage to junction amplitude), Calibration factor lock-in to current.
+    """    
+    # Load Transfer Function
+    tfData = loadData(generalSettings['TF_Folder'], generalSettings['TF_File'])
+    tfFrequency = np.array(tfData['Data']['Frequency (Hz)'])
+    tfTransmission = np.array(tfData['Data']['Transmission (normalized)'])
+    coeffPolyFit = np.array(tfData['additionalInformation']['coeffPolyFit'])
+    calFactorLockInToCurrent = np.float64(tfData['additionalInformation']['calFactorLockInToCurrent'])
+
+    return tfFrequency, tfTransmission, coeffPolyFit, calFactorLockInToCurrent
+
+def loadCrosstalkSignal(generalSettings, ctData=None):
+    """Loads the crosstalk data.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        ctData (dict, optional): Content of the crosstalk file (see loadData). Defaults to None: The file is loaded.
+
+    Returns:
+        ndarray, ndarray, ndarray: Frequencies, Frequency dependent scaling factors for crosstalk, Coefficients for polynomial fit (source voltage to lock-in voltage).
+    """    
+    # Load Crosstalk Signal
+    if ctData is None:
+        ctData = loadData(generalSettings['CT_Folder'], generalSettings['CT_File'])
+    ctFrequency = np.array(ctData['Data']['Frequency (Hz)'])
+    ctScalingFactorsPowerFunction = np.array(ctData['Data']['Scaling (relative)'])
+    coeffPolyFit = np.array(ctData['additionalInformation']['coeffPolyFit'])
+
+    return ctFrequency, ctScalingFactorsPowerFunction, coeffPolyFit
+
+def loadCrosstalkMap(generalSettings, ctData=None):
+    """Loads the per-frequency crosstalk polynomials of a crosstalk map (see RF.measureCrosstalkMap).
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        ctData (dict, optional): Content of the crosstalk file (see loadData). Defaults to None: The file is loaded.
+
+    Returns:
+        ndarray, ndarray: Frequencies of the map, Coefficients for polynomial fits (source voltage to lock-in voltage) for each frequency. None, None if the crosstalk file contains no map.
+    """    
+    if ctData is None:
+        ctData = loadData(generalSettings['CT_Folder'], generalSettings['CT_File'])
+    if 'coeffPolyFitMap' not in ctData['additionalInformation']:
+        return None, None
+    ctFrequency = np.array(ctData['Data']['Frequency (Hz)'])
+    coeffPolyFitMap = np.array(ctData['additionalInformation']['coeffPolyFitMap'])
+
+    return ctFrequency, coeffPolyFitMap
+
+def buildInterpolant(x, y, interpolation='linear'):
+    """Creates an interpolation function. Values outside the range of x are clamped to the boundary values (like np.interp).
+
+    Args:
+        x (ndarray): Sample points.
+        y (ndarray): Sample values.
+        interpolation (str, optional): 'linear': Linear interpolation. 'spline': Cubic spline interpolation (requires scipy). Defaults to 'linear'.
+
+    Raises:
+        Exception: Unknown interpolation.
+
+    Returns:
+        function: Interpolation function accepting arbitrary arrays.
+    """    
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    idx = np.argsort(x, kind='stable')
+    x = x[idx]
+    y = y[idx]
+
+    if interpolation == 'linear':
+        def interpolant(xNew):
+            return np.interp(xNew, x, y)
+    elif interpolation == 'spline':
+        from scipy.interpolate import CubicSpline
+        spline = CubicSpline(x, y)
+        def interpolant(xNew):
+            return spline(np.clip(xNew, x[0], x[-1]))
+    else:
+        raise Exception('Unknown interpolation: {}'.format(interpolation))
+
+    return interpolant
+
+
+class CalibrationModel():
+    def __init__(self, tfFrequency=None, tfTransmission=None, coeffPolyFit=None, calFactorLockInToCurrent=None, 
+                ctFrequency=None, ctScalingFactorsPowerFunction=None, coeffPolyFitCrosstalk=None, coeffPolyFitCrosstalkMap=None, interpolation='linear', resistance=50):
+        """Calibration of the RF setup consisting of the transfer function (TF) and the crosstalk signal (CT).
+        All methods are vectorized and accept arbitrary (broadcastable) frequency, power and lock-in arrays.
+
+        Args:
+            tfFrequency (ndarray, optional): Frequencies of the transfer function. Defaults to None: No transfer function.
+            tfTransmission (ndarray, optional): Transmission values of the transfer function. Defaults to None.
+            coeffPolyFit (ndarray, optional): Coefficients for polynomial fit (lock-in voltage to junction amplitude). Defaults to None.
+            calFactorLockInToCurrent (float, optional): Calibration factor lock-in to current. Defaults to None.
+            ctFrequency (ndarray, optional): Frequencies of the crosstalk signal. Defaults to None: No crosstalk correction.
+            ctScalingFactorsPowerFunction (ndarray, optional): Frequency dependent scaling factors for crosstalk. Defaults to None.
+            coeffPolyFitCrosstalk (ndarray, optional): Coefficients for polynomial fit (source voltage to lock-in voltage). Defaults to None.
+            coeffPolyFitCrosstalkMap (ndarray, optional): Coefficients for polynomial fits (source voltage to lock-in voltage) for each crosstalk frequency. Replaces the scaled single polynomial. Defaults to None.
+            interpolation (str, optional): 'linear' or 'spline' interpolation in frequency. Defaults to 'linear'.
+            resistance (float, optional): Resistance in Ohm. Defaults to 50.
+        """        
+        self.interpolation = interpolation
+        self.resistance = resistance
+
+        self.tfFrequency = tfFrequency
+        self.tfTransmission = tfTransmission
+        if tfFrequency is not None:
+            self.transmission = buildInterpolant(tfFrequency, tfTransmission, interpolation)
+        self.coeffPolyFit = None if coeffPolyFit is None else np.asarray(coeffPolyFit, dtype=np.float64)
+        self.calFactorLockInToCurrent = calFactorLockInToCurrent
+
+        self.ctFrequency = ctFrequency
+        self.ctScalingFactorsPowerFunction = ctScalingFactorsPowerFunction
+        if ctFrequency is not None:
+            self.crosstalkScaling = buildInterpolant(ctFrequency, ctScalingFactorsPowerFunction, interpolation)
+        self.coeffPolyFitCrosstalk = None if coeffPolyFitCrosstalk is None else np.asarray(coeffPolyFitCrosstalk, dtype=np.float64)
+        self.coeffPolyFitCrosstalkMap = None if coeffPolyFitCrosstalkMap is None else np.asarray(coeffPolyFitCrosstalkMap, dtype=np.float64)
+        if self.coeffPolyFitCrosstalkMap is not None:
+            # One interpolant per polynomial coefficient (highest order first)
+            self.crosstalkCoefficients = [buildInterpolant(ctFrequency, self.coeffPolyFitCrosstalkMap[:,k], interpolation) for k in range(self.coeffPolyFitCrosstalkMap.shape[1])]
+
+    def hasTransferFunction(self):
+        """Returns whether a transfer function is available.
+
+        Returns:
+            bool: True: Transfer function available.
+        """        
+        return self.tfFrequency is not None
+
+    def hasCrosstalk(self):
+        """Returns whether a crosstalk calibration is available.
+
+        Returns:
+            bool: True: Crosstalk calibration available.
+        """        
+        return self.ctFrequency is not None
+
+    def getTransmission(self, frequency):
+        """Returns the interpolated transmission.
+
+        Args:
+            frequency (ndarray): Frequencies in Hz.
+
+        Returns:
+            ndarray: Transmission values.
+        """        
+        return self.transmission(frequency)
+
+    def calculateSourcePower(self, frequency, junctionAmplitude):
+        """Calculates the output powers to apply the junction amplitude(s) based on the transfer function.
+
+        Args:
+            frequency (ndarray): Frequencies in Hz.
+            junctionAmplitude (float, ndarray): Junction amplitude(s) in V.
+
+        Returns:
+            ndarray: Output powers in dBm.
+        """        
+        sourceVoltages = np.abs(junctionAmplitude) / self.getTransmission(frequency)
+        return convertVoltageToPower(sourceVoltages, self.resistance)
+
+    def calculateCrosstalk(self, frequency, power):
+        """Calculates the lock-in signal caused by crosstalk.
+
+        Args:
+            frequency (ndarray): Frequencies in Hz.
+            power (ndarray): Source powers in dBm.
+
+        Returns:
+            ndarray: Lock-in signal due to crosstalk. Zero if no crosstalk calibration is available.
+        """        
+        frequency, power = np.broadcast_arrays(np.asarray(frequency, dtype=np.float64), np.asarray(power, dtype=np.float64))
+        if not self.hasCrosstalk():
+            return np.zeros(frequency.shape)
+        sourceVoltage = convertPowerToVoltage(power, self.resistance)
+        if self.coeffPolyFitCrosstalkMap is not None:
+            # Evaluate polynomial with frequency dependent coefficients (Horner scheme)
+            crosstalk = np.zeros(frequency.shape)
+            for coefficient in self.crosstalkCoefficients:
+                crosstalk = crosstalk * sourceVoltage + coefficient(frequency)
+            return crosstalk
+        return np.polyval(self.coeffPolyFitCrosstalk, sourceVoltage) * self.crosstalkScaling(frequency)
+
+    def correctCrosstalk(self, frequency, power, lockinSignal):
+        """Subtracts the lock-in signal caused by crosstalk.
+
+        Args:
+            frequency (ndarray): Frequencies in Hz.
+            power (ndarray): Source powers in dBm.
+            lockinSignal (ndarray): Measured lock-in signal.
+
+        Returns:
+            ndarray: Corrected lock-in signal.
+        """        
+        return lockinSignal - self.calculateCrosstalk(frequency, power)
+
+    def convertLockInToJunctionAmplitude(self, lockinSignal):
+        """Converts the (corrected) lock-in signal to the junction amplitude.
+
+        Args:
+            lockinSignal (ndarray): Lock-in signal.
+
+        Returns:
+            ndarray: Junction amplitude in V.
+        """        
+        return np.polyval(self.coeffPolyFit, lockinSignal)
+
+    def convertLockInToCurrentChange(self, lockinSignal):
+        """Converts the (corrected) lock-in signal to the change in junction current.
+
+        Args:
+            lockinSignal (ndarray): Lock-in signal.
+
+        Returns:
+            ndarray: Change in junction current in A.
+        """        
+        return np.asarray(lockinSignal) * self.calFactorLockInToCurrent
+
+    def applyCalibration(self, frequency, power, lockinSignal):
+        """Applies crosstalk correction and amplitude conversion to a measured lock-in signal.
+
+        Args:
+            frequency (ndarray): Frequencies in Hz.
+            power (ndarray): Source powers in dBm.
+            lockinSignal (ndarray): Measured lock-in signal.
+
+        Returns:
+            dict: Crosstalk signal, corrected lock-in signal, junction amplitude and junction current change.
+        """        
+        crosstalk = self.calculateCrosstalk(frequency, power)
+        lockinSignal = lockinSignal - crosstalk
+        results = {'Crosstalk Signal (V)': crosstalk, 'LockIn Signal (V)': lockinSignal}
+        if self.coeffPolyFit is not None:
+            results['Junction Amplitude (V)'] = self.convertLockInToJunctionAmplitude(lockinSignal)
+        if self.calFactorLockInToCurrent is not None:
+            results['Junction Current Change (A)'] = self.convertLockInToCurrentChange(lockinSignal)
+        return results
+
+
+# Loaded calibration models, key: files, modification times and interpolation
+calibrationModelCache = {}
+
+def getCalibrationFile(folder, filename):
+    """Returns the path of a transfer function or crosstalk file.
+
+    Args:
+        folder (str): Folder of the file.
+        filename (str): Filename without file extension.
+
+    Returns:
+        str: Path of the file.
+    """    
+    return '{}.json'.format(os.path.join(folder, filename))
+
+def loadCalibrationModel(generalSettings, useTF=True, useCT=None, interpolation='linear'):
+    """Loads the transfer function and crosstalk data into a calibration model. 
+    Models are cached and only re-read if one of the files has been modified. Models of older versions of the files are removed from the cache.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        useTF (bool, optional): True: Load the transfer function. Defaults to True.
+        useCT (bool, optional): True: Load the crosstalk signal. Defaults to None: generalSettings['UseCT'].
+        interpolation (str, optional): 'linear' or 'spline' interpolation in frequency. Defaults to 'linear'.
+
+    Returns:
+        CalibrationModel: Calibration model.
+    """    
+    if useCT is None:
+        useCT = generalSettings['UseCT']
+
+    key = [interpolation]
+    if useTF:
+        tfFile = getCalibrationFile(generalSettings['TF_Folder'], generalSettings['TF_File'])
+        key += [os.path.abspath(tfFile), os.path.getmtime(tfFile)]
+    if useCT:
+        ctFile = getCalibrationFile(generalSettings['CT_Folder'], generalSettings['CT_File'])
+        key += [os.path.abspath(ctFile), os.path.getmtime(ctFile)]
+    key = tuple(key)
+
+    if key not in calibrationModelCache:
+        # Remove models of modified files
+        modificationTimes = dict(zip(key[1::2], key[2::2]))
+        for cachedKey in list(calibrationModelCache):
+            if any(path in modificationTimes and modificationTimes[path] != mtime for path, mtime in zip(cachedKey[1::2], cachedKey[2::2])):
+                del calibrationModelCache[cachedKey]
+        parameters = {'interpolation': interpolation}
+        if useTF:
+            parameters['tfFrequency'], parameters['tfTransmission'], parameters['coeffPolyFit'], parameters['calFactorLockInToCurrent'] = loadTransferFunction(generalSettings)
+        if useCT:
+            ctData = loadData(generalSettings['CT_Folder'], generalSettings['CT_File'])
+            parameters['ctFrequency'], parameters['ctScalingFactorsPowerFunction'], parameters['coeffPolyFitCrosstalk'] = loadCrosstalkSignal(generalSettings, ctData)
+            _, parameters['coeffPolyFitCrosstalkMap'] = loadCrosstalkMap(generalSettings, ctData)
+        calibrationModelCache[key] = CalibrationModel(**parameters)
+
+    return calibrationModelCache[key]
@@ -0,0 +1,262 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import argparse
+import json
+import os
+import sqlite3
+
+from .DataManagement import loadData
+
+
+def flattenParameters(parameters, prefix=''):
+    """Flattens nested settings into single parameters. Nested keys are joined by '/', lists of dicts use the 'name' entry
+    (e.g. 'pulses/Probe/sweepTime'). Other lists are stored as JSON text.
+
+    Args:
+        parameters (dict): Settings, scheme, comment or additional information.
+        prefix (str, optional): Prefix of the keys. Defaults to ''.
+
+    Returns:
+        list: Tuples of key, numeric value (None for text), text value (None for numbers).
+    """    
+    flat = []
+    for key, value in parameters.items():
+        name = '{}{}'.format(prefix, key)
+        if isinstance(value, dict):
+            flat.extend(flattenParameters(value, name + '/'))
+        elif isinstance(value, list) and len(value) > 0 and all(isinstance(v, dict) and 'name' in v for v in value):
+            for v in value:
+                flat.extend(flattenParameters(v, '{}/{}/'.format(name, v['name'])))
+        elif isinstance(value, (bool, int, float)):
+            flat.append((name, float(value), None))
+        elif isinstance(value, str):
+            flat.append((name, None, value))
+        elif value is not None:
+            flat.append((name, None, json.dumps(value)[:1000]))
+    return flat
+
+
+class RunHandle():
+    def __init__(self, path, timestamp, experimentType):
+        """Handle of a cataloged measurement. The data is loaded when it is requested.
+
+        Args:
+            path (str): Path and filename of the JSON file.
+            timestamp (str): Timestamp of the measurement.
+            experimentType (str): 'TF', 'CT' or 'data'.
+        """        
+        self.path = path
+        self.timestamp = timestamp
+        self.experimentType = experimentType
+        self.measurement = None
+
+    def __repr__(self):
+        return 'RunHandle({}, {}, {})'.format(self.timestamp, self.experimentType, self.path)
+
+    def load(self):
+        """Loads the measurement (see loadData). The result is kept for further calls.
+
+        Returns:
+            dict: Read-in data.
+        """        
+        if self.measurement is None:
+            folder, filename = os.path.split(self.path)
+            self.measurement = loadData(folder, os.path.splitext(filename)[0])
+        return self.measurement
+
+    def getData(self):
+        """Returns the measurement data.
+
+        Returns:
+            dict: Measurement data.
+        """        
+        return self.load()['Data']
+
+
+class MeasurementCatalog():
+    def __init__(self, databaseFile):
+        """SQLite catalog of saved measurements. Every run is indexed with its timestamp, experiment type, instrument, sampling frequency,
+        the used TF/CT files and all parameters of the general settings, scheme, comment and additional information.
+
+        Args:
+            databaseFile (str): Path and filename of the SQLite database.
+        """        
+        self.databaseFile = databaseFile
+        self.connection = sqlite3.connect(databaseFile)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, path TEXT UNIQUE, timestamp TEXT, experimentType TEXT, instrument TEXT,
+                                            samplingFrequency REAL, tfFile TEXT, ctFile TEXT, mtime REAL);
+            CREATE TABLE IF NOT EXISTS parameters (run INTEGER REFERENCES runs(id) ON DELETE CASCADE, section TEXT, key TEXT, numberValue REAL, textValue TEXT);
+            CREATE INDEX IF NOT EXISTS runsTimestamp ON runs (timestamp);
+            CREATE INDEX IF NOT EXISTS parametersNumber ON parameters (section, key, numberValue);
+            CREATE INDEX IF NOT EXISTS parametersText ON parameters (section, key, textValue);
+            CREATE INDEX IF NOT EXISTS parametersRun ON parameters (run);
+        ''')
+
+    def close(self):
+        """Closes the database.
+        """        
+        self.connection.close()
+
+    def addRun(self, filename, experimentType='data', commit=True):
+        """Adds a saved measurement to the catalog or updates it.
+
+        Args:
+            filename (str): Path and filename of the JSON file.
+            experimentType (str, optional): 'TF': Transfer function data. 'CT': Crosstalk data. 'Data': Experimental data. Defaults to 'data'.
+            commit (bool, optional): False: The transaction is not committed (e.g. during a rescan). Defaults to True.
+        """        
+        path = os.path.abspath(filename)
+        with open(path) as json_file:
+            measurement = json.load(json_file)
+        generalSettings = measurement['GeneralSettings']
+        additionalInformation = measurement['additionalInformation'] if 'additionalInformation' in measurement else {}
+
+        if 'AWG_Name' in generalSettings:
+            instrument = generalSettings['AWG_Name']
+        elif 'SG_Name' in generalSettings:
+            instrument = generalSettings['SG_Name']
+        else:
+            instrument = None
+        samplingFrequency = additionalInformation['sampling_frequency'] if 'sampling_frequency' in additionalInformation else None
+        tfFile = None
+        if 'TF_File' in generalSettings and ('UseTF' not in generalSettings or generalSettings['UseTF']):
+            tfFile = os.path.join(generalSettings['TF_Folder'], generalSettings['TF_File'])
+        ctFile = None
+        if 'CT_File' in generalSettings and ('UseCT' not in generalSettings or generalSettings['UseCT']):
+            ctFile = os.path.join(generalSettings['CT_Folder'], generalSettings['CT_File'])
+
+        self.connection.execute('DELETE FROM runs WHERE path = ?', (path,))
+        cursor = self.connection.execute('INSERT INTO runs (path, timestamp, experimentType, instrument, samplingFrequency, tfFile, ctFile, mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                        (path, measurement['Timestamp'], experimentType, instrument, samplingFrequency, tfFile, ctFile, os.path.getmtime(path)))
+        run = cursor.lastrowid
+        rows = []
+        for section in ['GeneralSettings', 'Scheme', 'Comment', 'additionalInformation']:
+            if section in measurement and isinstance(measurement[section], dict):
+                rows.extend((run, section, key, numberValue, textValue) for key, numberValue, textValue in flattenParameters(measurement[section]))
+        self.connection.executemany('INSERT INTO parameters (run, section, key, numberValue, textValue) VALUES (?, ?, ?, ?, ?)', rows)
+        if commit:
+            self.connection.commit()
+
+    def rescan(self, folders, experimentType='data'):
+        """Indexes all measurements in the folders (recursively). Unchanged files are skipped, deleted files are removed from the catalog.
+
+        Args:
+            folders (str, list): Folder or list of folders, e.g. the Data_Folder.
+            experimentType (str, optional): Experiment type of the measurements in the folders. Defaults to 'data'.
+
+        Returns:
+            int: Number of added or updated runs.
+        """        
+        if type(folders) is str:
+            folders = [folders]
+        known = dict(self.connection.execute('SELECT path, mtime FROM runs WHERE experimentType = ?', (experimentType,)).fetchall())
+        found = set()
+        updated = 0
+        for folder in folders:
+            for root, _, files in os.walk(folder):
+                for file in files:
+                    if not file.endswith('.json'):
+                        continue
+                    path = os.path.abspath(os.path.join(root, file))
+                    found.add(path)
+                    if path in known and known[path] == os.path.getmtime(path):
+                        continue
+                    try:
+                        self.addRun(path, experimentType, commit=False)
+                        updated += 1
+                    except (ValueError, KeyError, TypeError) as e:
+                        print('Catalog: {} skipped ({})'.format(path, e))
+        folders = [os.path.abspath(folder) for folder in folders]
+        removed = [path for path in known if path not in found and any(path.startswith(folder + os.sep) for folder in folders)]
+        self.connection.executemany('DELETE FROM runs WHERE path = ?', [(path,) for path in removed])
+        self.connection.commit()
+        return updated
+
+    def query(self, experimentType=None, start=None, end=None, instrument=None, samplingFrequency=None, parameters={}):
+        """Searches the catalog.
+
+        Args:
+            experimentType (str, optional): 'TF', 'CT' or 'data'. Defaults to None: All types.
+            start (str, optional): Earliest timestamp ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'). Defaults to None.
+            end (str, optional): Latest timestamp ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS', a date includes the whole day). Defaults to None.
+            instrument (str, optional): Name of the AWG or SG, e.g. 'M8190A'. Defaults to None.
+            samplingFrequency (float, tuple, optional): Sampling frequency of the AWG in 1/s or range (min, max). Defaults to None.
+            parameters (dict, optional): Conditions on parameters 'Section/key': value or range (min, max),
+                                         e.g. {'Scheme/pulses/Probe/sweepTime': True, 'Comment/Bias (mV)': (-100, 0)}. Defaults to {}.
+
+        Returns:
+            list: RunHandles of the matching runs sorted by timestamp.
+        """        
+        conditions = []
+        arguments = []
+        if experimentType is not None:
+            conditions.append('runs.experimentType = ?')
+            arguments.append(experimentType)
+        if start is not None:
+            conditions.append('runs.timestamp >= ?')
+            arguments.append(start)
+        if end is not None:
+            conditions.append('runs.timestamp <= ?')
+            arguments.append(end if len(end) > 10 else end + ' 23:59:59')
+        if instrument is not None:
+            conditions.append('runs.instrument = ?')
+            arguments.append(instrument)
+        if samplingFrequency is not None:
+            if isinstance(samplingFrequency, tuple):
+                conditions.append('runs.samplingFrequency BETWEEN ? AND ?')
+                arguments.extend(samplingFrequency)
+            else:
+                # Relative tolerance for floating point values
+                conditions.append('ABS(runs.samplingFrequency - ?) <= 1e-9 * ABS(?)')
+                arguments.extend([samplingFrequency, samplingFrequency])
+        for name, value in parameters.items():
+            section, key = name.split('/', 1)
+            if isinstance(value, tuple):
+                condition = 'numberValue BETWEEN ? AND ?'
+                values = list(value)
+            elif isinstance(value, (bool, int, float)):
+                condition = 'ABS(numberValue - ?) <= 1e-9 * ABS(?)'
+                values = [float(value), float(value)]
+            else:
+                condition = 'textValue = ?'
+                values = [value]
+            conditions.append('runs.id IN (SELECT run FROM parameters WHERE section = ? AND key = ? AND {})'.format(condition))
+            arguments.extend([section, key] + values)
+
+        sql = 'SELECT path, timestamp, experimentType FROM runs'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY timestamp'
+        return [RunHandle(*row) for row in self.connection.execute(sql, arguments)]
+
+def registerRun(generalSettings, filename, experimentType='data'):
+    """Adds a saved measurement to the catalog given by 'Catalog_File' in the general settings (incremental indexing on save).
+
+    Args:
+        generalSettings (dict): General settings.
+        filename (str): Path and filename of the JSON file.
+        experimentType (str, optional): 'TF', 'CT' or 'data'. Defaults to 'data'.
+    """    
+    try:
+        catalog = MeasurementCatalog(generalSettings['Catalog_File'])
+        catalog.addRun(filename, experimentType)
+        catalog.close()
+    except sqlite3.Error as e:
+        print('Catalog: {} not indexed ({})'.format(filename, e))
+
+
+if __name__ == '__main__':
+    # Rescan: python -m QuPE.Catalog catalog.db --data data --tf TF --ct CT
+    parser = argparse.ArgumentParser(description='Indexes saved measurements in a SQLite catalog.')
+    parser.add_argument('database', help='SQLite database')
+    parser.add_argument('--data', nargs='*', default=[], help='Data folders')
+    parser.add_argument('--tf', nargs='*', default=[], help='Transfer function folders')
+    parser.add_argument('--ct', nargs='*', default=[], help='Crosstalk folders')
+    args = parser.parse_args()
+    catalog = MeasurementCatalog(args.database)
+    for folders, experimentType in [(args.data, 'data'), (args.tf, 'TF'), (args.ct, 'CT')]:
+        if len(folders) > 0:
+            print('{}: {} runs indexed'.format(experimentType, catalog.rescan(folders, experimentType)))
+    catalog.close()
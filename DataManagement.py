@@ -1,8 +1,16 @@
 # Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
 
+import atexit
+import hashlib
 import json
 import os
+import queue
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 
 def saveData(generalSettings, scheme, comment, additionalInformation, data, experimentType='data'):
@@ -16,26 +24,28 @@ def saveData(generalSettings, scheme, comment, additionalInformation, data, expe
         data (dict): Measurement data.
         experimentType (str, optional): 'TF': Transfer function data. 'CT': Crosstalk data. 'Data': Experimental data. Defaults to 'data'.
 
+    Note:
+        With 'Data_Format': 'binary' in the general settings the data is saved with a DataStore (binary arrays and JSON sidecar).
+        With 'Catalog_File' in the general settings the measurement is added to the catalog (see MeasurementCatalog).
+
     Returns:
         str: Path and filename of the saved JSON file.
     """    
-    currentDate = time.strftime('%Y-%m-%d', time.localtime())
+    if 'Data_Format' in generalSettings and generalSettings['Data_Format'] == 'binary':
+        store = DataStore(generalSettings, scheme, comment, additionalInformation, experimentType)
+        store.write(data)
+        store.close()
+        return store.filename
 
-    if experimentType == 'TF':
-        folder = os.path.join(generalSettings['TF_Folder'], currentDate)
-    elif experimentType == 'CT':
-        folder = os.path.join(generalSettings['CT_Folder'], currentDate)
-    else:
-        folder = os.path.join(generalSettings['Data_Folder'], currentDate)
-        
-    if not os.path.exists(folder):
-        os.mkdir(folder)
-        
-    filename = os.path.join(folder, '{}.json'.format(time.strftime('%H-%M-%S', time.localtime())))
+    folder = getDataFolder(generalSettings, experimentType)
+    filename = reserveRunFilename(folder)
     timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-    d = {'Timestamp': timestamp,'GeneralSettings': generalSettings,  'Scheme': scheme, 'Comment': comment, 'additionalInformation': additionalInformation, 'Data': data}
-    with open(filename, 'w', encoding ='utf8') as json_file:
-        json.dump(d, json_file, allow_nan=True, indent=4)
+    d = {'Timestamp': timestamp, 'RunID': os.path.splitext(os.path.basename(filename))[0], 'GeneralSettings': generalSettings,  'Scheme': scheme, 'Comment': comment, 
+        'additionalInformation': additionalInformation, 'Data': data, 'Checksum': calculateChecksum(data)}
+    writeJSONAtomic(filename, d)
+    if 'Catalog_File' in generalSettings:
+        from .Catalog import registerRun
+        registerRun(generalSettings, filename, experimentType)
 
     return filename
 
@@ -52,5 +62,660 @@ def loadData(path, filename):
     file = '{}.json'.format(os.path.join(path, filename))
     with open(file) as json_file:
         data = json.load(json_file)
+
+    # Arrays of a DataStore are memory-mapped
+    if 'DataFiles' in data:
+        for key, entry in data['DataFiles'].items():
+            data['Data'][key] = loadDataFile(os.path.dirname(file), entry)
     
-    return data
\ No newline at end of file
+    return data
+
+def calculateChecksum(data):
+    """Calculates a SHA-256 checksum of measurement data (canonical JSON representation).
+
+    Args:
+        data (dict): Measurement data.
+
+    Returns:
+        str: Checksum (hexadecimal).
+    """    
+    return hashlib.sha256(json.dumps(data, sort_keys=True, allow_nan=True).encode()).hexdigest()
+
+def calculateFileChecksum(filename):
+    """Calculates a SHA-256 checksum of a file.
+
+    Args:
+        filename (str): Path and filename.
+
+    Returns:
+        str: Checksum (hexadecimal).
+    """    
+    checksum = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+def verifyData(path, filename):
+    """Verifies the checksums of a saved measurement.
+
+    Args:
+        path (str): Path of the file.
+        filename (str): Filename without file extension.
+
+    Returns:
+        bool: True if all checksums match. None if the measurement has no checksums (saved by an older version).
+    """    
+    file = '{}.json'.format(os.path.join(path, filename))
+    with open(file) as json_file:
+        measurement = json.load(json_file)
+    if 'DataFiles' in measurement:
+        entries = measurement['DataFiles'].values()
+        if not all('checksum' in entry for entry in entries):
+            return None
+        return all(calculateFileChecksum(os.path.join(path, entry['file'])) == entry['checksum'] for entry in entries)
+    if 'Checksum' not in measurement:
+        return None
+    return calculateChecksum(measurement['Data']) == measurement['Checksum']
+
+def writeJSONAtomic(filename, content, indent=4):
+    """Writes a JSON file to a temporary file first and renames it afterwards, so that the file is never partially written.
+
+    Args:
+        filename (str): Path and filename.
+        content (dict): Content.
+        indent (int, optional): Indentation. Defaults to 4.
+    """    
+    tmpFilename = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmpFilename, 'w', encoding ='utf8') as json_file:
+        json.dump(content, json_file, allow_nan=True, indent=indent)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(tmpFilename, filename)
+
+def reserveRunFilename(folder):
+    """Reserves a unique filename for a run: The time (HH-MM-SS) followed by a sequence number if several runs are saved within one second (HH-MM-SS-1, ...).
+    The file is created exclusively, so that parallel runs never get the same name.
+
+    Args:
+        folder (str): Folder.
+
+    Returns:
+        str: Path and filename of the (empty) JSON file.
+    """    
+    name = time.strftime('%H-%M-%S', time.localtime())
+    sequence = 0
+    while True:
+        runID = name if sequence == 0 else '{}-{}'.format(name, sequence)
+        filename = os.path.join(folder, '{}.json'.format(runID))
+        try:
+            with open(filename, 'x'):
+                pass
+            return filename
+        except FileExistsError:
+            sequence += 1
+
+def getDataFolder(generalSettings, experimentType='data'):
+    """Returns the folder of the current day for the experiment type and creates it if necessary.
+
+    Args:
+        generalSettings (dict): Generel settings.
+        experimentType (str, optional): 'TF': Transfer function data. 'CT': Crosstalk data. 'Data': Experimental data. Defaults to 'data'.
+
+    Returns:
+        str: Folder.
+    """    
+    currentDate = time.strftime('%Y-%m-%d', time.localtime())
+    if experimentType == 'TF':
+        folder = os.path.join(generalSettings['TF_Folder'], currentDate)
+    elif experimentType == 'CT':
+        folder = os.path.join(generalSettings['CT_Folder'], currentDate)
+    else:
+        folder = os.path.join(generalSettings['Data_Folder'], currentDate)
+
+    os.makedirs(folder, exist_ok=True)
+
+    return folder
+
+def loadDataFile(folder, entry):
+    """Loads an array of a DataStore. Uncompressed arrays are memory-mapped.
+
+    Args:
+        folder (str): Folder of the JSON sidecar.
+        entry (dict): Description of the array in the JSON sidecar ('file', 'dtype', 'shape', 'rows').
+
+    Returns:
+        ndarray: Array (read-only memory map for uncompressed arrays).
+    """    
+    file = os.path.join(folder, entry['file'])
+    if file.endswith('.npz'):
+        with np.load(file) as arrays:
+            return arrays['data']
+    shape = (entry['rows'],) + tuple(entry['shape'])
+    if entry['rows'] == 0:
+        return np.zeros(shape, dtype=entry['dtype'])
+    return np.memmap(file, dtype=entry['dtype'], mode='r', shape=shape)
+
+
+class DataStore():
+    def __init__(self, generalSettings, scheme, comment, additionalInformation, experimentType='data', compression=None, filename=None):
+        """Append-oriented storage of measurement data: Arrays are written in their native data type as binary files (one file per quantity)
+        and the settings are stored in a JSON sidecar, which replaces the JSON file of saveData (same folder and filename).
+        Data of each sweep step can be appended as soon as it is measured, so a crash does not lose the completed steps.
+
+        Args:
+            generalSettings (dict): Generel settings.
+            scheme (dict): Pump-Probe or RF measurement scheme.
+            comment (dict): Comments.
+            additionalInformation (dict): Additional information.
+            experimentType (str, optional): 'TF': Transfer function data. 'CT': Crosstalk data. 'Data': Experimental data. Defaults to 'data'.
+            compression (bool, optional): True: The arrays are compressed (npz) when the store is closed and are no longer memory-mapped on read. 
+                                          Defaults to None: Value of 'Data_Compression' in the general settings (False if missing).
+            filename (str, optional): JSON sidecar of an unfinished store, which is continued (e.g. resumed measurement, see truncate). 
+                                      Defaults to None: New store.
+        """        
+        if compression is None:
+            compression = 'Data_Compression' in generalSettings and generalSettings['Data_Compression']
+        self.compression = compression
+        self.experimentType = experimentType
+        if filename is not None:
+            with open(filename) as json_file:
+                self.sidecar = json.load(json_file)
+            if 'Checksum' in self.sidecar:
+                raise Exception('Data store {} is already finished.'.format(filename))
+            self.filename = filename
+            self.folder = os.path.join(os.path.dirname(filename), self.sidecar['RunID'])
+            return
+        folder = getDataFolder(generalSettings, experimentType)
+        self.filename = reserveRunFilename(folder)
+        runID = os.path.splitext(os.path.basename(self.filename))[0]
+        self.folder = os.path.join(folder, runID)
+        os.makedirs(self.folder, exist_ok=True)
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+        self.sidecar = {'Timestamp': timestamp, 'RunID': runID, 'GeneralSettings': generalSettings, 'Scheme': scheme, 'Comment': comment, 
+                        'additionalInformation': additionalInformation, 'Data': {}, 'DataFiles': {}}
+        self.writeSidecar()
+
+    def writeSidecar(self):
+        """Writes the JSON sidecar. The file is replaced atomically.
+        """        
+        writeJSONAtomic(self.filename, self.sidecar)
+
+    def getFilename(self, key):
+        """Returns the name of the binary file of a quantity.
+
+        Args:
+            key (str): Name of the quantity, e.g. 'LockIn Signal (V)'.
+
+        Returns:
+            str: Filename relative to the folder of the JSON sidecar.
+        """        
+        name = ''.join(c if c.isalnum() else '_' for c in key).strip('_')
+        return '{}/{}.bin'.format(os.path.basename(self.folder), name)
+
+    def append(self, data, updateSidecar=True):
+        """Appends one row (e.g. one sweep step) to each quantity. The shape of a row is fixed by the first row.
+
+        Args:
+            data (dict): Values of the row for each quantity (scalars or arrays).
+            updateSidecar (bool, optional): False: The JSON sidecar is not written (e.g. several rows are appended at once, see AsyncWriter). Defaults to True.
+        """        
+        for key in data:
+            value = np.asarray(data[key])
+            if key not in self.sidecar['DataFiles']:
+                self.sidecar['DataFiles'][key] = {'file': self.getFilename(key), 'dtype': value.dtype.str, 'shape': list(value.shape), 'rows': 0}
+            entry = self.sidecar['DataFiles'][key]
+            if list(value.shape) != entry['shape']:
+                raise Exception('Shape {} of {} does not match shape {} of previous rows.'.format(list(value.shape), key, entry['shape']))
+            with open(os.path.join(os.path.dirname(self.filename), entry['file']), 'ab') as file:
+                file.write(np.ascontiguousarray(value, dtype=entry['dtype']).tobytes())
+            entry['rows'] += 1
+        if updateSidecar:
+            self.writeSidecar()
+
+    def getNumberRows(self):
+        """Returns the number of rows, which were appended to all quantities.
+
+        Returns:
+            int: Number of rows.
+        """        
+        if len(self.sidecar['DataFiles']) == 0:
+            return 0
+        return min(entry['rows'] for entry in self.sidecar['DataFiles'].values())
+
+    def truncate(self, rows):
+        """Removes the rows after the given row, e.g. rows of an interrupted measurement which were not checkpointed. 
+        Bytes of a row which was written without update of the JSON sidecar are also removed.
+
+        Args:
+            rows (int): Number of rows to keep.
+        """        
+        for entry in self.sidecar['DataFiles'].values():
+            entry['rows'] = min(entry['rows'], rows)
+            size = entry['rows'] * np.dtype(entry['dtype']).itemsize * int(np.prod(entry['shape']))
+            with open(os.path.join(os.path.dirname(self.filename), entry['file']), 'r+b') as file:
+                file.truncate(size)
+        self.writeSidecar()
+
+    def write(self, data):
+        """Writes complete quantities. Data which cannot be converted to a regular array (e.g. nested lists of different length) is stored in the JSON sidecar.
+
+        Args:
+            data (dict): Measurement data.
+        """        
+        for key in data:
+            try:
+                value = np.asarray(data[key]) if not isinstance(data[key], (str, dict)) else None
+            except ValueError:
+                value = None
+            if value is None or value.dtype.kind not in 'biuf' or value.ndim == 0:
+                self.sidecar['Data'][key] = data[key]
+                continue
+            entry = {'file': self.getFilename(key), 'dtype': value.dtype.str, 'shape': list(value.shape[1:]), 'rows': value.shape[0]}
+            with open(os.path.join(os.path.dirname(self.filename), entry['file']), 'wb') as file:
+                file.write(np.ascontiguousarray(value).tobytes())
+            self.sidecar['DataFiles'][key] = entry
+        self.writeSidecar()
+
+    def updateAdditionalInformation(self, additionalInformation):
+        """Updates the additional information in the JSON sidecar.
+
+        Args:
+            additionalInformation (dict): Additional information.
+        """        
+        self.sidecar['additionalInformation'].update(additionalInformation)
+        self.writeSidecar()
+
+    def close(self):
+        """Finishes the store. With compression the binary files are converted to compressed npz files. The checksums of all files are added to the JSON sidecar.
+        """        
+        if self.compression:
+            for key, entry in self.sidecar['DataFiles'].items():
+                if not entry['file'].endswith('.bin'):
+                    continue
+                folder = os.path.dirname(self.filename)
+                array = np.fromfile(os.path.join(folder, entry['file']), dtype=entry['dtype']).reshape([entry['rows']] + entry['shape'])
+                compressedFile = '{}.npz'.format(os.path.splitext(entry['file'])[0])
+                np.savez_compressed(os.path.join(folder, compressedFile), data=array)
+                os.remove(os.path.join(folder, entry['file']))
+                entry['file'] = compressedFile
+        for entry in self.sidecar['DataFiles'].values():
+            entry['checksum'] = calculateFileChecksum(os.path.join(os.path.dirname(self.filename), entry['file']))
+        self.sidecar['Checksum'] = calculateChecksum(self.sidecar['Data'])
+        self.writeSidecar()
+        if 'Catalog_File' in self.sidecar['GeneralSettings']:
+            from .Catalog import registerRun
+            registerRun(self.sidecar['GeneralSettings'], self.filename, self.experimentType)
+
+
+class AsyncWriter():
+    def __init__(self, store=None, maxQueueSize=64, batchSize=16):
+        """Writes measurement data on a background thread, so that saving does not block the acquisition.
+        Rows for a DataStore and arbitrary save functions are put into a bounded queue. If the disk falls behind and the queue is full, 
+        the measurement waits (back-pressure) instead of consuming more and more memory. Rows are written in batches with one update of the JSON sidecar.
+        A failed record is reported by the next put, flush or close (see raiseError) and does not stop the following records.
+
+        Args:
+            store (DataStore, optional): Store for the rows (see append). Defaults to None.
+            maxQueueSize (int, optional): Maximum number of queued records. Defaults to 64.
+            batchSize (int, optional): Maximum number of records written at once. Defaults to 16.
+        """        
+        self.store = store
+        self.batchSize = batchSize
+        self.queue = queue.Queue(maxQueueSize)
+        self.error = None
+        self.closed = False
+        self.backPressure = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Flush also on exceptions, but do not hide them
+        try:
+            self.close()
+        except Exception as e:
+            if exc_type is None:
+                raise e
+
+    def put(self, record, block=True):
+        """Puts a record into the queue. Blocks if the queue is full.
+
+        Args:
+            record (tuple): Type of record and content.
+            block (bool, optional): False: Raises queue.Full instead of waiting if the queue is full. Defaults to True.
+        """        
+        if self.closed:
+            raise Exception('AsyncWriter is closed.')
+        self.raiseError()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if not block:
+                raise
+            if not self.backPressure:
+                print('AsyncWriter: Queue full, waiting for disk.')
+                self.backPressure = True
+            self.queue.put(record)
+
+    def append(self, data):
+        """Appends one row to the store (see DataStore.append). The values are copied, so that the arrays can be reused by the measurement.
+
+        Args:
+            data (dict): Values of the row for each quantity.
+        """        
+        self.put(('row', {key: np.array(data[key]) for key in data}))
+
+    def submit(self, function, *args, block=True):
+        """Calls a function on the background thread, e.g. saveRawTraces.
+
+        Args:
+            function (callable): Function.
+            *args: Arguments of the function.
+            block (bool, optional): False: Raises queue.Full instead of waiting if the queue is full. Defaults to True.
+        """        
+        self.put(('call', (function, args)), block)
+
+    def run(self):
+        """Worker loop of the background thread.
+        """        
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            rows = False
+            # A failed record does not stop the following records of the batch
+            for kind, content in batch:
+                try:
+                    if kind == 'row':
+                        self.store.append(content, updateSidecar=False)
+                        rows = True
+                    elif kind == 'call':
+                        content[0](*content[1])
+                    elif kind == 'stop':
+                        stop = True
+                except Exception as e:
+                    self.setError(e)
+            if rows:
+                try:
+                    self.store.writeSidecar()
+                except Exception as e:
+                    self.setError(e)
+            for _ in batch:
+                self.queue.task_done()
+            if stop:
+                break
+
+    def setError(self, error):
+        """Stores an error of the background thread. Only the first error is kept until it is reported (see raiseError).
+
+        Args:
+            error (Exception): Error.
+        """        
+        print('AsyncWriter: {}'.format(error))
+        if self.error is None:
+            self.error = error
+
+    def raiseError(self):
+        """Reports a stored error of the background thread once. The writer can be used again afterwards.
+
+        Raises:
+            Exception: Error of the background thread.
+        """        
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise Exception('AsyncWriter failed: {}'.format(error))
+
+    def flush(self):
+        """Waits until all queued records are written.
+        """        
+        self.queue.join()
+        self.raiseError()
+
+    def close(self, finishStore=True):
+        """Writes all queued records, stops the background thread and closes the store.
+
+        Args:
+            finishStore (bool, optional): False: The store is not finished (see DataStore.close) and can be continued later (e.g. interrupted measurement with checkpoint). 
+                                          Defaults to True.
+        """        
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(('stop', None))
+        self.thread.join()
+        atexit.unregister(self.close)
+        if self.store is not None and finishStore:
+            self.store.close()
+        self.raiseError()
+
+backgroundWriter = None
+
+def getBackgroundWriter():
+    """Returns the shared writer for save functions running in the background (see AsyncWriter.submit).
+
+    Returns:
+        AsyncWriter: Shared writer.
+    """    
+    global backgroundWriter
+    if backgroundWriter is None or backgroundWriter.closed:
+        backgroundWriter = AsyncWriter()
+    return backgroundWriter
+
+def flushBackgroundWriter():
+    """Waits until the shared writer has written all queued records (if it was started).
+    """    
+    if backgroundWriter is not None and not backgroundWriter.closed:
+        backgroundWriter.flush()
+
+def saveRawTraces(filename, traces, samplingRate, channels, additionalArrays={}):
+    """Saves raw DAQ traces as binary file (NumPy .npz, float32) next to the JSON file of the measurement.
+
+    Args:
+        filename (str): Path and filename of the JSON file (see saveData).
+        traces (list): Traces of the individual sweep steps or list parts. Each trace is an array of shape (number of channels, number of samples).
+        samplingRate (float): Sampling rate in samples per second.
+        channels (list): Names of the recorded channels.
+        additionalArrays (dict, optional): Further arrays needed for the evaluation (e.g. frequency list). Defaults to {}.
+
+    Returns:
+        str: Path and filename of the saved binary file.
+    """    
+    traces = [np.reshape(np.asarray(trace, dtype=np.float32), (len(channels), -1)) for trace in traces]
+    offsets = np.cumsum([0] + [trace.shape[1] for trace in traces])
+    if len(traces) > 0:
+        data = np.concatenate(traces, axis=1)
+    else:
+        data = np.zeros((len(channels), 0), dtype=np.float32)
+    rawFilename = '{}_raw.npz'.format(os.path.splitext(filename)[0])
+    arrays = {'data': data, 'offsets': offsets, 'samplingRate': samplingRate, 'channels': np.array(channels)}
+    for key in additionalArrays:
+        arrays['additional_{}'.format(key)] = np.asarray(additionalArrays[key])
+    tmpFilename = '{}.{}.tmp'.format(rawFilename, os.getpid())
+    with open(tmpFilename, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tmpFilename, rawFilename)
+
+    return rawFilename
+
+def loadRawTraces(path, filename):
+    """Loads raw DAQ traces saved by saveRawTraces.
+
+    Args:
+        path (str): Path of the file.
+        filename (str): Filename of the measurement without file extension.
+
+    Returns:
+        list, float, list, dict: Traces of the individual sweep steps or list parts, Sampling rate in samples per second, Names of the channels, Additional arrays.
+    """    
+    # Raw traces of a recent measurement may still be written in the background
+    flushBackgroundWriter()
+    file = '{}_raw.npz'.format(os.path.join(path, filename))
+    with np.load(file) as raw:
+        data = raw['data'].astype(np.float64)
+        offsets = raw['offsets']
+        traces = [data[:, offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]
+        additionalArrays = {key[len('additional_'):]: raw[key] for key in raw.files if key.startswith('additional_')}
+        return traces, float(raw['samplingRate']), raw['channels'].tolist(), additionalArrays
+
+# Runs loaded in this session (least recently used first, see loadRuns)
+runCache = OrderedDict()
+# Maximum number of runs in the memory cache
+maxCachedRuns = 256
+
+def parseRun(filename, cacheFolder=None):
+    """Parses a saved measurement for the bulk loader (see loadRuns). Regular arrays of JSON files are converted to NumPy arrays.
+    With a cache folder the arrays are stored as .npy files and only the metadata is returned, so the arrays can be memory-mapped later.
+    Parsed runs in the cache folder are reused as long as the modification time of the file is unchanged.
+
+    Args:
+        filename (str): Path and filename of the JSON file.
+        cacheFolder (str, optional): Folder for parsed runs. Defaults to None: No cache on disk.
+
+    Returns:
+        dict: Parsed measurement: Metadata, 'Data' (arrays or irregular data), 'DataFiles' (DataStore arrays), 'CacheFiles' (cached arrays).
+    """    
+    filename = os.path.abspath(filename)
+    if cacheFolder is not None:
+        key = '{}_{}'.format(hashlib.sha1(filename.encode()).hexdigest()[:16], os.stat(filename).st_mtime_ns)
+        cacheRun = os.path.join(cacheFolder, key)
+        if os.path.exists(os.path.join(cacheRun, 'metadata.json')):
+            with open(os.path.join(cacheRun, 'metadata.json')) as json_file:
+                return json.load(json_file)
+
+    with open(filename) as json_file:
+        measurement = json.load(json_file)
+    measurement['Path'] = filename
+    measurement['CacheFiles'] = {}
+    if 'DataFiles' not in measurement:
+        measurement['DataFiles'] = {}
+    data = measurement['Data']
+    for name in list(data):
+        try:
+            array = np.asarray(data[name])
+        except ValueError:
+            continue
+        if array.dtype.kind in 'biuf' and array.ndim > 0:
+            data[name] = array
+
+    if cacheFolder is not None:
+        os.makedirs(cacheRun, exist_ok=True)
+        for i, name in enumerate(list(data)):
+            if isinstance(data[name], np.ndarray):
+                np.save(os.path.join(cacheRun, '{}.npy'.format(i)), data.pop(name))
+                measurement['CacheFiles'][name] = os.path.join(cacheRun, '{}.npy'.format(i))
+        tmpFilename = os.path.join(cacheRun, 'metadata.json.tmp')
+        with open(tmpFilename, 'w', encoding ='utf8') as json_file:
+            json.dump(measurement, json_file, allow_nan=True)
+        os.replace(tmpFilename, os.path.join(cacheRun, 'metadata.json'))
+    return measurement
+
+
+class LazyRun():
+    def __init__(self, measurement):
+        """Saved measurement with metadata and lazily loaded data arrays (see loadRuns).
+
+        Args:
+            measurement (dict): Parsed measurement (see parseRun).
+        """        
+        self.path = measurement['Path']
+        self.timestamp = measurement['Timestamp']
+        self.generalSettings = measurement['GeneralSettings']
+        self.scheme = measurement['Scheme']
+        self.comment = measurement['Comment']
+        self.additionalInformation = measurement['additionalInformation']
+        self.data = measurement['Data']
+        self.dataFiles = measurement['DataFiles']
+        self.cacheFiles = measurement['CacheFiles']
+
+    def getKeys(self):
+        """Returns the names of all quantities.
+
+        Returns:
+            list: Names of the quantities.
+        """        
+        return list(self.data) + list(self.dataFiles) + list(self.cacheFiles)
+
+    def getData(self, key):
+        """Returns a quantity. Arrays of a DataStore and cached arrays are memory-mapped.
+
+        Args:
+            key (str): Name of the quantity, e.g. 'LockIn Signal (V)'.
+
+        Returns:
+            ndarray: Data.
+        """        
+        if key not in self.data:
+            if key in self.dataFiles:
+                self.data[key] = loadDataFile(os.path.dirname(self.path), self.dataFiles[key])
+            elif key in self.cacheFiles:
+                self.data[key] = np.load(self.cacheFiles[key], mmap_mode='r')
+        return self.data[key]
+
+def loadRuns(filenames, processes=None, cacheFolder=None):
+    """Loads many saved measurements in parallel on a process pool. Runs which were already loaded in this session are 
+    taken from the memory cache as long as the modification time of the file is unchanged. The cache keeps the maxCachedRuns most recently loaded runs.
+
+    Args:
+        filenames (list): Paths and filenames of the JSON files.
+        processes (int, optional): Number of processes. Defaults to None: Number of processors. 1: No process pool.
+        cacheFolder (str, optional): Folder for parsed runs, which allows memory-mapping of the arrays (see parseRun). Defaults to None.
+
+    Returns:
+        list: LazyRuns in the order of the filenames.
+    """    
+    filenames = [os.path.abspath(filename) for filename in filenames]
+    mtimes = [os.stat(filename).st_mtime_ns for filename in filenames]
+    missing = [(filename, mtime) for filename, mtime in zip(filenames, mtimes) if filename not in runCache or runCache[filename][0] != mtime]
+    if len(missing) > 0:
+        missing, missingMtimes = zip(*missing)
+        if processes == 1 or len(missing) == 1:
+            parsed = [parseRun(filename, cacheFolder) for filename in missing]
+        else:
+            with ProcessPoolExecutor(processes) as executor:
+                parsed = list(executor.map(parseRun, missing, [cacheFolder] * len(missing), chunksize=max(1, len(missing) // 64)))
+        for filename, mtime, measurement in zip(missing, missingMtimes, parsed):
+            runCache[filename] = (mtime, LazyRun(measurement))
+
+    runs = []
+    for filename in filenames:
+        runs.append(runCache[filename][1])
+        runCache.move_to_end(filename)
+    # Remove the least recently used runs
+    while len(runCache) > maxCachedRuns:
+        runCache.popitem(last=False)
+    return runs
+
+def stackRuns(runs, key, axisKey=None):
+    """Stacks a quantity of several runs (e.g. sweeps) into one 2-D array. Runs of different length are padded with NaN.
+
+    Args:
+        runs (list): LazyRuns (see loadRuns).
+        key (str): Name of the quantity, e.g. 'LockIn Signal (V)'.
+        axisKey (str, optional): Name of the sweep axis, e.g. 'Frequency (Hz)'. Rows with a different axis than the first run are interpolated onto it. Defaults to None.
+
+    Returns:
+        ndarray, ndarray: Sweep axis of the first run (None without axisKey), Stacked data (runs x points).
+    """    
+    numberPoints = max([len(run.getData(key)) for run in runs] + [0])
+    stacked = np.full((len(runs), numberPoints), np.nan)
+    axis = None
+    if axisKey is not None and len(runs) > 0:
+        axis = np.asarray(runs[0].getData(axisKey), dtype=np.float64)
+    for i, run in enumerate(runs):
+        values = np.asarray(run.getData(key), dtype=np.float64)
+        if axis is not None and i > 0:
+            runAxis = np.asarray(run.getData(axisKey), dtype=np.float64)
+            if len(runAxis) != len(axis) or not np.allclose(runAxis, axis):
+                order = np.argsort(runAxis)
+                values = np.interp(axis, runAxis[order], values[order], left=np.nan, right=np.nan)
+        stacked[i, :len(values)] = values
+    return axis, stacked
@@ -0,0 +1,203 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import argparse
+import json
+import os
+import time
+import traceback
+
+from .DataManagement import flushBackgroundWriter, writeJSONAtomic
+from .M8190 import M8190A
+from .PumpProbe import measurePumpProbe
+from .RF import (measureConstantAmplitudeSweep, measureCrosstalkMap, measureCrosstalkSignal, measureFrequencySweep, measurePowerSweep,
+                measureTransferFunction)
+from .Schemes import compileScheme
+from .SMB100B import SMB100B
+from .Sessions import InstrumentSessions
+
+# Measurement functions of the job types
+jobTypes = {'pumpProbe': measurePumpProbe, 'powerSweep': measurePowerSweep, 'frequencySweep': measureFrequencySweep,
+            'constantAmplitudeSweep': measureConstantAmplitudeSweep, 'crosstalk': measureCrosstalkSignal, 'crosstalkMap': measureCrosstalkMap,
+            'transferFunction': measureTransferFunction}
+
+
+def loadJob(filename, generalSettings={}):
+    """Loads a job file. A job file is a JSON file with the entries 'Type' (see jobTypes), 'Scheme', optionally 'GeneralSettings', 'Comment'
+    and 'Arguments' (further arguments of the measurement function, e.g. {'acquisitionTime': 2, 'settlingTime': 2}).
+
+    Args:
+        filename (str): Path and filename of the job file.
+        generalSettings (dict, optional): General settings, which are overwritten by the general settings of the job file. Defaults to {}.
+
+    Raises:
+        Exception: Unknown job type.
+        Exception: Invalid settings or scheme (see compileScheme).
+
+    Returns:
+        dict: Job.
+    """    
+    with open(filename) as json_file:
+        content = json.load(json_file)
+    if content['Type'] not in jobTypes:
+        raise Exception('Unknown job type {} in {}.'.format(content['Type'], filename))
+    settings = dict(generalSettings)
+    if 'GeneralSettings' in content:
+        settings.update(content['GeneralSettings'])
+    arguments = content['Arguments'] if 'Arguments' in content else {}
+    # Validate the job before it is queued
+    compiled = compileScheme(content['Type'], settings, content['Scheme'], **arguments)
+    compiled.printPlan()
+    job = {'File': os.path.abspath(filename), 'Type': content['Type'], 'GeneralSettings': settings, 'Scheme': content['Scheme'],
+           'Comment': content['Comment'] if 'Comment' in content else {}, 'Arguments': arguments, 'Hash': compiled.getHash(),
+           'Estimated Time (s)': compiled.getEstimatedTime(), 'Status': 'pending', 'Attempts': 0}
+    return job
+
+
+class JobQueue():
+    def __init__(self, stateFile):
+        """Queue of measurements, which are executed one after another with shared instrument sessions (see InstrumentSessions).
+        The state of the queue is saved in a JSON file after every change. Each job is saved with its general settings and scheme when it is added,
+        so that a resumed job uses the same calibration files and segment parameters. Pump-probe jobs are checkpointed after every sweep step
+        and resume after the last completed step (see measurePumpProbe). Transfer function jobs are checkpointed after the power sweep and after every iteration 
+        and resume after the last completed iteration (see measureTransferFunction). All other jobs (power, frequency and constant amplitude sweeps, 
+        crosstalk and crosstalk map calibrations, which can consist of several sweeps) are measured again from the beginning.
+
+        Args:
+            stateFile (str): Path and filename of the state file. An existing state file is continued.
+        """    
+        self.stateFile = os.path.abspath(stateFile)
+        if os.path.exists(self.stateFile):
+            with open(self.stateFile) as json_file:
+                self.jobs = json.load(json_file)['Jobs']
+        else:
+            self.jobs = []
+
+    def saveState(self):
+        """Saves the state of the queue.
+        """    
+        writeJSONAtomic(self.stateFile, {'Jobs': self.jobs})
+
+    def addJob(self, filename, generalSettings={}):
+        """Adds a job file to the queue (see loadJob). A job file which is already in the queue is not added again.
+
+        Args:
+            filename (str): Path and filename of the job file.
+            generalSettings (dict, optional): Common general settings. Defaults to {}.
+
+        Returns:
+            int: Index of the job.
+        """    
+        path = os.path.abspath(filename)
+        for index, job in enumerate(self.jobs):
+            if job['File'] == path:
+                return index
+        self.jobs.append(loadJob(path, generalSettings))
+        self.saveState()
+        return len(self.jobs) - 1
+
+    def getCheckpointFile(self, index):
+        """Returns the checkpoint file of a job.
+
+        Args:
+            index (int): Index of the job.
+
+        Returns:
+            str: Path and filename.
+        """    
+        return '{}_job{}_checkpoint.json'.format(os.path.splitext(self.stateFile)[0], index)
+
+    def runJob(self, index):
+        """Executes one job. Pump-probe jobs are checkpointed after every sweep step, transfer function jobs after every iteration.
+
+        Args:
+            index (int): Index of the job.
+        """    
+        job = self.jobs[index]
+        arguments = dict(job['Arguments'])
+        if job['Type'] in ['pumpProbe', 'transferFunction']:
+            arguments['checkpoint'] = self.getCheckpointFile(index)
+        # Further positional arguments (e.g. acquisitionTime, settlingTime or calibrationValues) are given as keyword arguments
+        jobTypes[job['Type']](job['GeneralSettings'], job['Scheme'], comment=job['Comment'], **arguments)
+
+    def getInstruments(self, retryFailed=True):
+        """Returns the instruments used by the jobs which are not completed.
+
+        Args:
+            retryFailed (bool, optional): True: Failed jobs are included. Defaults to True.
+
+        Returns:
+            list: Instrument classes and VISA resource strings.
+        """    
+        instruments = []
+        for job in self.jobs:
+            if job['Status'] == 'done' or (job['Status'] == 'failed' and not retryFailed):
+                continue
+            if job['Type'] == 'pumpProbe':
+                instrument = (M8190A, job['GeneralSettings']['AWG_VisaResource'])
+            else:
+                instrument = (SMB100B, job['GeneralSettings']['SG_VisaResource'])
+            if instrument not in instruments:
+                instruments.append(instrument)
+        return instruments
+
+    def run(self, retryFailed=True):
+        """Executes all jobs which are not completed. An interrupted job ('running') is resumed. A failed job does not stop the queue.
+        The instruments of all jobs are connected concurrently at the beginning (see InstrumentSessions.connectAll).
+
+        Args:
+            retryFailed (bool, optional): True: Failed jobs are executed again. Defaults to True.
+
+        Returns:
+            list: Status of all jobs.
+        """    
+        with InstrumentSessions() as sessions:
+            # All instruments are connected concurrently before the first job
+            sessions.connectAll(self.getInstruments(retryFailed))
+            for index, job in enumerate(self.jobs):
+                if job['Status'] == 'done' or (job['Status'] == 'failed' and not retryFailed):
+                    continue
+                print('Job {}/{}: {} ({})'.format(index + 1, len(self.jobs), job['Type'], job['File']))
+                job['Status'] = 'running'
+                job['Attempts'] += 1
+                job['Started'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+                self.saveState()
+                try:
+                    self.runJob(index)
+                    job['Status'] = 'done'
+                    job['Error'] = None
+                except Exception as e:
+                    traceback.print_exc()
+                    job['Status'] = 'failed'
+                    job['Error'] = repr(e)
+                    # Connect again for the next job (e.g. after a dropped VISA link)
+                    sessions.close()
+                    sessions.activate()
+                # Errors of the background writer (e.g. plots, raw traces) do not fail the measurement
+                try:
+                    flushBackgroundWriter()
+                    job['Warning'] = None
+                except Exception as e:
+                    print('Job {}: {}'.format(index + 1, e))
+                    job['Warning'] = repr(e)
+                job['Finished'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+                self.saveState()
+        return [job['Status'] for job in self.jobs]
+
+
+if __name__ == '__main__':
+    # Run jobs: python -m QuPE.Jobs queue.json job1.json job2.json --settings settings.json
+    parser = argparse.ArgumentParser(description='Executes measurement jobs one after another. An interrupted queue is resumed with the same state file.')
+    parser.add_argument('state', help='State file of the queue (JSON)')
+    parser.add_argument('jobs', nargs='*', help='Job files (JSON)')
+    parser.add_argument('--settings', help='Common general settings (JSON)')
+    parser.add_argument('--no-retry', action='store_true', help='Failed jobs are not executed again')
+    args = parser.parse_args()
+    generalSettings = {}
+    if args.settings is not None:
+        with open(args.settings) as json_file:
+            generalSettings = json.load(json_file)
+    jobQueue = JobQueue(args.state)
+    for filename in args.jobs:
+        jobQueue.addJob(filename, generalSettings)
+    statuses = jobQueue.run(retryFailed=not args.no_retry)
+    print('{} of {} jobs done'.format(statuses.count('done'), len(statuses)))
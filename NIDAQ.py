@@ -4,6 +4,7 @@ import time
 
 import nidaqmx
 import numpy as np
+from nidaqmx.constants import AcquisitionType
 
 
 class NIDAQ():
@@ -27,6 +28,19 @@ class NIDAQ():
         """        
         return self.samplingRate
     
+    def addInputChannels(self, task, channel):
+        """Adds analog input channel(s) to a task.
+
+        Args:
+            task (nidaqmx.Task): DAQ task.
+            channel (str, list): Name of channel or list of channel names.
+        """        
+        if type(channel) is str:
+            task.ai_channels.add_ai_voltage_chan('{}/{}'.format(self.device, channel))
+        if type(channel) is list:
+            for ch in channel:
+                task.ai_channels.add_ai_voltage_chan('{}/{}'.format(self.device, ch))
+
     def readAnalog(self, channel, duration=None):
         """Reads sample(s) from channel(s).
 
@@ -38,11 +52,7 @@ class NIDAQ():
             ndarray: Samples requested in the form of a scalar, a list, or a list of lists.
         """
         with nidaqmx.Task() as task:
-            if type(channel) is str:
-                task.ai_channels.add_ai_voltage_chan('{}/{}'.format(self.device, channel))
-            if type(channel) is list:
-                for ch in channel:
-                    task.ai_channels.add_ai_voltage_chan('{}/{}'.format(self.device, ch))
+            self.addInputChannels(task, channel)
             task.timing.cfg_samp_clk_timing(self.samplingRate, samps_per_chan=1)
             if duration == None:
                 data = task.read()
@@ -52,6 +62,35 @@ class NIDAQ():
                 data = task.read(len(data), duration)
         return np.array(data)
     
+    def streamAnalog(self, channel, blockDuration, maxDuration=None):
+        """Continuously acquires samples from channel(s) and yields them block by block.
+        The acquisition runs without gaps between blocks and is stopped when the generator is closed.
+
+        Args:
+            channel (str, list): Name of channel or list of channel names.
+            blockDuration (float): Duration of one block in seconds.
+            maxDuration (float, optional): Total acquisition time in seconds. Defaults to None: Acquisition runs until the generator is closed.
+
+        Yields:
+            ndarray: Samples of one block in the form of a list or a list of lists.
+        """        
+        samplesPerBlock = max(1, int(self.samplingRate * blockDuration))
+        if maxDuration is None:
+            numberBlocks = None
+        else:
+            numberBlocks = max(1, int(np.ceil(maxDuration / blockDuration)))
+
+        with nidaqmx.Task() as task:
+            self.addInputChannels(task, channel)
+            # Buffer holds several blocks so that processing between reads does not overflow it
+            task.timing.cfg_samp_clk_timing(self.samplingRate, sample_mode=AcquisitionType.CONTINUOUS, samps_per_chan=10*samplesPerBlock)
+            task.start()
+            block = 0
+            while numberBlocks is None or block < numberBlocks:
+                data = task.read(samplesPerBlock, timeout=10*blockDuration + 1)
+                block += 1
+                yield np.array(data)
+
     def writeAnalog(self, channel, data):
         """Writes sample(s) to a channel.
 
@@ -0,0 +1,128 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import os
+import queue
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
+
+from .DataManagement import getBackgroundWriter, getDataFolder
+
+
+def drawSourcePower(figure, ax, frequency, power, powerMin, powerMax):
+    """Draws the source powers of a sweep at constant junction amplitude and the power limits of the SG.
+
+    Args:
+        figure (Figure): Figure.
+        ax (Axes): Axes.
+        frequency (ndarray): Frequencies in Hz.
+        power (ndarray): Source powers in dBm.
+        powerMin (float): Minimum power of the SG in dBm.
+        powerMax (float): Maximum power of the SG in dBm.
+    """    
+    ax.plot(frequency, power, '.')
+    ax.set_xlabel('Frequency (Hz)')
+    ax.set_ylabel('Source Power (dBm)')
+    ax.axhline(y = powerMin, color = 'black', linestyle = '--')
+    ax.axhline(y = powerMax, color = 'black', linestyle = '--')
+
+def drawCrosstalkCorrection(figure, ax, frequency, lockinSignal, crosstalkSignal):
+    """Draws the measured lock-in signal, the crosstalk corrected lock-in signal and the crosstalk signal.
+
+    Args:
+        figure (Figure): Figure.
+        ax (Axes): Axes.
+        frequency (ndarray): Frequencies in Hz.
+        lockinSignal (ndarray): Crosstalk corrected lock-in signal in V.
+        crosstalkSignal (ndarray): Crosstalk signal in V.
+    """    
+    ax.plot(frequency, lockinSignal + crosstalkSignal, '.')
+    ax.plot(frequency, lockinSignal, '.')
+    ax.plot(frequency, crosstalkSignal, '.', c='black')
+    ax.set_xlabel('Frequency (Hz)')
+    ax.set_ylabel('Lockin Signal (V)')
+
+def drawPolynomialFit(figure, ax, x, y, coeffPolyFit, xlabel, ylabel, xscale=1):
+    """Draws data points and a polynomial fit.
+
+    Args:
+        figure (Figure): Figure.
+        ax (Axes): Axes.
+        x (ndarray): x values.
+        y (ndarray): y values.
+        coeffPolyFit (ndarray): Coefficients of the polynomial (highest order first).
+        xlabel (str): Label of the x axis.
+        ylabel (str): Label of the y axis.
+        xscale (float, optional): The x values are divided by the scale for display. Defaults to 1.
+    """    
+    ax.plot(x / xscale, y, '.')
+    ax.plot(x / xscale, np.polyval(coeffPolyFit, x))
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+
+def drawCrosstalkMap(figure, ax, powers, frequencies, lockinSignalMap):
+    """Draws the lock-in signal of a crosstalk map.
+
+    Args:
+        figure (Figure): Figure.
+        ax (Axes): Axes.
+        powers (ndarray): Powers in dBm.
+        frequencies (ndarray): Frequencies in Hz.
+        lockinSignalMap (ndarray): Lock-in signal in V (frequencies x powers).
+    """    
+    mesh = ax.pcolormesh(powers, frequencies, lockinSignalMap, shading='nearest')
+    figure.colorbar(mesh, ax=ax, label='LockIn Signal (V)')
+    ax.set_xlabel('Power (dBm)')
+    ax.set_ylabel('Frequency (Hz)')
+
+def savePlot(filename, draw, args):
+    """Draws a figure without pyplot and saves it. Can be called from any thread (e.g. by the background writer).
+    Errors are only printed, so that a failed plot never stops a measurement.
+
+    Args:
+        filename (str): Path and filename of the image.
+        draw (callable): Draw function, e.g. drawSourcePower.
+        args (list): Arguments of the draw function (without figure and axes).
+    """    
+    try:
+        figure = Figure()
+        ax = figure.add_subplot()
+        draw(figure, ax, *args)
+        figure.savefig(filename)
+    except Exception as e:
+        print('Plot {} not saved ({})'.format(filename, e))
+
+def showPlot(generalSettings, name, draw, *args, experimentType='data'):
+    """Shows a figure during a measurement without blocking it. The mode is selected by 'Plot_Mode' in the general settings:
+    'interactive' (default): The figure is shown in a window and the measurement continues immediately.
+    'headless': The figure is saved as PNG file in the data folder by the background writer (see AsyncWriter.submit). If the writer is busy, the figure is dropped.
+    'none': No figure.
+
+    Args:
+        generalSettings (dict): General settings.
+        name (str): Name of the figure, used in the filename (HH-MM-SS_name.png).
+        draw (callable): Draw function, e.g. drawSourcePower.
+        *args: Arguments of the draw function (without figure and axes).
+        experimentType (str, optional): 'TF', 'CT' or 'data'. Selects the folder of the saved figure. Defaults to 'data'.
+    """    
+    mode = generalSettings['Plot_Mode'] if 'Plot_Mode' in generalSettings else 'interactive'
+    # Copy arrays, since the measurement may modify them before the figure is drawn
+    args = [np.array(arg) if isinstance(arg, np.ndarray) else arg for arg in args]
+    try:
+        if mode == 'headless':
+            filename = os.path.join(getDataFolder(generalSettings, experimentType), '{}_{}.png'.format(time.strftime('%H-%M-%S', time.localtime()), name))
+            try:
+                getBackgroundWriter().submit(savePlot, filename, draw, args, block=False)
+            except queue.Full:
+                print('Plot {} dropped (background writer busy)'.format(name))
+        elif mode == 'interactive':
+            figure = plt.figure()
+            draw(figure, figure.add_subplot(), *args)
+            plt.show(block=False)
+            plt.pause(0.001)
+        elif mode != 'none':
+            print('Unknown Plot_Mode: {}'.format(mode))
+    except Exception as e:
+        print('Plot {} failed ({})'.format(name, e))
@@ -0,0 +1,166 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import json
+import queue
+import socket
+import threading
+import time
+
+import numpy as np
+
+
+def encodeEvent(topic, event):
+    """Encodes an event as one line of JSON. Arrays and numpy numbers are converted to lists and numbers.
+
+    Args:
+        topic (str): Topic, e.g. 'pumpProbe'.
+        event (dict): Event.
+
+    Returns:
+        bytes: JSON line.
+    """    
+    message = {'topic': topic, 'time': time.time()}
+    message.update(event)
+    return (json.dumps(message, default=lambda value: np.asarray(value).tolist()) + '\n').encode('utf8')
+
+
+class ProgressPublisher():
+    def __init__(self, port=0, host='127.0.0.1', maxQueueSize=256):
+        """Publishes progress events of measurements to subscribers on a local TCP socket (one JSON object per line).
+        Publishing never blocks: Every subscriber has its own queue and events are dropped if the queue of a slow subscriber is full.
+
+        Args:
+            port (int, optional): TCP port. Defaults to 0: Free port (see getPort).
+            host (str, optional): Host address. Defaults to '127.0.0.1' (local connections only).
+            maxQueueSize (int, optional): Maximum number of queued events per subscriber. Defaults to 256.
+        """    
+        self.maxQueueSize = maxQueueSize
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.droppedEvents = 0
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.thread = threading.Thread(target=self.accept, name='ProgressPublisher', daemon=True)
+        self.thread.start()
+
+    def getPort(self):
+        """Returns the TCP port.
+
+        Returns:
+            int: Port.
+        """    
+        return self.server.getsockname()[1]
+
+    def accept(self):
+        """Accepts subscribers (background thread).
+        """    
+        while not self.closed:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                break
+            events = queue.Queue(self.maxQueueSize)
+            with self.lock:
+                self.subscribers.append(events)
+            threading.Thread(target=self.send, args=(connection, events), daemon=True).start()
+
+    def send(self, connection, events):
+        """Sends the queued events to one subscriber (background thread per subscriber).
+
+        Args:
+            connection (socket): Connection to the subscriber.
+            events (Queue): Queued events.
+        """    
+        try:
+            while True:
+                message = events.get()
+                if message is None:
+                    break
+                connection.sendall(message)
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                if events in self.subscribers:
+                    self.subscribers.remove(events)
+            connection.close()
+
+    def publish(self, topic, event):
+        """Publishes an event to all subscribers without blocking.
+
+        Args:
+            topic (str): Topic, e.g. 'pumpProbe'.
+            event (dict): Event.
+        """    
+        if self.closed:
+            return
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if len(subscribers) == 0:
+            return
+        message = encodeEvent(topic, event)
+        for events in subscribers:
+            try:
+                events.put_nowait(message)
+            except queue.Full:
+                self.droppedEvents += 1
+
+    def close(self):
+        """Disconnects all subscribers and closes the socket.
+        """    
+        self.closed = True
+        self.server.close()
+        with self.lock:
+            for events in self.subscribers:
+                try:
+                    events.put_nowait(None)
+                except queue.Full:
+                    # Discard pending events of a slow subscriber
+                    while not events.empty():
+                        events.get_nowait()
+                    events.put_nowait(None)
+
+def subscribe(port, host='127.0.0.1', topics=None):
+    """Subscribes to a ProgressPublisher and yields the received events, e.g. for a dashboard or logger.
+
+    Args:
+        port (int): TCP port of the publisher.
+        host (str, optional): Host address. Defaults to '127.0.0.1'.
+        topics (list, optional): Topics to be received. Defaults to None: All topics.
+
+    Yields:
+        dict: Event.
+    """    
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile('r', encoding='utf8') as stream:
+            for line in stream:
+                event = json.loads(line)
+                if topics is None or event['topic'] in topics:
+                    yield event
+
+publishers = {}
+
+def publishProgress(generalSettings, topic, event):
+    """Publishes a progress event if 'Progress_Port' is set in the general settings. The publisher of the port is started on the first event.
+
+    Args:
+        generalSettings (dict): General settings.
+        topic (str): Topic, e.g. 'pumpProbe'.
+        event (dict): Event.
+    """    
+    if 'Progress_Port' not in generalSettings:
+        return
+    port = generalSettings['Progress_Port']
+    if port in publishers and publishers[port] is None:
+        # Publisher could not be started
+        return
+    try:
+        if port not in publishers or publishers[port].closed:
+            publishers[port] = ProgressPublisher(port)
+        publishers[port].publish(topic, event)
+    except OSError as e:
+        publishers[port] = None
+        print('Progress is not published on port {} ({})'.format(port, e))
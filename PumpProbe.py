@@ -1,5 +1,6 @@
 # Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
 
+import json
 import os
 import time
 
@@ -9,6 +10,9 @@ import numpy as np
 from .DataManagement import *
 from .M8190 import M8190A
 from .NIDAQ import NIDAQ
+from .Publisher import publishProgress
+from .Sessions import connectInstrument, disconnectInstrument, startInstruments, waitUntilReady
+from .SignalProcessing import RunningStatistics, SoftwareLockIn, convertToPolar, decimateMinMax, testStationarity
 
 
 def calculateSegmentParameter(generalSettings, pulseScheme):
@@ -52,25 +56,38 @@ def calculateSegmentParameter(generalSettings, pulseScheme):
 
     return points_per_segment, sampling_frequency
 
-def showPumpProbeSegment(generalSettings, pulseScheme, sweepStep):
-    """Displays the pulse sequence for a given sweep step. 
+def showPumpProbeSegment(generalSettings, pulseScheme, sweepStep, method='edges', maxPoints=10000):
+    """Displays the pulse sequence for one or several sweep steps. 
 
     Args:
         generalSettings (dict): General settings of the AWG.
         pulseScheme (dict): Definition of the pulse sequences.
-        sweepStep (int): Number of sweep to be displayed.
+        sweepStep (int, list): Number of sweep to be displayed. A list of sweep numbers displays the sweeps on top of each other.
+        method (str, optional): 'edges': The segments are drawn from the pulse edges without generating them (see calculateSegmentEdges), exact at any zoom. 
+                                'minmax': The generated segments are decimated to their min/max envelope (see decimateMinMax). Defaults to 'edges'.
+        maxPoints (int, optional): Maximum number of points per segment for the method 'minmax'. Defaults to 10000.
     """    
-    # Calculate duration of one cycle and one segment
-    cycle_duration = (1/pulseScheme['modulationFreq (Hz)'])/2
-    segment_duration = cycle_duration / pulseScheme['repetitions']
     points_per_segment, sampling_frequency = calculateSegmentParameter(generalSettings, pulseScheme)   
-
-    t = np.linspace(0, segment_duration, points_per_segment)
-    segment_cycleA, segment_cycleB = genPumpProbeSegments(generalSettings, pulseScheme, sweepStep, displayingMode=True)
+    if type(sweepStep) is int:
+        sweepSteps = [sweepStep]
+    else:
+        sweepSteps = list(sweepStep)
 
     plt.figure()
-    plt.plot(t, segment_cycleA, label='A')
-    plt.plot(t, segment_cycleB, label='B')
+    for step in sweepSteps:
+        label = ' (step {})'.format(step) if len(sweepSteps) > 1 else ''
+        if method == 'edges':
+            edges = calculateSegmentEdges(generalSettings, pulseScheme, step)
+            for cycle in ['A', 'B']:
+                indices, amplitude = edges[cycle]
+                plt.step(indices / sampling_frequency, amplitude, where='post', label=cycle + label)
+        elif method == 'minmax':
+            segments = genPumpProbeSegments(generalSettings, pulseScheme, step, displayingMode=True)
+            for cycle, segment in zip(['A', 'B'], segments):
+                indices, amplitude = decimateMinMax(segment, maxPoints)
+                plt.plot(indices / sampling_frequency, amplitude, label=cycle + label)
+        else:
+            raise Exception('Unknown method: {}'.format(method))
     plt.xlabel('Time (s)')
     plt.ylabel('Amplitude (V)')
     plt.legend()
@@ -81,6 +98,71 @@ def showPumpProbeSegment(generalSettings, pulseScheme, sweepStep):
     print('Time resolution: {} s'.format(1/sampling_frequency))
     print('Calculated modulation frequency: {} Hz'.format(1/(2*points_per_segment/sampling_frequency*pulseScheme['repetitions'])))
 
+def calculateSegmentEdges(generalSettings, pulseScheme, sweepStep):
+    """Calculates the edges of the pump-probe segments for a given sweep step without generating the segments (see genPumpProbeSegments).
+
+    Args:
+        generalSettings (dict): General settings of the AWG.
+        pulseScheme (dict): Definition of the pulse sequences.
+        sweepStep (int): Number of sweep to be calculated.
+
+    Returns:
+        dict: For cycle 'A' and 'B': Sample indices of the edges (including start and end of the segment), Amplitude in V from each edge on.
+    """    
+    # Calculate duration of one cycle and one segment
+    cycle_duration = (1/pulseScheme['modulationFreq (Hz)'])/2
+    segment_duration = cycle_duration / pulseScheme['repetitions']
+    points_per_segment, _ = calculateSegmentParameter(generalSettings, pulseScheme)
+
+    ppt = points_per_segment / segment_duration
+    edges = {}
+    for cycle in ['A', 'B']:
+        indices = [0, points_per_segment]
+        steps = [0, 0]
+        for pulse, (start_time, duration, amplitude) in zip(pulseScheme['pulses'], calculatePulseParameters(pulseScheme, sweepStep)):
+            if pulse['type'] == 'DC' and pulse['cycle'] == cycle:
+                # Same sample indices as in genPumpProbeSegments
+                start_index = min(max(round(ppt * start_time), 0), points_per_segment)
+                end_index = min(max(round(ppt * (start_time + duration)), 0), points_per_segment)
+                if end_index > start_index:
+                    indices.extend([start_index, end_index])
+                    steps.extend([amplitude, -amplitude])
+        indices, inverse = np.unique(indices, return_inverse=True)
+        edges[cycle] = (indices, np.cumsum(np.bincount(inverse, weights=steps)))
+    return edges
+
+def calculatePulseParameters(pulseScheme, sweepStep):
+    """Calculates the start time, duration and amplitude of all pulses for a given sweep step.
+
+    Args:
+        pulseScheme (dict): Definition of the pulse sequences.
+        sweepStep (int): Number of sweep to be calculated.
+
+    Returns:
+        list: Start time (s), duration (s) and amplitude (V) of each pulse.
+    """    
+    parameters = []
+    for pulse in pulseScheme['pulses']:
+        if pulse['sweepTime']:
+            time_offset = (pulse['endTime (s)'] - pulse['startTime (s)'])/(pulseScheme['sweepSteps']-1) * sweepStep
+            start_time = pulse['startTime (s)'] + time_offset
+        else:
+            start_time = pulse['startTime (s)']
+
+        if pulse['sweepDuration']:
+            additional_duration = (pulse['endDuration (s)'] - pulse['startDuration (s)'])/(pulseScheme['sweepSteps']-1) * sweepStep
+            duration = pulse['startDuration (s)'] + additional_duration
+        else:
+            duration = pulse['startDuration (s)']
+
+        if pulse['sweepAmplitude']:
+            additional_amplitude = (pulse['endAmplitude (V)'] - pulse['startAmplitude (V)'])/(pulseScheme['sweepSteps']-1) * sweepStep
+            amplitude = pulse['startAmplitude (V)'] + additional_amplitude
+        else:
+            amplitude = pulse['startAmplitude (V)']
+
+        parameters.append((start_time, duration, amplitude))
+    return parameters
 
 def genPumpProbeSegments(generalSettings, pulseScheme, sweepStep, displayingMode=False):
     """Creates the pump-probe segments for a given sweep step.
@@ -111,26 +193,8 @@ def genPumpProbeSegments(generalSettings, pulseScheme, sweepStep, displayingMode
         segment_cycleB = np.zeros(points_per_segment, dtype=np.int16)
 
     ppt = points_per_segment / segment_duration
-    for pulse in pulseScheme['pulses']:
+    for pulse, (start_time, duration, amplitude) in zip(pulseScheme['pulses'], calculatePulseParameters(pulseScheme, sweepStep)):
         if pulse['type'] == 'DC':
-            if pulse['sweepTime']:
-                time_offset = (pulse['endTime (s)'] - pulse['startTime (s)'])/(pulseScheme['sweepSteps']-1) * sweepStep
-                start_time = pulse['startTime (s)'] + time_offset
-            else:
-                start_time = pulse['startTime (s)']
-
-            if pulse['sweepDuration']:
-                additional_duration = (pulse['endDuration (s)'] - pulse['startDuration (s)'])/(pulseScheme['sweepSteps']-1) * sweepStep
-                duration = pulse['startDuration (s)'] + additional_duration
-            else:
-                duration = pulse['startDuration (s)']
-
-            if pulse['sweepAmplitude']:
-                additional_amplitude = (pulse['endAmplitude (V)'] - pulse['startAmplitude (V)'])/(pulseScheme['sweepSteps']-1) * sweepStep
-                amplitude = pulse['startAmplitude (V)'] + additional_amplitude
-            else:
-                amplitude = pulse['startAmplitude (V)']
-
             if displayingMode == False:
                 # Amplitude in DAC values
                 amplitude = round(2 * amplitude * scalingAmplitude)
@@ -165,99 +229,368 @@ def genPumpProbeSegments(generalSettings, pulseScheme, sweepStep, displayingMode
 
         return fileCycleA, fileCycleB, sampling_frequency
 
-def measurePumpProbe(generalSettings, pulseScheme, acquisitionTime, settlingTime, comment={}, save=True):
+def waitForSettling(daq, channel, maxSettlingTime, blockTime, windowBlocks=5, threshold=2):
+    """Streams the lock-in signal until it is stationary (see testStationarity) or the maximum settling time runs out.
+    The test is applied to the block means of a sliding window.
+
+    Args:
+        daq (NIDAQ): DAQ box.
+        channel (str): Name of input channel.
+        maxSettlingTime (float): Maximum settling time in seconds.
+        blockTime (float): Duration of one block in seconds.
+        windowBlocks (int, optional): Number of blocks in the sliding window. Defaults to 5.
+        threshold (float, optional): Threshold of the stationarity test in standard deviations. Defaults to 2.
+
+    Returns:
+        float, bool: Settling time in seconds (beginning of the stationary window), True if the signal settled within the maximum settling time.
+    """    
+    blockMeans = []
+    stream = daq.streamAnalog(channel, blockTime, maxSettlingTime)
+    try:
+        for block in stream:
+            blockMeans.append(np.mean(block))
+            if len(blockMeans) >= windowBlocks and testStationarity(blockMeans[-windowBlocks:], threshold):
+                return (len(blockMeans) - windowBlocks) * blockTime, True
+    finally:
+        stream.close()
+
+    return maxSettlingTime, False
+
+def acquireSequential(daq, channel, maxAcquisitionTime, blockTime, targetStandardError, minimumBlocks=5, rawTrace=None):
+    """Acquires data in short blocks until the standard error of the mean reaches a target value or the maximum acquisition time runs out.
+    The block means are used as observations for the running statistics, since consecutive lock-in samples are correlated. 
+    The block time should therefore be larger than a few lock-in time constants.
+
+    Args:
+        daq (NIDAQ): DAQ box.
+        channel (str): Name of input channel.
+        maxAcquisitionTime (float): Maximum measurement time in seconds.
+        blockTime (float): Duration of one block in seconds.
+        targetStandardError (float): Target standard error of the mean.
+        minimumBlocks (int, optional): Minimum number of blocks before the acquisition can be stopped. Defaults to 5.
+        rawTrace (list, optional): If a list is given, all acquired blocks are appended. Defaults to None.
+
+    Returns:
+        float, float, int: Mean value, Standard error of the mean, Number of samples.
+    """    
+    statistics = RunningStatistics()
+    numberSamples = 0
+    stream = daq.streamAnalog(channel, blockTime, maxAcquisitionTime)
+    try:
+        for block in stream:
+            if rawTrace is not None:
+                rawTrace.append(block)
+            statistics.update(np.mean(block))
+            numberSamples += len(block)
+            if statistics.getCount() >= minimumBlocks and statistics.getStandardError() <= targetStandardError:
+                break
+    finally:
+        stream.close()
+
+    return float(statistics.getMean()), float(statistics.getStandardError()), numberSamples
+
+def acquireSoftwareLockIn(daq, channel, maxAcquisitionTime, blockTime, lockin, targetStandardError=None, minimumBlocks=5, rawTrace=None):
+    """Acquires the raw signal and the reference and demodulates them block by block with a software lock-in.
+    The mean values of the demodulated periods within each block are used as observations for the running statistics.
+
+    Args:
+        daq (NIDAQ): DAQ box.
+        channel (list): Names of the input channels of the raw signal and the reference.
+        maxAcquisitionTime (float): Maximum measurement time in seconds.
+        blockTime (float): Duration of one block in seconds.
+        lockin (SoftwareLockIn): Software lock-in.
+        targetStandardError (float, optional): Target standard error of the in-phase component of the first harmonic. Defaults to None: Acquisition for the maximum measurement time.
+        minimumBlocks (int, optional): Minimum number of blocks before the acquisition can be stopped. Defaults to 5.
+        rawTrace (list, optional): If a list is given, all acquired blocks are appended. Defaults to None.
+
+    Returns:
+        ndarray, ndarray, float, int: In-phase and quadrature components for all harmonics, Standard error of the in-phase component of the first harmonic, Number of demodulated periods.
+    """    
+    lockin.reset()
+    statistics = RunningStatistics((2, len(lockin.harmonics)))
+    numberPeriods = 0
+    stream = daq.streamAnalog(channel, blockTime, maxAcquisitionTime)
+    try:
+        for block in stream:
+            if rawTrace is not None:
+                rawTrace.append(block)
+            _, x, y = lockin.process(block[0], block[1])
+            if x.shape[1] == 0:
+                continue
+            statistics.update(np.array([np.mean(x, axis=1), np.mean(y, axis=1)]))
+            numberPeriods += x.shape[1]
+            if targetStandardError is not None and statistics.getCount()[0, 0] >= minimumBlocks and statistics.getStandardError()[0, 0] <= targetStandardError:
+                break
+    finally:
+        stream.close()
+
+    if numberPeriods == 0:
+        print('Software lock-in: No reference periods detected.')
+    mean = statistics.getMean()
+    return mean[0], mean[1], float(statistics.getStandardError()[0, 0]), numberPeriods
+
+def calculateBlockStatistics(data, samplesPerBlock):
+    """Calculates mean and standard error of data using the means of consecutive blocks as observations.
+
+    Args:
+        data (ndarray): Samples.
+        samplesPerBlock (int): Number of samples per block.
+
+    Returns:
+        float, float: Mean value, Standard error of the mean.
+    """    
+    samplesPerBlock = max(1, int(samplesPerBlock))
+    numberBlocks = len(data) // samplesPerBlock
+    statistics = RunningStatistics()
+    if numberBlocks > 0:
+        statistics.update(np.mean(np.reshape(data[:numberBlocks*samplesPerBlock], (numberBlocks, samplesPerBlock)), axis=1))
+    return float(np.mean(data)), float(statistics.getStandardError())
+
+def measurePumpProbe(generalSettings, pulseScheme, acquisitionTime, settlingTime, comment={}, save=True, targetStandardError=None, blockTime=0.1, detectSettling=False, settlingWindow=5, softwareLockIn=False, harmonics=[1], recordRaw=False, checkpoint=None):
     """Performs a pump-probe measurement using lock-in detection technique.
 
     Args:
         generalSettings (dict): General settings of the AWG.
         pulseScheme (dict): Definition of the pulse sequence.
-        acquisitionTime (float): Measurement time in seconds.
-        settlingTime (float): Settling time before measurement in seconds.
+        acquisitionTime (float): Measurement time in seconds. Maximum measurement time per sweep step if targetStandardError is set.
+        settlingTime (float): Settling time before measurement in seconds. Maximum settling time if detectSettling is True.
         comment (dict, optional): Comments. Defaults to {}.
         save (bool, optional): True: Save measurement data. False: Data is not saved. Defaults to True.
+        targetStandardError (float, optional): Sequential acquisition: Each sweep step is acquired in blocks until the standard error of the lock-in signal reaches this value. Defaults to None: Fixed acquisition time.
+        blockTime (float, optional): Duration of one acquisition block in seconds used for the standard error estimation and the settling detection. Defaults to 0.1.
+        detectSettling (bool, optional): True: The acquisition of each sweep step starts as soon as the lock-in signal is stationary (see waitForSettling). False: Fixed settling time. Defaults to False.
+        settlingWindow (int, optional): Number of blocks used for the settling detection. Defaults to 5.
+        softwareLockIn (bool, optional): True: The raw signal ('DAQ_InputChannel_Signal') is demodulated with the marker of the AWG ('DAQ_InputChannel_Reference') 
+                                        as reference (see SoftwareLockIn). The lock-in signal is the in-phase component of the first harmonic. False: External lock-in. Defaults to False.
+        harmonics (list, optional): Harmonics demodulated by the software lock-in. Defaults to [1].
+        recordRaw (bool, optional): True: The raw DAQ traces of all sweep steps are saved next to the JSON file (see saveRawTraces) for a later evaluation (see Replay). Defaults to False.
+        checkpoint (str, optional): Path and filename of a checkpoint file, which is written after every sweep step. If the file exists, the interrupted measurement 
+                                    is resumed after its last completed step. The file is deleted when the measurement is complete. With 'Data_Format': 'binary' 
+                                    an interrupted run is not finished and the resumed measurement continues it (same RunID). Defaults to None.
+
+    Note:
+        With 'Progress_Port' in the general settings every sweep step is published on a local TCP port (topic 'pumpProbe', see ProgressPublisher).
+
+    Raises:
+        Exception: Settling detection with software lock-in.
+        Exception: Checkpoint of a different measurement.
 
     Returns:
         ndarray, ndarray: Sweep numbers, Averaged lock-in signal for a individual sweeps.
     """    
-    # DAQ
+    if softwareLockIn and detectSettling:
+        raise Exception('Settling detection requires the external lock-in.')
+
+    # Checkpoint of an interrupted measurement: Scheme, settings and segment parameters must be unchanged
+    points_per_segment, sampling_frequency = calculateSegmentParameter(generalSettings, pulseScheme)
+    checkpointState = {'GeneralSettings': json.loads(json.dumps(generalSettings)), 'Scheme': json.loads(json.dumps(pulseScheme)), 
+                        'points_per_segment': points_per_segment, 'sampling_frequency': sampling_frequency, 'softwareLockIn': softwareLockIn, 'harmonics': list(harmonics), 'recordRaw': recordRaw}
+    resumeState = None
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as json_file:
+            resumeState = json.load(json_file)
+        if any(resumeState[key] != value for key, value in checkpointState.items()):
+            raise Exception('Checkpoint {} belongs to a different measurement.'.format(checkpoint))
+        print('Resuming after sweep step {} of {}.'.format(resumeState['completedSteps'], pulseScheme['sweepSteps']))
+
+    firstStep = resumeState['completedSteps'] if resumeState is not None else 0
+
+    # DAQ (tasks are created for each read or write)
     daq = NIDAQ(generalSettings['DAQ_Device'], samplingRate=generalSettings['DAQ_SamplingRate (1/s)'])
 
-    # Connect AWG
-    awg = M8190A(generalSettings['AWG_VisaResource'])
-    awg.connect()
-    awg.query('*IDN?')
-    # Initialize / General
-    awg.setCoupling(decouple=True)
-    awg.setFormat(generalSettings['AWG_Channel'], generalSettings['AWG_Format'])
-    # Route 
-    awg.setOutputRoute(generalSettings['AWG_Channel'], generalSettings['AWG_Route'])
-    # Trigger
-    awg.setTriggerSource(source='EXT')
-    awg.setTriggerImpedance(impedance='HIGH')
-    awg.setTriggerPolarity(polarity='POS')
-    awg.setTriggerLevel(level=generalSettings['AWG_TriggerLevel (V)'])
-    awg.setTriggerMode(generalSettings['AWG_Channel'], 'TRIG')
-    # Amplitudes
-    awg.setAmplitude(generalSettings['AWG_Channel'], generalSettings['AWG_Amplitude (V)'])
-    awg.setMarkerAmplitude(generalSettings['AWG_Channel'], generalSettings['AWG_SampleMarkerAmplitude (V)'], marker='SAMP')
-    awg.setMarkerOffset(generalSettings['AWG_Channel'], 0, marker='SAMP')
-    # Set Sampling Frequency
-    _, sampling_frequency = calculateSegmentParameter(generalSettings, pulseScheme)
-    awg.setSamplingFrequency(sampling_frequency)
-    
-    # Check if ready
-    print(awg.query('*OPC?'))
-    time.sleep(5)
-
-    # Delete all Sequences
-    awg.deleteSequences(generalSettings['AWG_Channel'])
-    # Define Sequence Table
-    sequenceTable = [{'entryNumber': '0', 'segmentID': '1', 'loop': pulseScheme['repetitions']}, 
-                    {'entryNumber': '1', 'segmentID': '2', 'loop': pulseScheme['repetitions']}]
-    awg.defineSequence(generalSettings['AWG_Channel'], sequenceTable, 'COND')
-    # Sequence Mode
-    awg.setSequencingMode(generalSettings['AWG_Channel'], mode='STS')
-    # Switch Output On
-    awg.switchOutputOn(generalSettings['AWG_Channel'])
-
-    # Check if ready
-    print(awg.query('*OPC?'))
-    time.sleep(5)
+    def setupAWG():
+        # Connect AWG
+        awg = connectInstrument(M8190A, generalSettings['AWG_VisaResource'])
+        awg.query('*IDN?')
+        # Initialize / General
+        awg.setCoupling(decouple=True)
+        awg.setFormat(generalSettings['AWG_Channel'], generalSettings['AWG_Format'])
+        # Route 
+        awg.setOutputRoute(generalSettings['AWG_Channel'], generalSettings['AWG_Route'])
+        # Trigger
+        awg.setTriggerSource(source='EXT')
+        awg.setTriggerImpedance(impedance='HIGH')
+        awg.setTriggerPolarity(polarity='POS')
+        awg.setTriggerLevel(level=generalSettings['AWG_TriggerLevel (V)'])
+        awg.setTriggerMode(generalSettings['AWG_Channel'], 'TRIG')
+        # Amplitudes
+        awg.setAmplitude(generalSettings['AWG_Channel'], generalSettings['AWG_Amplitude (V)'])
+        awg.setMarkerAmplitude(generalSettings['AWG_Channel'], generalSettings['AWG_SampleMarkerAmplitude (V)'], marker='SAMP')
+        awg.setMarkerOffset(generalSettings['AWG_Channel'], 0, marker='SAMP')
+        # Set Sampling Frequency
+        awg.setSamplingFrequency(sampling_frequency)
+
+        # Check if ready
+        waitUntilReady(awg)
+
+        # Delete all Sequences
+        awg.deleteSequences(generalSettings['AWG_Channel'])
+        # Define Sequence Table
+        sequenceTable = [{'entryNumber': '0', 'segmentID': '1', 'loop': pulseScheme['repetitions']}, 
+                        {'entryNumber': '1', 'segmentID': '2', 'loop': pulseScheme['repetitions']}]
+        awg.defineSequence(generalSettings['AWG_Channel'], sequenceTable, 'COND')
+        # Sequence Mode
+        awg.setSequencingMode(generalSettings['AWG_Channel'], mode='STS')
+        # Switch Output On
+        awg.switchOutputOn(generalSettings['AWG_Channel'])
+
+        # Check if ready
+        waitUntilReady(awg)
+        return awg
+
+    # The segments of the first sweep step are generated while the AWG is configured
+    setupFunctions = [setupAWG]
+    if firstStep < pulseScheme['sweepSteps']:
+        setupFunctions.append(lambda: genPumpProbeSegments(generalSettings, pulseScheme, sweepStep=firstStep))
+    awg, *firstSegments = startInstruments(setupFunctions)
 
     sweepNumber = np.zeros(pulseScheme['sweepSteps'])
     lockinSignal = np.zeros(pulseScheme['sweepSteps'])
-    for i in range(pulseScheme['sweepSteps']):
-        # Reset DAQ Trigger
-        daq.writeAnalog(generalSettings['DAQ_OutputChannel_TriggerAWG'],[0])
-        # Generate Segments A and B
-        fileCycleA, fileCycleB, sampling_frequency = genPumpProbeSegments(generalSettings, pulseScheme, sweepStep=i)
-        awg.loadSegmentFromBin(generalSettings['AWG_Channel'], 1, fileCycleA)
-        awg.loadSegmentFromBin(generalSettings['AWG_Channel'], 2, fileCycleB)
-        # Start Channel
-        awg.playChannel(generalSettings['AWG_Channel'])
-        time.sleep(1)
-        # Trigger AWG using DAQ
-        triggerPulse = np.linspace(0, generalSettings['DAQ_OutputAmplitude_TriggerAWG (V)'], 50)
-        daq.writeAnalog(generalSettings['DAQ_OutputChannel_TriggerAWG'], triggerPulse)
-        # Wait settling time
-        time.sleep(settlingTime)
-        # Acquire Data
-        daqData = daq.readAnalog(generalSettings['DAQ_InputChannel_LockIn'], acquisitionTime)
-        sweepNumber[i] = i
-        lockinSignal[i] = np.mean(daqData)
-        # Stop Channel
-        awg.stopChannel(generalSettings['AWG_Channel'])
+    standardError = np.zeros(pulseScheme['sweepSteps'])
+    numberSamples = np.zeros(pulseScheme['sweepSteps'], dtype=int)
+    stepSettlingTime = np.zeros(pulseScheme['sweepSteps'])
+    settled = np.ones(pulseScheme['sweepSteps'], dtype=bool)
+    if softwareLockIn:
+        lockin = SoftwareLockIn(daq.getSamplingRate(), harmonics)
+        harmonicsX = np.zeros((pulseScheme['sweepSteps'], len(harmonics)))
+        harmonicsY = np.zeros((pulseScheme['sweepSteps'], len(harmonics)))
+    rawTraces = []
+    # Arrays saved in the checkpoint
+    results = {'sweepNumber': sweepNumber, 'lockinSignal': lockinSignal, 'standardError': standardError, 'numberSamples': numberSamples, 'stepSettlingTime': stepSettlingTime, 'settled': settled}
+    if softwareLockIn:
+        results.update({'harmonicsX': harmonicsX, 'harmonicsY': harmonicsY})
+    if resumeState is not None:
+        for key, values in resumeState['Results'].items():
+            results[key][:firstStep] = values
+        if recordRaw:
+            rawTraces = [np.load('{}_raw{}.npy'.format(os.path.splitext(checkpoint)[0], i)) for i in range(firstStep)]
+
+    def collectData(index):
+        # Measurement data of one (index) or all (slice) sweep steps
+        data = {'Sweep number (1)': sweepNumber[index], 'LockIn Signal (a.u.)': lockinSignal[index], 'LockIn Signal Std. Error (a.u.)': standardError[index], 
+                'Number of Samples (1)': numberSamples[index], 'Settling Time (s)': stepSettlingTime[index], 'Settled (1)': settled[index].astype(int)}
+        if softwareLockIn:
+            # Number of demodulated periods instead of samples
+            harmonicsR, harmonicsPhase = convertToPolar(harmonicsX[index], harmonicsY[index])
+            data['Number of Periods (1)'] = data.pop('Number of Samples (1)')
+            data.update({'LockIn Signal X (a.u.)': harmonicsX[index], 'LockIn Signal Y (a.u.)': harmonicsY[index], 
+                        'LockIn Signal R (a.u.)': harmonicsR, 'LockIn Signal Phase (deg)': harmonicsPhase})
+        return data
+
+    additionalInformation = {'sampling_frequency': sampling_frequency, 'acquisitionTime': acquisitionTime, 'settlingTime': settlingTime, 'targetStandardError': targetStandardError, 'blockTime': blockTime, 
+                            'detectSettling': detectSettling, 'settlingWindow': settlingWindow, 'rawTraces': recordRaw}
+    if softwareLockIn:
+        additionalInformation.update({'softwareLockIn': softwareLockIn, 'harmonics': harmonics})
+    # Binary data format: Each sweep step is saved in the background as soon as it is measured
+    writer = None
+    if save == True and 'Data_Format' in generalSettings and generalSettings['Data_Format'] == 'binary':
+        if resumeState is not None and 'RunFile' in resumeState and os.path.exists(resumeState['RunFile']):
+            # Continue the run of the interrupted measurement
+            store = DataStore(generalSettings, pulseScheme, comment, additionalInformation, filename=resumeState['RunFile'])
+            store.truncate(firstStep)
+        else:
+            store = DataStore(generalSettings, pulseScheme, comment, additionalInformation)
+        writer = AsyncWriter(store)
+        for i in range(store.getNumberRows(), firstStep):
+            writer.append(collectData(i))
+        if checkpoint is not None:
+            checkpointState.update({'RunFile': store.filename, 'completedSteps': firstStep, 'Results': {key: values[:firstStep].tolist() for key, values in results.items()}})
+            writeJSONAtomic(checkpoint, checkpointState)
+    publishProgress(generalSettings, 'pumpProbe', {'event': 'start', 'steps': pulseScheme['sweepSteps'], 'sampling_frequency': sampling_frequency})
+    try:
+        for i in range(firstStep, pulseScheme['sweepSteps']):
+            stepStartTime = time.time()
+            # Reset DAQ Trigger
+            daq.writeAnalog(generalSettings['DAQ_OutputChannel_TriggerAWG'],[0])
+            # Generate Segments A and B (first step already generated during the startup)
+            if i == firstStep:
+                fileCycleA, fileCycleB, sampling_frequency = firstSegments[0]
+            else:
+                fileCycleA, fileCycleB, sampling_frequency = genPumpProbeSegments(generalSettings, pulseScheme, sweepStep=i)
+            awg.loadSegmentFromBin(generalSettings['AWG_Channel'], 1, fileCycleA)
+            awg.loadSegmentFromBin(generalSettings['AWG_Channel'], 2, fileCycleB)
+            # Start Channel
+            awg.playChannel(generalSettings['AWG_Channel'])
+            time.sleep(1)
+            # Trigger AWG using DAQ
+            triggerPulse = np.linspace(0, generalSettings['DAQ_OutputAmplitude_TriggerAWG (V)'], 50)
+            daq.writeAnalog(generalSettings['DAQ_OutputChannel_TriggerAWG'], triggerPulse)
+            # Wait settling time
+            if detectSettling:
+                stepSettlingTime[i], settled[i] = waitForSettling(daq, generalSettings['DAQ_InputChannel_LockIn'], settlingTime, blockTime, settlingWindow)
+                if not settled[i]:
+                    print('Sweep step {}: Lock-in signal not settled within {} s.'.format(i, settlingTime))
+            else:
+                time.sleep(settlingTime)
+                stepSettlingTime[i] = settlingTime
+            # Acquire Data
+            sweepNumber[i] = i
+            rawBlocks = []
+            if softwareLockIn:
+                harmonicsX[i], harmonicsY[i], standardError[i], numberSamples[i] = acquireSoftwareLockIn(daq, [generalSettings['DAQ_InputChannel_Signal'], generalSettings['DAQ_InputChannel_Reference']], 
+                                                                                                        acquisitionTime, blockTime, lockin, targetStandardError, rawTrace=rawBlocks)
+                lockinSignal[i] = harmonicsX[i, 0]
+            elif targetStandardError is None:
+                daqData = daq.readAnalog(generalSettings['DAQ_InputChannel_LockIn'], acquisitionTime)
+                lockinSignal[i], standardError[i] = calculateBlockStatistics(daqData, blockTime * daq.getSamplingRate())
+                numberSamples[i] = len(daqData)
+                rawBlocks.append(daqData)
+            else:
+                lockinSignal[i], standardError[i], numberSamples[i] = acquireSequential(daq, generalSettings['DAQ_InputChannel_LockIn'], acquisitionTime, blockTime, targetStandardError, rawTrace=rawBlocks)
+            if recordRaw:
+                rawTraces.append(np.concatenate([np.atleast_2d(block) for block in rawBlocks], axis=1))
+            if writer is not None:
+                writer.append(collectData(i))
+            if checkpoint is not None:
+                if recordRaw:
+                    np.save('{}_raw{}.npy'.format(os.path.splitext(checkpoint)[0], i), rawTraces[-1])
+                checkpointState.update({'completedSteps': i + 1, 'Results': {key: values[:i + 1].tolist() for key, values in results.items()}})
+                writeJSONAtomic(checkpoint, checkpointState)
+            # Stop Channel
+            awg.stopChannel(generalSettings['AWG_Channel'])
+            # Publish progress (see ProgressPublisher)
+            parameters = {pulse['name']: {'time (s)': pulseParameters[0], 'duration (s)': pulseParameters[1], 'amplitude (V)': pulseParameters[2]} 
+                        for pulse, pulseParameters in zip(pulseScheme['pulses'], calculatePulseParameters(pulseScheme, i))}
+            publishProgress(generalSettings, 'pumpProbe', {'event': 'step', 'step': i, 'steps': pulseScheme['sweepSteps'], 'parameters': parameters, 'data': collectData(i), 
+                                                        'stepTime (s)': time.time() - stepStartTime})
+    except BaseException:
+        # Write all completed steps, also if the measurement is interrupted, without hiding the error of the measurement
+        # With a checkpoint the run is continued on resume and is not finished
+        if writer is not None:
+            try:
+                writer.close(finishStore=checkpoint is None)
+            except Exception as e:
+                print('AsyncWriter: {}'.format(e))
+        raise
+    if writer is not None:
+        writer.close()
+
+    publishProgress(generalSettings, 'pumpProbe', {'event': 'finish', 'steps': pulseScheme['sweepSteps']})
 
     # Reset
     daq.writeAnalog(generalSettings['DAQ_OutputChannel_TriggerAWG'],[0])
     awg.switchOutputOff(generalSettings['AWG_Channel'])
     # Disconnect
-    awg.disconnect()
+    disconnectInstrument(awg)
 
     # Save data
     if save == True:
-        additionalInformation = {'sampling_frequency': sampling_frequency, 'acquisitionTime': acquisitionTime, 'settlingTime': settlingTime}
-        data = {'Sweep number (1)': sweepNumber.tolist(), 'LockIn Signal (a.u.)': lockinSignal.tolist()}
-        saveData(generalSettings, pulseScheme, comment, additionalInformation, data)
+        if writer is None:
+            data = {key: np.asarray(value).tolist() for key, value in collectData(slice(None)).items()}
+            filename = saveData(generalSettings, pulseScheme, comment, additionalInformation, data)
+        else:
+            filename = writer.store.filename
+        if recordRaw:
+            channels = ['Signal', 'Reference'] if softwareLockIn else ['LockIn']
+            getBackgroundWriter().submit(saveRawTraces, filename, rawTraces, daq.getSamplingRate(), channels)
+
+    # Measurement complete
+    if checkpoint is not None and os.path.exists(checkpoint):
+        if recordRaw:
+            # Raw traces are still needed by the background writer
+            flushBackgroundWriter()
+            for i in range(pulseScheme['sweepSteps']):
+                os.remove('{}_raw{}.npy'.format(os.path.splitext(checkpoint)[0], i))
+        os.remove(checkpoint)
 
     return sweepNumber, lockinSignal
\ No newline at end of file
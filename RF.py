@@ -1,12 +1,18 @@
 # Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
 
+import json
+import os
 import time
 
-import matplotlib.pyplot as plt
 import numpy as np
 
+from .Calibration import *
 from .DataManagement import *
 from .NIDAQ import NIDAQ
+from .Plotting import *
+from .Publisher import publishProgress
+from .Sessions import connectInstrument, disconnectInstrument, waitUntilReady
+from .SignalProcessing import *
 from .SMB100B import SMB100B
 
 
@@ -20,26 +26,83 @@ def convertSignalValid(dataSignalValid, values):
     Returns:
         ndarray: Assigned frequency or power values.
     """    
-    # Normalize to +1 and -1
-    output = np.sign(dataSignalValid - np.max(dataSignalValid)/2)
+    values = np.asarray(values)
+    stepIndex = decodeSignalValid(dataSignalValid)
+    return values[stepIndex % len(values)]
 
-    # plt.figure()
-    # plt.plot(output, '.')
-    # plt.show()
+def binLockInData(generalSettings, lockinData, stepIndex, numberSteps):
+    """Determines the lock-in signal for each sweep step. With 'LockIn_FilterOrder' in the general settings the steady-state value is 
+    predicted from the settling transient of the lock-in (see fitSettlingData) using the time constant 'LockIn_TimeConstant (s)' or a fitted time constant.
+    Otherwise the samples are averaged after discarding the fraction 'LockIn_DataDropOff' at the beginning of each step.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        lockinData (ndarray): Lock-in signal.
+        stepIndex (ndarray): Number of the sweep step for each sample.
+        numberSteps (int): Number of steps per sweep pass.
+
+    Returns:
+        ndarray, ndarray, ndarray, float: Lock-In signal, True for steps with data, RMS residual of the settling fit (NaN without settling model), time constant of the lock-in in seconds (None without settling model).
+    """    
+    if 'LockIn_FilterOrder' in generalSettings:
+        if 'LockIn_TimeConstant (s)' in generalSettings:
+            timeConstant = generalSettings['LockIn_TimeConstant (s)']
+        else:
+            timeConstant = None
+        return fitSettlingData(lockinData, stepIndex, numberSteps, generalSettings['DAQ_SamplingRate (1/s)'], timeConstant, generalSettings['LockIn_FilterOrder'])
+    lockinSignal, found = binSweepData(lockinData, stepIndex, numberSteps, generalSettings['LockIn_DataDropOff'])
+    return lockinSignal, found, np.full(numberSteps, np.nan), None
 
-    stepNumber = 0
-    for i in range(len(output)):
-        if output[i] == 1:
-            output[i] = values[stepNumber]
-        elif output[i] == -1:
-            if i < len(output):
-                if output[i+1] != -1:
-                    stepNumber += 1
-                    if stepNumber >= len(values):
-                        stepNumber = 0
-            output[i] = values[stepNumber]
+def evaluateSweepData(generalSettings, daqData, valueList, returnFit=False):
+    """Averages the lock-in signal for each sweep point using the signal valid output of the SG.
 
-    return output
+    Args:
+        generalSettings (dict): General settings of the SG.
+        daqData (ndarray): DAQ data: Lock-in signal and signal valid output.
+        valueList (ndarray): Frequency or power values of the sweep.
+        returnFit (bool, optional): Additionally returns the results of the settling model (see binLockInData). Defaults to False.
+
+    Returns:
+        ndarrays: Frequency or power values (0 for points without data), Lock-In signal. With returnFit additionally: RMS residual of the settling fit, time constant of the lock-in.
+    """    
+    stepIndex = decodeSignalValid(daqData[1,:])
+    lockinSignal, found, residual, timeConstant = binLockInData(generalSettings, daqData[0,:], stepIndex, len(valueList))
+    values = np.where(found, valueList, 0)
+    if returnFit:
+        return values, lockinSignal, residual, timeConstant
+    return values, lockinSignal
+
+def evaluateTriangleSweepData(generalSettings, daqData, valueList, returnFit=False):
+    """Averages the lock-in signal for each point of a triangle sweep (up and down pass) using the signal valid output of the SG.
+    The turning point is measured once and belongs to both passes. Averaging both passes cancels the lag of the lock-in signal to first order.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        daqData (ndarray): DAQ data: Lock-in signal and signal valid output.
+        valueList (ndarray): Frequency or power values of the up pass.
+        returnFit (bool, optional): Additionally returns the results of the settling model (see binLockInData). Defaults to False.
+
+    Returns:
+        ndarrays: Frequency or power values (0 for points without data), Lock-In signal (average of both passes), Lock-In signal up pass, Lock-In signal down pass. 
+        With returnFit additionally: RMS residual of the settling fit (maximum of both passes), time constant of the lock-in.
+    """    
+    numberPoints = len(valueList)
+    numberSteps = 2*numberPoints - 1
+    stepIndex = decodeSignalValid(daqData[1,:])
+    # Discard samples beyond one up and down pass
+    idx = stepIndex < numberSteps
+    lockinSteps, found, residualSteps, timeConstant = binLockInData(generalSettings, daqData[0,idx], stepIndex[idx], numberSteps)
+
+    lockinSignalUp = lockinSteps[:numberPoints]
+    lockinSignalDown = lockinSteps[numberPoints-1:][::-1]
+    foundUp = found[:numberPoints]
+    foundDown = found[numberPoints-1:][::-1]
+    lockinSignal = np.where(foundUp & foundDown, (lockinSignalUp + lockinSignalDown)/2, np.where(foundUp, lockinSignalUp, lockinSignalDown))
+    values = np.where(foundUp | foundDown, valueList, 0)
+    if returnFit:
+        residual = np.fmax(residualSteps[:numberPoints], residualSteps[numberPoints-1:][::-1])
+        return values, lockinSignal, lockinSignalUp, lockinSignalDown, residual, timeConstant
+    return values, lockinSignal, lockinSignalUp, lockinSignalDown
 
 def outputContinuousWave(generalSettings, state, frequency, power, modulationFrequency=None):
     """Outputs an RF signal with specified frequency and power.
@@ -52,8 +115,7 @@ def outputContinuousWave(generalSettings, state, frequency, power, modulationFre
         modulationFrequency (float, optional): Modulates the RF output with the specified frequency. Defaults to None: No modulation.
     """    
     # Connect SG
-    sg = SMB100B(generalSettings['SG_VisaResource'])
-    sg.connect()
+    sg = connectInstrument(SMB100B, generalSettings['SG_VisaResource'])
     sg.query('*IDN?')
 
     if state == 'ON':
@@ -83,100 +145,75 @@ def outputContinuousWave(generalSettings, state, frequency, power, modulationFre
         sg.setRFFrequencyMode('CW')
 
     # Disconnect
-    sg.disconnect()
+    disconnectInstrument(sg)
 
-def convertPowerToVoltage(power, resistance=50):
-    """Converts Power (dBm) to Voltage (peak-to-zero).
+def refineFrequencyGrid(frequency, values, tolerance, minimumStep):
+    """Estimates the error of a linear interpolation between neighbouring frequencies from the local curvature and returns the midpoints of all intervals exceeding the tolerance.
 
     Args:
-        power (float): Power in dBm.
-        resistance (float, optional): Resistance in Ohm. Defaults to 50.
+        frequency (ndarray): Sorted frequencies in Hz.
+        values (ndarray): Measured values at the frequencies.
+        tolerance (float): Tolerated interpolation error relative to the local magnitude of the values.
+        minimumStep (float): Intervals smaller than twice this step in Hz are not refined.
 
     Returns:
-        float: Voltage (peak-to-zero)
+        ndarray: Frequencies to be measured additionally.
     """    
-    power_mW = np.power(10, power/10)
-    voltageRMS = np.sqrt(power_mW * resistance / np.power(10, 3))
-    voltagePeak = np.sqrt(2) * voltageRMS
-    return voltagePeak
+    frequency = np.asarray(frequency, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if len(frequency) < 3:
+        return np.array([])
 
-def convertVoltageToPower(voltage, resistance=50):
-    """Converts Voltage (peak-to-zero) to Power.
+    # Second derivative at the interior points (three-point formula for non-uniform grids)
+    h = np.diff(frequency)
+    secondDerivative = 2 * ((values[2:] - values[1:-1])/h[1:] - (values[1:-1] - values[:-2])/h[:-1]) / (h[1:] + h[:-1])
+    secondDerivative = np.abs(np.concatenate(([secondDerivative[0]], secondDerivative, [secondDerivative[-1]])))
 
-    Args:
-        voltage (float): Voltage (peak-to-zero) in V.
-        resistance (float, optional): Resistance in Ohm. Defaults to 50.
+    # Maximum error of the linear interpolation within each interval: h^2/8 * |f''|
+    interpolationError = h**2 / 8 * np.maximum(secondDerivative[:-1], secondDerivative[1:])
+    magnitude = np.maximum(np.abs(values[:-1]), np.abs(values[1:]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relativeError = interpolationError / magnitude
 
-    Returns:
-        float: Power (dBm)
-    """    
-    voltageRMS = voltage / np.sqrt(2)
-    power_mW = np.power(voltageRMS, 2) * np.power(10, 3) / resistance
-    power = 10 * np.log10(power_mW)
-    return power
+    refine = (relativeError > tolerance) & (h >= 2*minimumStep)
+    return np.round((frequency[:-1][refine] + frequency[1:][refine]) / 2)
 
-def calculatePowerConstantJunctionAmplitude(frequency, junctionVoltage, transferFunctionFrequency, transferFunctionTransmission):
-    """Calculates the output powers to apply a constant junction amplitude based on the transfer function.
+def measureAdaptiveFrequencyGrid(sweepScheme, measure, key):
+    """Measures on a coarse frequency grid and refines the grid where the interpolation error of the measured quantity exceeds the tolerance.
+    The sweep scheme defines the coarse grid ('startFrequency (Hz)', 'endFrequency (Hz)', 'frequencyStep (Hz)') and the refinement ('adaptiveTolerance (relative)', 'minimumFrequencyStep (Hz)', 'adaptiveRefinements').
 
     Args:
-        frequency (ndarray): Frequencies at which a constant junction amplitude is to be applied.
-        junctionVoltage (float): Junction amplitude in V.
-        transferFunctionFrequency (ndarray): Frequencies from the transfer function.
-        transferFunctionTransmission (ndarray): Tranmission values from the transfer function.
-
-    Returns:
-        ndarray: Output powers to generate a constant amplitude..
-    """    
-    junctionVoltage = np.abs(junctionVoltage)
-    transmission = np.interp(frequency, transferFunctionFrequency, transferFunctionTransmission)
-    sourceVoltages = junctionVoltage / transmission
-    sourcePower = convertVoltageToPower(sourceVoltages)
-
-    # plt.figure()
-    # plt.plot(frequency, sourcePower, '.')
-    # plt.xlabel('Frequency (Hz)')
-    # plt.ylabel('Source Power (dBm)')
-    # plt.show()
-
-    return sourcePower
-
-def loadTransferFunction(generalSettings):
-    """Loads the transfer function data.
-
-    Args:
-        generalSettings (dict): General settings of the SG.
-
-    Returns:
-        ndarray, ndarray, ndarray, float: Frequencies, Transmissionvalues, Coefficients for polynomial fit (lock-in voltage to junction amplitude), Calibration factor lock-in to current.
-    """    
-    # Load Transfer Function
-    tfData = loadData(generalSettings['TF_Folder'], generalSettings['TF_File'])
-    tfFrequency = np.array(tfData['Data']['Frequency (Hz)'])
-    tfTransmission = np.array(tfData['Data']['Transmission (normalized)'])
-    coeffPolyFit = np.array(tfData['additionalInformation']['coeffPolyFit'])
-    calFactorLockInToCurrent = np.float64(tfData['additionalInformation']['calFactorLockInToCurrent'])
-
-    return tfFrequency, tfTransmission, coeffPolyFit, calFactorLockInToCurrent
-
-def loadCrosstalkSignal(generalSettings):
-    """Loads the crosstalk data.
-
-    Args:
-        generalSettings (dict): General settings of the SG.
+        sweepScheme (dict): Definition of the sweep scheme.
+        measure (function): Measures a list of frequencies and returns a dictionary of ndarrays with one value per frequency. Must contain the key 'Frequency (Hz)'.
+        key (str): Key of the quantity used for the refinement.
 
     Returns:
-        ndarray, ndarray, ndarray: Frequencies, Frequency dependent scaling factors for crosstalk, Coefficients for polynomial fit (source voltage to lock-in voltage).
+        dict, list: Merged measurement data sorted by frequency, Number of measured points for the coarse grid and every refinement.
     """    
-    # Load Crosstalk Signal
-    ctData = loadData(generalSettings['CT_Folder'], generalSettings['CT_File'])
-    ctFrequency = np.array(ctData['Data']['Frequency (Hz)'])
-    ctScalingFactorsPowerFunction = np.array(ctData['Data']['Scaling (relative)'])
-    coeffPolyFit = np.array(ctData['additionalInformation']['coeffPolyFit'])
-
-    return ctFrequency, ctScalingFactorsPowerFunction, coeffPolyFit
+    numberPoints = int((sweepScheme['endFrequency (Hz)'] - sweepScheme['startFrequency (Hz)'])/sweepScheme['frequencyStep (Hz)']) + 1
+    frequencyList = np.linspace(sweepScheme['startFrequency (Hz)'], sweepScheme['endFrequency (Hz)'], numberPoints)
+    tolerance = sweepScheme['adaptiveTolerance (relative)']
+    minimumStep = sweepScheme.get('minimumFrequencyStep (Hz)', sweepScheme['frequencyStep (Hz)']/16)
+    refinements = sweepScheme.get('adaptiveRefinements', 4)
+
+    results = measure(frequencyList)
+    measuredPoints = [len(frequencyList)]
+    for _ in range(refinements):
+        frequencyList = refineFrequencyGrid(results['Frequency (Hz)'], results[key], tolerance, minimumStep)
+        if len(frequencyList) == 0:
+            break
+        newResults = measure(frequencyList)
+        measuredPoints.append(len(frequencyList))
+        # Merge and sort by frequency
+        idx = np.argsort(np.concatenate((results['Frequency (Hz)'], newResults['Frequency (Hz)'])), kind='stable')
+        for k in results:
+            results[k] = np.concatenate((results[k], newResults[k]))[idx]
+
+    return results, measuredPoints
 
 def measureConstantAmplitudeSweep(generalSettings, sweepScheme, comment={}, save=True):
     """Performs a frequency sweep with constant amplitude in the junction using the lock-in detection technique.
+    If the sweep scheme contains 'adaptiveTolerance (relative)', the frequency grid is refined adaptively (see measureAdaptiveFrequencyGrid).
 
     Args:
         generalSettings (dict): General settings of the SG.
@@ -187,60 +224,69 @@ def measureConstantAmplitudeSweep(generalSettings, sweepScheme, comment={}, save
     Returns:
         ndarrays: Frequency, Lock-In signal, Change in junction current, Voltage in junction
     """    
-    # Load Transfer Function
-    tfFrequency, tfTransmission, coeffPolyFit, calFactorLockInToCurrent = loadTransferFunction(generalSettings)
-    polyConvLockInToJunctionAmplitude = np.poly1d(coeffPolyFit)
+    # Load Transfer Function and Crosstalk Signal
+    calibration = loadCalibrationModel(generalSettings)
 
-    # Load Crosstalk Signal
-    if generalSettings['UseCT'] == True:
-        ctFrequency, ctScalingFactorsPowerFunction, coeffPolyFitCrosstalk = loadCrosstalkSignal(generalSettings)
-        polyConvVoltageToLockIn = np.poly1d(coeffPolyFitCrosstalk)
+    def measure(frequencyList):
+        # Measure frequency sweep at junction amplitude
+        powerList = calibration.calculateSourcePower(frequencyList, sweepScheme['junctionAmplitude (V)'])
+        _, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=frequencyList, powList=powerList, save=False)
+
+        # Correct for Crosstalk and convert LockIn Signal to Junction Voltage
+        results = calibration.applyCalibration(frequencyList, powerList, lockinSignal)
+        results['Frequency (Hz)'] = frequencyList
+        results['Source Power (dBm)'] = powerList
+        return results
 
-    # Measure frequency sweep at junction amplitude
     numberPoints = int((sweepScheme['endFrequency (Hz)'] - sweepScheme['startFrequency (Hz)'])/sweepScheme['frequencyStep (Hz)']) + 1
     frequencyList = np.linspace(sweepScheme['startFrequency (Hz)'], sweepScheme['endFrequency (Hz)'], numberPoints)
-    powerList = calculatePowerConstantJunctionAmplitude(frequencyList, sweepScheme['junctionAmplitude (V)'], tfFrequency, tfTransmission)
-    
-    plt.figure()
-    plt.plot(frequencyList, powerList, '.')
-    plt.xlabel('Frequency (Hz)')
-    plt.ylabel('Source Power (dBm)')
-    plt.axhline(y = generalSettings['SG_PowerMin (dBm)'], color = 'black', linestyle = '--')
-    plt.axhline(y = generalSettings['SG_PowerMax (dBm)'], color = 'black', linestyle = '--')
-    plt.show()
+    powerList = calibration.calculateSourcePower(frequencyList, sweepScheme['junctionAmplitude (V)'])
     
-    frequency, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=frequencyList, powList=powerList, save=False)
+    showPlot(generalSettings, 'sourcePower', drawSourcePower, frequencyList, powerList, generalSettings['SG_PowerMin (dBm)'], generalSettings['SG_PowerMax (dBm)'])
 
-    # Correct for Crosstalk
-    if generalSettings['UseCT'] == True:         
-        sourceVoltageList = convertPowerToVoltage(powerList)
-        ctScalingFactors = np.interp(frequency, ctFrequency, ctScalingFactorsPowerFunction)
-        calcLockinSignalCrosstalk = polyConvVoltageToLockIn(sourceVoltageList) * ctScalingFactors
-        lockinSignal = lockinSignal - calcLockinSignalCrosstalk
+    if 'adaptiveTolerance (relative)' in sweepScheme:
+        results, measuredPoints = measureAdaptiveFrequencyGrid(sweepScheme, measure, 'Junction Amplitude (V)')
+    else:
+        results = measure(frequencyList)
+        measuredPoints = [numberPoints]
 
-    # Convert LockIn Signal to Junction Voltage
-    junctionVoltageMeasured = polyConvLockInToJunctionAmplitude(lockinSignal)
+    frequency = results['Frequency (Hz)']
+    lockinSignal = results['LockIn Signal (V)']
+    calcLockinSignalCrosstalk = results['Crosstalk Signal (V)']
 
-    # Convert LockIn Signal to Junction Current Change
-    junctionCurrentChange = lockinSignal * calFactorLockInToCurrent
+    junctionVoltageMeasured = results['Junction Amplitude (V)']
+    junctionCurrentChange = results['Junction Current Change (A)']
 
-    plt.figure()
-    plt.plot(frequency, lockinSignal + calcLockinSignalCrosstalk, '.')
-    plt.plot(tfFrequency, lockinSignal, '.')
-    plt.plot(frequency, calcLockinSignalCrosstalk, '.', c='black')
-    plt.xlabel('Frequency (Hz)')
-    plt.ylabel('Lockin Signal (V)')
-    plt.show()
+    showPlot(generalSettings, 'crosstalkCorrection', drawCrosstalkCorrection, frequency, lockinSignal, calcLockinSignalCrosstalk)
 
     # Save data
     if save == True:
-        additionalInformation = {}
-        data = {'Frequency (Hz)': frequency.tolist(), 'LockIn Signal (V)': lockinSignal.tolist(), 'Junction Current Change (A)': junctionCurrentChange.tolist(), 'Junction Amplitude (V)': junctionVoltageMeasured.tolist()}
+        additionalInformation = {'measuredPoints': measuredPoints}
+        data = {'Frequency (Hz)': frequency.tolist(), 'LockIn Signal (V)': lockinSignal.tolist(), 'Junction Current Change (A)': junctionCurrentChange.tolist(), 'Junction Amplitude (V)': junctionVoltageMeasured.tolist(), 
+                'Source Power (dBm)': results['Source Power (dBm)'].tolist()}
         saveData(generalSettings, sweepScheme, comment, additionalInformation, data)
 
     return frequency, lockinSignal, junctionCurrentChange, junctionVoltageMeasured
 
-def measureCrosstalkSignal(generalSettings, sweepScheme, comment={}, resistance=50, save=True):
+def buildCrosstalkList(sweepScheme):
+    """Builds one frequency/power list containing the power ramp at 'powerSweepFrequency (Hz)' followed by the frequency points at 'frequencySweepPower (dBm)'.
+
+    Args:
+        sweepScheme (dict): Definition of the sweep scheme.
+
+    Returns:
+        ndarrays: Frequency list, Power list, Powers of the power ramp, Frequencies of the frequency sweep.
+    """    
+    numberPowers = int((sweepScheme['endPower (dBm)'] - sweepScheme['startPower (dBm)'])/sweepScheme['powerStep (dBm)']) + 1
+    powerRamp = np.linspace(sweepScheme['startPower (dBm)'], sweepScheme['endPower (dBm)'], numberPowers)
+    numberFrequencies = int((sweepScheme['endFrequency (Hz)'] - sweepScheme['startFrequency (Hz)'])/sweepScheme['frequencyStep (Hz)']) + 1
+    frequencyPoints = np.linspace(sweepScheme['startFrequency (Hz)'], sweepScheme['endFrequency (Hz)'], numberFrequencies)
+
+    freqList = np.concatenate((np.full(numberPowers, sweepScheme['powerSweepFrequency (Hz)'], dtype=np.float64), frequencyPoints))
+    powList = np.concatenate((powerRamp, np.full(numberFrequencies, sweepScheme['frequencySweepPower (dBm)'], dtype=np.float64)))
+    return freqList, powList, powerRamp, frequencyPoints
+
+def measureCrosstalkSignal(generalSettings, sweepScheme, comment={}, resistance=50, save=True, singleList=True):
     """Measures the frequency-dependent crosstalk in the junction using lock-in detection technique.
 
     Args:
@@ -249,27 +295,32 @@ def measureCrosstalkSignal(generalSettings, sweepScheme, comment={}, resistance=
         comment (dict, optional): Comments. Defaults to {}.
         resistance (float, optional): Resistance in Ohm.. Defaults to 50.
         save (bool, optional): True: Save measurement data. False: Data is not saved. Defaults to True.
+        singleList (bool, optional): True: Power sweep and frequency sweep are measured in one list sweep (see buildCrosstalkList). False: Two separate sweeps. Defaults to True.
 
     Returns:
         ndarrays: Frequencies, Frequency dependent scaling factors for crosstalk.
     """    
-    # Measure power sweep at fixed frequency
-    power, lockinSignal = measurePowerSweep(generalSettings, sweepScheme, save=False)
+    if singleList:
+        # Measure power ramp and frequency points in one list sweep
+        freqList, powList, powerRamp, frequencyPoints = buildCrosstalkList(sweepScheme)
+        _, lockinSignalList = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=freqList, powList=powList, save=False)
+        power, lockinSignal = powerRamp, lockinSignalList[:len(powerRamp)]
+    else:
+        # Measure power sweep at fixed frequency
+        power, lockinSignal = measurePowerSweep(generalSettings, sweepScheme, save=False)
     sourceVoltage = convertPowerToVoltage(power, resistance)
 
     # Fit 3rd order polynomial to RF Voltage vs LockIn Signal
     coeffPolyFit = np.polyfit(sourceVoltage, lockinSignal, 3)
     polyVoltageToLockIn = np.poly1d(coeffPolyFit)
 
-    plt.figure()
-    plt.plot(sourceVoltage / 1e-3, lockinSignal, '.')
-    plt.plot(sourceVoltage / 1e-3, polyVoltageToLockIn(sourceVoltage))
-    plt.xlabel('RF Amplitude (mV)')
-    plt.ylabel('LockIn Signal (V)')
-    plt.show()
+    showPlot(generalSettings, 'crosstalkFit', drawPolynomialFit, sourceVoltage, lockinSignal, coeffPolyFit, 'RF Amplitude (mV)', 'LockIn Signal (V)', 1e-3, experimentType='CT')
 
-    # Measure frequency sweep at fixed power
-    frequency, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, save=False)
+    if singleList:
+        frequency, lockinSignal = frequencyPoints, lockinSignalList[len(powerRamp):]
+    else:
+        # Measure frequency sweep at fixed power
+        frequency, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, save=False)
 
     # Calculate scaling factors for Power function
     scalingFactorsPowerFunction = np.zeros(len(lockinSignal))
@@ -279,44 +330,128 @@ def measureCrosstalkSignal(generalSettings, sweepScheme, comment={}, resistance=
     
     # Save data
     if save == True:
-        additionalInformation = {'coeffPolyFit': coeffPolyFit.tolist(), 'resistance': resistance}
+        additionalInformation = {'coeffPolyFit': coeffPolyFit.tolist(), 'resistance': resistance, 'singleList': singleList}
         data = {'Frequency (Hz)': frequency.tolist(), 'LockIn Signal (V)': lockinSignal.tolist(), 'Scaling (relative)': scalingFactorsPowerFunction.tolist()}
         saveData(generalSettings, sweepScheme, comment, additionalInformation, data, experimentType='CT')
 
     return frequency, scalingFactorsPowerFunction
 
-def measureTransferFunction(generalSettings, sweepScheme, calibrationValues, comment={}, iterations=1, resistance=50, save=True):
+def buildCrosstalkMapList(sweepScheme):
+    """Builds one frequency/power list covering the full power x frequency grid of a crosstalk map.
+    The power ramp alternates its direction from frequency to frequency to avoid large power steps.
+
+    Args:
+        sweepScheme (dict): Definition of the sweep scheme. The frequency step of the map is 'mapFrequencyStep (Hz)' (default: 'frequencyStep (Hz)').
+
+    Returns:
+        ndarrays: Frequency list, Power list, Powers of the grid, Frequencies of the grid.
+    """    
+    numberPowers = int((sweepScheme['endPower (dBm)'] - sweepScheme['startPower (dBm)'])/sweepScheme['powerStep (dBm)']) + 1
+    powers = np.linspace(sweepScheme['startPower (dBm)'], sweepScheme['endPower (dBm)'], numberPowers)
+    frequencyStep = sweepScheme.get('mapFrequencyStep (Hz)', sweepScheme['frequencyStep (Hz)'])
+    numberFrequencies = int((sweepScheme['endFrequency (Hz)'] - sweepScheme['startFrequency (Hz)'])/frequencyStep) + 1
+    frequencies = np.linspace(sweepScheme['startFrequency (Hz)'], sweepScheme['endFrequency (Hz)'], numberFrequencies)
+
+    powerGrid = np.tile(powers, (numberFrequencies, 1))
+    powerGrid[1::2] = powerGrid[1::2, ::-1]
+    freqList = np.repeat(frequencies, numberPowers)
+    powList = powerGrid.flatten()
+    return freqList, powList, powers, frequencies
+
+def measureCrosstalkMap(generalSettings, sweepScheme, comment={}, resistance=50, save=True, order=3):
+    """Measures the crosstalk on a power x frequency grid in a single list sweep and fits a polynomial (source voltage to lock-in voltage) for each frequency.
+    The crosstalk file additionally contains the scaling factors and the polynomial at 'powerSweepFrequency (Hz)', so that it can be used like a file of measureCrosstalkSignal.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        sweepScheme (dict): Definition of the sweep scheme.
+        comment (dict, optional): Comments. Defaults to {}.
+        resistance (float, optional): Resistance in Ohm. Defaults to 50.
+        save (bool, optional): True: Save measurement data. False: Data is not saved. Defaults to True.
+        order (int, optional): Order of the polynomials. Defaults to 3.
+
+    Returns:
+        ndarrays: Frequencies, Coefficients for polynomial fits for each frequency (highest order first).
+    """    
+    # Measure full grid in one list sweep
+    freqList, powList, powers, frequencies = buildCrosstalkMapList(sweepScheme)
+    _, lockinSignalList = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=freqList, powList=powList, save=False)
+    lockinSignalMap = np.reshape(lockinSignalList, (len(frequencies), len(powers)))
+    lockinSignalMap[1::2] = lockinSignalMap[1::2, ::-1]
+
+    # Fit polynomials for all frequencies at once (identical source voltages)
+    sourceVoltage = convertPowerToVoltage(powers, resistance)
+    vandermonde = np.vander(sourceVoltage, order + 1)
+    coeffPolyFitMap = np.linalg.lstsq(vandermonde, lockinSignalMap.T, rcond=None)[0].T
+
+    # Single polynomial and scaling factors for compatibility with measureCrosstalkSignal
+    coeffPolyFit = np.array([np.interp(sweepScheme['powerSweepFrequency (Hz)'], frequencies, coeffPolyFitMap[:,k]) for k in range(order + 1)])
+    frequencySweepVoltage = convertPowerToVoltage(sweepScheme['frequencySweepPower (dBm)'], resistance)
+    scalingFactorsPowerFunction = np.polyval(coeffPolyFitMap.T, frequencySweepVoltage) / np.polyval(coeffPolyFit, frequencySweepVoltage)
+
+    showPlot(generalSettings, 'crosstalkMap', drawCrosstalkMap, powers, frequencies, lockinSignalMap, experimentType='CT')
+
+    # Save data
+    if save == True:
+        additionalInformation = {'coeffPolyFit': coeffPolyFit.tolist(), 'coeffPolyFitMap': coeffPolyFitMap.tolist(), 'resistance': resistance, 'order': order}
+        data = {'Frequency (Hz)': frequencies.tolist(), 'Power (dBm)': powers.tolist(), 'LockIn Signal (V)': lockinSignalMap.tolist(), 'Scaling (relative)': scalingFactorsPowerFunction.tolist()}
+        saveData(generalSettings, sweepScheme, comment, additionalInformation, data, experimentType='CT')
+
+    return frequencies, coeffPolyFitMap
+
+def measureTransferFunction(generalSettings, sweepScheme, calibrationValues, comment={}, iterations=1, resistance=50, save=True, tolerance=None, checkpoint=None):
     """Measures the frequency-dependent transfer function using lock-in detection technique.
+    If the sweep scheme contains 'adaptiveTolerance (relative)', the initial fixed power sweep is measured on an adaptively refined frequency grid (see measureAdaptiveFrequencyGrid).
 
     Args:
         generalSettings (dict): General settings of the SG.
         sweepScheme (dict): Definition of the sweep scheme.
         calibrationValues (dict): Calibrations values.
         comment (dict, optional): Comments. Defaults to {}.
-        iterations (int, optional): Number of iterations for measuring the transfer function. Defaults to 1.
+        iterations (int, optional): Number of iterations for measuring the transfer function. Maximum number of iterations if tolerance is set. Defaults to 1.
         resistance (float, optional): Resistance in Ohm. Defaults to 50.
         save (bool, optional): True: Save measurement data. False: Data is not saved. Defaults to True.
+        tolerance (float, optional): Tolerated relative deviation from the target junction amplitude. Iterations at constant junction amplitude only re-measure points outside the tolerance and stop once all points have converged. Defaults to None: All points are measured in every iteration.
+        checkpoint (str, optional): Path and filename of a checkpoint file, which is written after the power sweep and after every iteration. If the file exists, 
+                                    the interrupted measurement is resumed after its last completed iteration. The file is deleted when the measurement is complete. Defaults to None.
+
+    Raises:
+        Exception: Checkpoint of a different measurement.
 
     Returns:
         ndarrays: Frequencies, Transmission values.
     """    
+    # Checkpoint of an interrupted measurement: Scheme, settings and arguments must be unchanged
+    checkpointState = {'GeneralSettings': json.loads(json.dumps(generalSettings)), 'Scheme': json.loads(json.dumps(sweepScheme)), 'calibrationValues': json.loads(json.dumps(calibrationValues)),
+                        'iterations': iterations, 'resistance': resistance, 'tolerance': tolerance}
+    resumeState = None
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as json_file:
+            resumeState = json.load(json_file)
+        if any(resumeState[key] != value for key, value in checkpointState.items()):
+            raise Exception('Checkpoint {} belongs to a different measurement.'.format(checkpoint))
+        checkpointState = resumeState
+        print('Resuming after iteration {} of {}.'.format(resumeState['completedIterations'], iterations) if 'completedIterations' in resumeState else 'Resuming after the power sweep.')
+
     # Calculate voltage calibration factors for one fixed frequency
     sourceVoltage = convertPowerToVoltage(calibrationValues['SourcePower'], resistance)
     calFactorSourceToJunction = calibrationValues['junctionAmplitude (V)'] / sourceVoltage
 
     # Measure power sweep at fixed frequency
-    power, lockinSignal = measurePowerSweep(generalSettings, sweepScheme, save=False)
+    if 'powerSweep' in checkpointState:
+        power = np.array(checkpointState['powerSweep']['Power (dBm)'])
+        lockinSignal = np.array(checkpointState['powerSweep']['LockIn Signal (V)'])
+    else:
+        power, lockinSignal = measurePowerSweep(generalSettings, sweepScheme, save=False)
+        if checkpoint is not None:
+            checkpointState['powerSweep'] = {'Power (dBm)': power.tolist(), 'LockIn Signal (V)': lockinSignal.tolist()}
+            writeJSONAtomic(checkpoint, checkpointState)
 
     # Load Crosstalk Signal
-    if generalSettings['UseCT'] == True:
-        ctFrequency, ctScalingFactorsPowerFunction, coeffPolyFitCrosstalk = loadCrosstalkSignal(generalSettings)
-        polyConvVoltageToLockIn = np.poly1d(coeffPolyFitCrosstalk)
-        # Correct for Crosstalk
-        # ctScalingFactor = np.interp(sweepScheme['frequencySweepPower (dBm)'], ctFrequency, ctScalingFactorsPowerFunction)
-        ctScalingFactor = np.interp(sweepScheme['powerSweepFrequency (Hz)'], ctFrequency, ctScalingFactorsPowerFunction)
-        sourceVoltageList = convertPowerToVoltage(power)
-        calcLockinSignalCrosstalk = polyConvVoltageToLockIn(sourceVoltageList) * ctScalingFactor
-        lockinSignal = lockinSignal - calcLockinSignalCrosstalk
+    crosstalk = loadCalibrationModel(generalSettings, useTF=False)
+    # Correct for Crosstalk
+    calcLockinSignalCrosstalk = crosstalk.calculateCrosstalk(sweepScheme['powerSweepFrequency (Hz)'], power)
+    lockinSignal = lockinSignal - calcLockinSignalCrosstalk
 
     # Convert Source Power to Junction Voltage
     junctionVoltages = convertPowerToVoltage(power)*calFactorSourceToJunction
@@ -328,12 +463,7 @@ def measureTransferFunction(generalSettings, sweepScheme, calibrationValues, com
     coeffPolyFit = np.polyfit(lockinSignal, junctionVoltages, 3)
     polyConvLockInToJunctionAmplitude = np.poly1d(coeffPolyFit)
 
-    plt.figure()
-    plt.plot(lockinSignal, junctionVoltages, '.')
-    plt.plot(lockinSignal, polyConvLockInToJunctionAmplitude(lockinSignal))
-    plt.xlabel('LockIn Signal (V)')
-    plt.ylabel('Junction Amplitude (V)')
-    plt.show()
+    showPlot(generalSettings, 'transferFunctionFit', drawPolynomialFit, lockinSignal, junctionVoltages, coeffPolyFit, 'LockIn Signal (V)', 'Junction Amplitude (V)', experimentType='TF')
 
     # Calculcate calibration factor LockIn to Current change
     lockinSignalCalibrationPower = np.interp(calibrationValues['SourcePower'], power, lockinSignal)
@@ -342,52 +472,103 @@ def measureTransferFunction(generalSettings, sweepScheme, calibrationValues, com
     if generalSettings['UseTF'] == True:
         # Load Transfer Function
         tfFrequency, tfTransmission, _, _ = loadTransferFunction(generalSettings)
-    
-    for i in range(iterations):
-        if i == 0 and generalSettings['UseTF'] == False:
+
+    def measureFixedPower(frequencyList):
+        # Measure frequency list at fixed power
+        powerList = np.full(len(frequencyList), sweepScheme['frequencySweepPower (dBm)'], dtype=np.float64)
+        _, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=frequencyList, powList=powerList, save=False)
+        # Correct for Crosstalk
+        calcLockinSignalCrosstalk = crosstalk.calculateCrosstalk(frequencyList, powerList)
+        lockinSignal = lockinSignal - calcLockinSignalCrosstalk
+        # Convert LockIn Signal to Junction Voltage and Calculate transmission
+        transmission = polyConvLockInToJunctionAmplitude(lockinSignal) / convertPowerToVoltage(powerList)
+        return {'Frequency (Hz)': frequencyList, 'LockIn Signal (V)': lockinSignal, 'Crosstalk Signal (V)': calcLockinSignalCrosstalk, 'Transmission (normalized)': transmission}
+
+    measuredPoints = []
+    converged = None
+    junctionAmplitudeError = None
+    convergenceHistory = []
+    firstIteration = 0
+    if 'completedIterations' in checkpointState:
+        firstIteration = checkpointState['completedIterations']
+        state = checkpointState['State']
+        tfFrequency = np.array(state['Frequency (Hz)'])
+        tfTransmission = np.array(state['Transmission (normalized)'])
+        lockinSignal = np.array(state['LockIn Signal (V)'])
+        calcLockinSignalCrosstalk = np.array(state['Crosstalk Signal (V)'])
+        if state['converged'] is not None:
+            converged = np.array(state['converged'], dtype=bool)
+            junctionAmplitudeError = np.array(state['Junction Amplitude Error (relative)'], dtype=np.float64)
+        convergenceHistory = state['convergenceHistory']
+        measuredPoints = state['measuredPoints']
+        if tolerance is not None and converged is not None and np.all(converged):
+            firstIteration = iterations
+    for i in range(firstIteration, iterations):
+        if i == 0 and generalSettings['UseTF'] == False and 'adaptiveTolerance (relative)' in sweepScheme:
+            # Measure frequency sweep at fixed power on an adaptively refined frequency grid
+            results, measuredPoints = measureAdaptiveFrequencyGrid(sweepScheme, measureFixedPower, 'Transmission (normalized)')
+            tfFrequency = results['Frequency (Hz)']
+            lockinSignal = results['LockIn Signal (V)']
+            calcLockinSignalCrosstalk = results['Crosstalk Signal (V)']
+            tfTransmission = results['Transmission (normalized)']
+        elif i == 0 and generalSettings['UseTF'] == False:
             # Measure frequency sweep at fixed power
             tfFrequency, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, save=False)
             # Correct for Crosstalk
-            if generalSettings['UseCT'] == True:           
-                sourceVoltage = convertPowerToVoltage(sweepScheme['frequencySweepPower (dBm)'])
-                ctScalingFactors = np.interp(tfFrequency, ctFrequency, ctScalingFactorsPowerFunction)
-                calcLockinSignalCrosstalk = polyConvVoltageToLockIn(sourceVoltage) * ctScalingFactors
-                lockinSignal = lockinSignal - calcLockinSignalCrosstalk
+            calcLockinSignalCrosstalk = crosstalk.calculateCrosstalk(tfFrequency, sweepScheme['frequencySweepPower (dBm)'])
+            lockinSignal = lockinSignal - calcLockinSignalCrosstalk
             # Convert LockIn Signal to Junction Voltage and Calculate transmission
             junctionVoltageMeasured = polyConvLockInToJunctionAmplitude(lockinSignal)
             tfTransmission = junctionVoltageMeasured / convertPowerToVoltage(sweepScheme['frequencySweepPower (dBm)'])
         else:
+            # Points to be measured: All points or only points which have not converged yet
+            if converged is None:
+                converged = np.zeros(len(tfFrequency), dtype=bool)
+                junctionAmplitudeError = np.full(len(tfFrequency), np.nan)
+            if tolerance is None:
+                remaining = np.ones(len(tfFrequency), dtype=bool)
+            else:
+                remaining = ~converged
+            if np.all(remaining):
+                lockinSignal = np.zeros(len(tfFrequency))
+                calcLockinSignalCrosstalk = np.zeros(len(tfFrequency))
+            frequencyList = tfFrequency[remaining]
+
             # Measure frequency sweep at constant junction amplitude
-            powerList = calculatePowerConstantJunctionAmplitude(tfFrequency, sweepScheme['junctionAmplitude (V)'], tfFrequency, tfTransmission)
-            plt.figure()
-            plt.plot(tfFrequency, powerList, '.')
-            plt.xlabel('Frequency (Hz)')
-            plt.ylabel('Source Power (dBm)')
-            plt.axhline(y = generalSettings['SG_PowerMin (dBm)'], color = 'black', linestyle = '--')
-            plt.axhline(y = generalSettings['SG_PowerMax (dBm)'], color = 'black', linestyle = '--')
-            plt.show()
+            powerList = calculatePowerConstantJunctionAmplitude(frequencyList, sweepScheme['junctionAmplitude (V)'], tfFrequency, tfTransmission)
+            showPlot(generalSettings, 'sourcePower_iteration{}'.format(i), drawSourcePower, frequencyList, powerList, generalSettings['SG_PowerMin (dBm)'], generalSettings['SG_PowerMax (dBm)'], experimentType='TF')
             
-            tfFrequency, lockinSignal = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=tfFrequency, powList=powerList, save=False)
+            _, lockinSignalList = measureFrequencySweep(generalSettings, sweepScheme, mode='LIST', freqList=frequencyList, powList=powerList, save=False)
             # Correct for Crosstalk
-            if generalSettings['UseCT'] == True:         
-                sourceVoltageList = convertPowerToVoltage(powerList)
-                ctScalingFactors = np.interp(tfFrequency, ctFrequency, ctScalingFactorsPowerFunction)
-                calcLockinSignalCrosstalk = polyConvVoltageToLockIn(sourceVoltageList) * ctScalingFactors
-                lockinSignal = lockinSignal - calcLockinSignalCrosstalk         
+            calcLockinSignalCrosstalk[remaining] = crosstalk.calculateCrosstalk(frequencyList, powerList)
+            lockinSignal[remaining] = lockinSignalList - calcLockinSignalCrosstalk[remaining]
             # Convert LockIn Signal to Junction Voltage and Calculate transmission
-            junctionVoltageMeasured = polyConvLockInToJunctionAmplitude(lockinSignal)
-            tfTransmission = junctionVoltageMeasured / convertPowerToVoltage(powerList)
+            junctionVoltageMeasured = polyConvLockInToJunctionAmplitude(lockinSignal[remaining])
+            tfTransmission[remaining] = junctionVoltageMeasured / convertPowerToVoltage(powerList)
+
+            # Deviation from the target junction amplitude
+            junctionAmplitudeError[remaining] = np.abs(junctionVoltageMeasured - sweepScheme['junctionAmplitude (V)']) / np.abs(sweepScheme['junctionAmplitude (V)'])
+            if tolerance is not None:
+                converged[remaining] = junctionAmplitudeError[remaining] <= tolerance
+            convergenceHistory.append({'iteration': i, 'measuredPoints': int(np.sum(remaining)), 'convergedPoints': int(np.sum(converged)),
+                                    'maxError': float(np.nanmax(junctionAmplitudeError)), 'meanError': float(np.nanmean(junctionAmplitudeError))})
+            print('Iteration {}: {} points measured, {} of {} points converged, maximum error {:.3g}'.format(i, np.sum(remaining), np.sum(converged), len(converged), np.nanmax(junctionAmplitudeError)))
+            publishProgress(generalSettings, 'transferFunction', dict(convergenceHistory[-1], event='iteration', iterations=iterations))
+        if checkpoint is not None:
+            checkpointState['completedIterations'] = i + 1
+            checkpointState['State'] = {'Frequency (Hz)': np.asarray(tfFrequency).tolist(), 'Transmission (normalized)': np.asarray(tfTransmission).tolist(), 
+                                        'LockIn Signal (V)': np.asarray(lockinSignal).tolist(), 'Crosstalk Signal (V)': np.asarray(calcLockinSignalCrosstalk).tolist(),
+                                        'converged': converged.tolist() if converged is not None else None, 
+                                        'Junction Amplitude Error (relative)': junctionAmplitudeError.tolist() if junctionAmplitudeError is not None else None,
+                                        'convergenceHistory': convergenceHistory, 'measuredPoints': measuredPoints}
+            writeJSONAtomic(checkpoint, checkpointState)
+        if tolerance is not None and converged is not None and np.all(converged):
+            break
     
     # Clip tranmission values between [0,1]
     tfTransmission = np.clip(tfTransmission, 0.0001, 1)
 
-    plt.figure()
-    plt.plot(tfFrequency, lockinSignal + calcLockinSignalCrosstalk, '.')
-    plt.plot(tfFrequency, lockinSignal, '.')
-    plt.plot(tfFrequency, calcLockinSignalCrosstalk, '.', c='black')
-    plt.xlabel('Frequency (Hz)')
-    plt.ylabel('Lockin Signal (V)')
-    plt.show()
+    showPlot(generalSettings, 'crosstalkCorrection', drawCrosstalkCorrection, tfFrequency, lockinSignal, calcLockinSignalCrosstalk, experimentType='TF')
 
     # plt.figure()
     # plt.plot(tfFrequency, tfTransmission, '.')
@@ -397,14 +578,108 @@ def measureTransferFunction(generalSettings, sweepScheme, calibrationValues, com
 
     # Save data
     if save == True:
-        additionalInformation = {'coeffPolyFit': coeffPolyFit.tolist(), 'calFactorLockInToCurrent': calFactorLockInToCurrent, 'iterations': iterations, 'resistance': resistance, 'calibrationValues': calibrationValues}
+        additionalInformation = {'coeffPolyFit': coeffPolyFit.tolist(), 'calFactorLockInToCurrent': calFactorLockInToCurrent, 'iterations': iterations, 'resistance': resistance, 'calibrationValues': calibrationValues, 'measuredPoints': measuredPoints,
+                                'tolerance': tolerance, 'convergenceHistory': convergenceHistory}
         data = {'Frequency (Hz)': tfFrequency.tolist(), 'Transmission (normalized)': tfTransmission.tolist()}
+        if junctionAmplitudeError is not None:
+            data['Junction Amplitude Error (relative)'] = junctionAmplitudeError.tolist()
         saveData(generalSettings, sweepScheme, comment, additionalInformation, data, experimentType='TF')
 
+    # Measurement complete
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
     return tfFrequency, tfTransmission
 
 
-def measurePowerSweep(generalSettings, sweepScheme, comment={}, save=True):
+def averageRepeatedSweep(generalSettings, blocks, numberPoints, repetitions, targetStandardError=None, outlierThreshold=None, minimumPasses=3, rawTrace=None):
+    """Decodes and averages repeated passes of a sweep block by block. Each pass is binned as soon as it is complete.
+    The evaluation stops after the given number of passes or as soon as the standard error of every point reaches the target.
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        blocks (iterable): Blocks of DAQ data: Lock-in signal and signal valid output (e.g. stream of the DAQ or recorded trace).
+        numberPoints (int): Number of points per pass.
+        repetitions (int): Maximum number of passes.
+        targetStandardError (float, optional): Target standard error of the lock-in signal for every point. Defaults to None: All passes are evaluated.
+        outlierThreshold (float, optional): Threshold for outlier rejection in standard deviations (see SweepAverager). Defaults to None: No outlier rejection.
+        minimumPasses (int, optional): Minimum number of passes before the evaluation can be stopped early. Defaults to 3.
+        rawTrace (list, optional): If a list is given, all used blocks are appended. Defaults to None.
+
+    Returns:
+        SweepAverager: Averaged passes.
+    """    
+    decoder = SignalValidDecoder()
+    averager = SweepAverager(numberPoints, generalSettings['LockIn_DataDropOff'], outlierThreshold)
+    stopped = False
+    for block in blocks:
+        if rawTrace is not None:
+            rawTrace.append(block)
+        lockinData, stepIndex = decoder.process(block[0], block[1])
+        if averager.add(lockinData, stepIndex) > 0:
+            standardError = averager.statistics.getStandardError()
+            maxStandardError = np.nanmax(standardError) if np.any(~np.isnan(standardError)) else np.nan
+            print('Pass {}/{}: maximum standard error {:.3g} V, {} passes averaged'.format(averager.getNumberPasses(), repetitions, maxStandardError, averager.getNumberAcceptedPasses()))
+            publishProgress(generalSettings, 'rfSweep', {'event': 'pass', 'pass': averager.getNumberPasses(), 'passes': repetitions, 'maxStandardError (V)': maxStandardError, 
+                                                         'acceptedPasses': averager.getNumberAcceptedPasses()})
+            if averager.getNumberPasses() >= repetitions:
+                stopped = True
+                break
+            if targetStandardError is not None and averager.getNumberPasses() >= minimumPasses and np.all(standardError <= targetStandardError):
+                stopped = True
+                break
+
+    # End of the data: The last pass is only binned by finish
+    if not stopped:
+        averager.finish()
+
+    return averager
+
+def acquireRepeatedSweep(generalSettings, daq, valueList, dwell, repetitions, targetStandardError=None, outlierThreshold=None, minimumPasses=3, rawTrace=None):
+    """Acquires repeated passes of a running sweep as a continuous stream and averages them (see averageRepeatedSweep).
+
+    Args:
+        generalSettings (dict): General settings of the SG.
+        daq (NIDAQ): DAQ box.
+        valueList (ndarray): Frequency or power values of one pass.
+        dwell (float): Dwell time per point in seconds.
+        repetitions (int): Maximum number of passes.
+        targetStandardError (float, optional): Target standard error of the lock-in signal for every point. Defaults to None: All passes are acquired.
+        outlierThreshold (float, optional): Threshold for outlier rejection in standard deviations (see SweepAverager). Defaults to None: No outlier rejection.
+        minimumPasses (int, optional): Minimum number of passes before the acquisition can be stopped early. Defaults to 3.
+        rawTrace (list, optional): If a list is given, all acquired blocks are appended. Defaults to None.
+
+    Returns:
+        SweepAverager: Averaged passes.
+    """    
+    channels = [generalSettings['DAQ_InputChannel_LockIn'], generalSettings['DAQ_InputChannel_SignalValid']]
+    stream = daq.streamAnalog(channels, dwell, repetitions * len(valueList) * dwell)
+    try:
+        averager = averageRepeatedSweep(generalSettings, stream, len(valueList), repetitions, targetStandardError, outlierThreshold, minimumPasses, rawTrace)
+    finally:
+        stream.close()
+
+    return averager
+
+def buildSweepList(freqList, powList, shape='SAWT'):
+    """Builds the frequency and power list for a list sweep.
+
+    Args:
+        freqList (ndarray): List of frequencies.
+        powList (ndarray): List of powers.
+        shape (str, optional): 'SAWT': List as given. 'TRI': List followed by its reverse (turning point only once). Defaults to 'SAWT'.
+
+    Returns:
+        ndarrays: Frequency list, Power list.
+    """    
+    freqList = np.asarray(freqList, dtype=np.float64)
+    powList = np.asarray(powList, dtype=np.float64)
+    if shape == 'TRI':
+        freqList = np.concatenate((freqList, freqList[-2::-1]))
+        powList = np.concatenate((powList, powList[-2::-1]))
+    return freqList, powList
+
+def measurePowerSweep(generalSettings, sweepScheme, comment={}, save=True, shape='SAWT', repetitions=1, targetStandardError=None, outlierThreshold=None, recordRaw=False, returnPasses=False):
     """Performs a power sweep at a fixed frequency using lock-in detection technique.
 
     Args:
@@ -412,16 +687,28 @@ def measurePowerSweep(generalSettings, sweepScheme, comment={}, save=True):
         sweepScheme (dict): Definition of the sweep scheme.
         comment (dict, optional): Comments. Defaults to {}.
         save (bool, optional): True: Save measurement data. False: Data is not saved. Defaults to True.
+        shape (str, optional): 'SAWT': Sawtooth, one pass. 'TRI': Triangle, up and down pass are measured and averaged. Defaults to 'SAWT'.
+        repetitions (int, optional): Number of passes of the sweep, which are acquired as one stream and averaged (see acquireRepeatedSweep). Only for shape 'SAWT'. Defaults to 1.
+        targetStandardError (float, optional): Repeated sweeps stop as soon as the standard error of every point reaches this value. Defaults to None.
+        outlierThreshold (float, optional): Threshold for outlier rejection of repeated sweeps in standard deviations. Defaults to None: No outlier rejection.
+        recordRaw (bool, optional): True: The raw DAQ traces are saved next to the JSON file (see saveRawTraces) for a later evaluation (see Replay). Defaults to False.
+        returnPasses (bool, optional): True: The up and down pass of a triangle sweep are returned additionally. Defaults to False.
+
+    Raises:
+        Exception: Repeated triangle sweeps.
 
     Returns:
-        ndarrays: Power values, Lock-In signal.
+        ndarrays: Power values, Lock-In signal. With returnPasses additionally a dict with the lock-in signal of the up and down pass 
+                  ('LockIn Signal Up (V)', 'LockIn Signal Down (V)'), which is empty for shape 'SAWT'.
     """    
+    if shape == 'TRI' and repetitions > 1:
+        raise Exception('Repeated sweeps are only supported for sawtooth sweeps.')
+
     # DAQ
     daq = NIDAQ(generalSettings['DAQ_Device'], samplingRate=generalSettings['DAQ_SamplingRate (1/s)'])
 
     # Connect SG
-    sg = SMB100B(generalSettings['SG_VisaResource'])
-    sg.connect()
+    sg = connectInstrument(SMB100B, generalSettings['SG_VisaResource'])
     sg.query('*IDN?')
 
     # Limit output powers
@@ -447,9 +734,10 @@ def measurePowerSweep(generalSettings, sweepScheme, comment={}, save=True):
     sg.setPowerSweepStop(sweepScheme['endPower (dBm)'])
     sg.setPowerSweepStepLog(sweepScheme['powerStep (dBm)'])
     sg.setPowerSweepDwellTime(sweepScheme['acquisitionTime (s)'])
-    sg.setPowerSweepShape('SAWT')
+    sg.setPowerSweepShape(shape)
 
-    time.sleep(5)
+    # Check if ready
+    waitUntilReady(sg)
 
     # Switch on RF
     sg.switchRFOutputOn()
@@ -459,24 +747,27 @@ def measurePowerSweep(generalSettings, sweepScheme, comment={}, save=True):
 
     # Acquire Data
     numberPoints = int((sweepScheme['endPower (dBm)'] - sweepScheme['startPower (dBm)'])/sweepScheme['powerStep (dBm)']) + 1
-    acquisitionTime = numberPoints * sweepScheme['acquisitionTime (s)']
-    daqData = daq.readAnalog([generalSettings['DAQ_InputChannel_LockIn'], generalSettings['DAQ_InputChannel_SignalValid']], acquisitionTime)
+    numberSteps = 2*numberPoints - 1 if shape == 'TRI' else numberPoints
     powerList = np.linspace(sweepScheme['startPower (dBm)'], sweepScheme['endPower (dBm)'], numberPoints)
+    if repetitions > 1:
+        rawBlocks = []
+        averager = acquireRepeatedSweep(generalSettings, daq, powerList, sweepScheme['acquisitionTime (s)'], repetitions, targetStandardError, outlierThreshold, rawTrace=rawBlocks)
+        daqData = np.concatenate(rawBlocks, axis=1) if len(rawBlocks) > 0 else np.zeros((2, 0))
+    else:
+        acquisitionTime = numberSteps * sweepScheme['acquisitionTime (s)']
+        daqData = daq.readAnalog([generalSettings['DAQ_InputChannel_LockIn'], generalSettings['DAQ_InputChannel_SignalValid']], acquisitionTime)
 
     # Convert to Power vs LockIn Signal
-    lockinData = daqData[0,:]
-    powerData = convertSignalValid(daqData[1,:], powerList)
-    power = np.zeros(len(powerList))
-    lockinSignal = np.zeros(len(powerList))
-    for i in range(len(powerList)):
-        idx = np.where(powerList[i] == powerData)[0]
-        if len(idx) > 0:
-            power[i] = powerList[i]
-            # Drop some percentage of LockIn Data at beginning
-            if generalSettings['LockIn_DataDropOff'] > 0 and generalSettings['LockIn_DataDropOff'] < 1:
-                stardIdxDrop = int(len(idx) * generalSettings['LockIn_DataDropOff'])
-                idx = idx[stardIdxDrop:-1]
-            lockinSignal[i] = np.mean(lockinData[idx])
+    if repetitions > 1:
+        numberPasses = averager.statistics.getCount()
+        power = np.where(numberPasses > 0, powerList, 0)
+        lockinSignal = np.nan_to_num(averager.statistics.getMean())
+        standardError = averager.statistics.getStandardError()
+    elif shape == 'TRI':
+        power, lockinSignal, lockinSignalUp, lockinSignalDown, fitResidual, timeConstant = evaluateTriangleSweepData(generalSettings, daqData, powerList, returnFit=True)
+    else:
+        power, lockinSignal, fitResidual, timeConstant = evaluateSweepData(generalSettings, daqData, powerList, returnFit=True)
+    publishProgress(generalSettings, 'rfSweep', {'event': 'part', 'part': 0, 'parts': 1, 'Power (dBm)': power, 'LockIn Signal (V)': lockinSignal})
 
     # Turn off all signals and switch to CW mode
     sg.switchRFOutputOff()
@@ -485,18 +776,36 @@ def measurePowerSweep(generalSettings, sweepScheme, comment={}, save=True):
     sg.setRFPowerMode('CW')
 
     # Disconnect
-    sg.disconnect()
+    disconnectInstrument(sg)
 
     # Save data
     if save == True:
-        additionalInformation = {}
+        additionalInformation = {'shape': shape, 'rawTraces': recordRaw}
         data = {'Power (dBm)': power.tolist(), 'LockIn Signal (V)': lockinSignal.tolist()}
-        saveData(generalSettings, sweepScheme, comment, additionalInformation, data)
-
+        if shape == 'TRI':
+            data['LockIn Signal Up (V)'] = lockinSignalUp.tolist()
+            data['LockIn Signal Down (V)'] = lockinSignalDown.tolist()
+        if repetitions > 1:
+            additionalInformation.update({'repetitions': repetitions, 'targetStandardError': targetStandardError, 'outlierThreshold': outlierThreshold,
+                                        'numberPasses': averager.getNumberPasses(), 'acceptedPasses': averager.getNumberAcceptedPasses(), 'rejectedPasses': averager.rejectedPasses, 'rejectedPoints': averager.rejectedPoints})
+            data['LockIn Signal Std. Error (V)'] = standardError.tolist()
+            data['Number of Passes (1)'] = numberPasses.tolist()
+        elif 'LockIn_FilterOrder' in generalSettings:
+            additionalInformation['lockinTimeConstant (s)'] = timeConstant
+            data['LockIn Fit Residual (V)'] = fitResidual.tolist()
+        filename = saveData(generalSettings, sweepScheme, comment, additionalInformation, data)
+        if recordRaw:
+            # Written in the background (see flushBackgroundWriter)
+            getBackgroundWriter().submit(saveRawTraces, filename, [daqData], daq.getSamplingRate(), ['LockIn', 'SignalValid'], {'values': powerList, 'parts': [[0, numberPoints]]})
+
+    if returnPasses:
+        # Up and down pass of a triangle sweep
+        passes = {'LockIn Signal Up (V)': lockinSignalUp, 'LockIn Signal Down (V)': lockinSignalDown} if shape == 'TRI' else {}
+        return power, lockinSignal, passes
     return power, lockinSignal
 
 
-def measureFrequencySweep(generalSettings, sweepScheme, mode='SWE', freqList=None, powList=None, comment={}, save=True):
+def measureFrequencySweep(generalSettings, sweepScheme, mode='SWE', freqList=None, powList=None, comment={}, save=True, shape='SAWT', repetitions=1, targetStandardError=None, outlierThreshold=None, recordRaw=False, returnPasses=False):
     """Performs a frequency sweep using lock-in detection technique.
 
     Args:
@@ -507,16 +816,31 @@ def measureFrequencySweep(generalSettings, sweepScheme, mode='SWE', freqList=Non
         powList (ndarray, optional): List of powers. Defaults to None.
         comment (dict, optional): Comments. Defaults to {}.
         save (bool, optional): True: Save measurement data. False: Data is not saved. Defaults to True.
+        shape (str, optional): 'SAWT': Sawtooth, one pass. 'TRI': Triangle, up and down pass are measured and averaged. In 'LIST' mode the list is followed by its reverse. Defaults to 'SAWT'.
+        repetitions (int, optional): Number of passes of the sweep or list, which are acquired as one stream and averaged (see acquireRepeatedSweep). Only for shape 'SAWT'. Defaults to 1.
+        targetStandardError (float, optional): Repeated sweeps stop as soon as the standard error of every point reaches this value. Defaults to None.
+        outlierThreshold (float, optional): Threshold for outlier rejection of repeated sweeps in standard deviations. Defaults to None: No outlier rejection.
+        recordRaw (bool, optional): True: The raw DAQ traces of all list parts are saved next to the JSON file (see saveRawTraces) for a later evaluation (see Replay). Defaults to False.
+        returnPasses (bool, optional): True: The up and down pass of a triangle sweep are returned additionally. Defaults to False.
+
+    Note:
+        With 'Progress_Port' in the general settings every list part and every pass of repeated sweeps is published on a local TCP port (topic 'rfSweep', see ProgressPublisher).
+
+    Raises:
+        Exception: Repeated triangle sweeps.
 
     Returns:
-        ndarrays: Frequency values, Lock-In signal.
+        ndarrays: Frequency values, Lock-In signal. With returnPasses additionally a dict with the lock-in signal of the up and down pass 
+                  ('LockIn Signal Up (V)', 'LockIn Signal Down (V)'), which is empty for shape 'SAWT'.
     """    
+    if shape == 'TRI' and repetitions > 1:
+        raise Exception('Repeated sweeps are only supported for sawtooth sweeps.')
+
     # DAQ
     daq = NIDAQ(generalSettings['DAQ_Device'], samplingRate=generalSettings['DAQ_SamplingRate (1/s)'])
 
     # Connect SG
-    sg = SMB100B(generalSettings['SG_VisaResource'])
-    sg.connect()
+    sg = connectInstrument(SMB100B, generalSettings['SG_VisaResource'])
     sg.query('*IDN?')
 
     # Limit output powers
@@ -548,15 +872,21 @@ def measureFrequencySweep(generalSettings, sweepScheme, mode='SWE', freqList=Non
         sg.setFrequencySweepStop(sweepScheme['endFrequency (Hz)'])
         sg.setFrequencySweepStepLinear(sweepScheme['frequencyStep (Hz)'])
         sg.setFrequencySweepDwellTime(sweepScheme['acquisitionTime (s)'])
-        sg.setFrequencySweepShape('SAWT')
+        sg.setFrequencySweepShape(shape)
     elif mode == 'LIST':
-        # Setup List Sweep
+        # Setup List Sweep, lists exceeding the maximum list length are split into several parts
+        listUploads = []
         if freqList is not None and powList is not None:
             if len(freqList) == len(powList):
                 numberPoints = len(freqList)
-                sg.defineFrequencyPowerList('tf', freqList.tolist(), powList.tolist(), sweepScheme['acquisitionTime (s)'])
+                # Triangle: each part is followed by its reverse
+                maxPartLength = (sg.maxListLength + 1)//2 if shape == 'TRI' else sg.maxListLength
+                listParts = [(start, min(start + maxPartLength, numberPoints)) for start in range(0, numberPoints, maxPartLength)]
+                start, stop = listParts[0]
+                listUploads.append(sg.defineFrequencyPowerList(None, *buildSweepList(freqList[start:stop], powList[start:stop], shape), sweepScheme['acquisitionTime (s)']))
 
-    time.sleep(5)
+    # Check if ready
+    waitUntilReady(sg)
 
     # Switch on RF
     sg.switchRFOutputOn()    
@@ -569,27 +899,59 @@ def measureFrequencySweep(generalSettings, sweepScheme, mode='SWE', freqList=Non
         sg.setRFFrequencyMode('LIST')
 
     # Acquire Data
-    acquisitionTime = numberPoints * sweepScheme['acquisitionTime (s)']
-    daqData = daq.readAnalog([generalSettings['DAQ_InputChannel_LockIn'], generalSettings['DAQ_InputChannel_SignalValid']], acquisitionTime)
     if mode == 'SWE':
         frequencyList = np.linspace(sweepScheme['startFrequency (Hz)'], sweepScheme['endFrequency (Hz)'], numberPoints)
+        listParts = [(0, numberPoints)]
     elif mode == 'LIST':
         frequencyList = freqList
-    
-    # Convert to Frequency vs LockIn Signal
-    lockinData = daqData[0,:]
-    frequencyData = convertSignalValid(daqData[1,:], frequencyList)
-    frequency = np.zeros(len(frequencyList))
-    lockinSignal = np.zeros(len(frequencyList))
-    for i in range(len(frequencyList)):
-        idx = np.where(frequencyList[i] == frequencyData)[0]
-        if len(idx) > 0:
-            frequency[i] = frequencyList[i]
-            # Drop some percentage of LockIn Data at beginning
-            if generalSettings['LockIn_DataDropOff'] > 0 and generalSettings['LockIn_DataDropOff'] < 1:
-                stardIdxDrop = int(len(idx) * generalSettings['LockIn_DataDropOff'])
-                idx = idx[stardIdxDrop:-1]
-            lockinSignal[i] = np.mean(lockinData[idx])
+    frequency = np.zeros(numberPoints)
+    lockinSignal = np.zeros(numberPoints)
+    lockinSignalUp = np.zeros(numberPoints)
+    lockinSignalDown = np.zeros(numberPoints)
+    standardError = np.full(numberPoints, np.nan)
+    numberPasses = np.zeros(numberPoints, dtype=int)
+    rejectedPasses = []
+    fitResidual = np.full(numberPoints, np.nan)
+    timeConstants = []
+    rawTraces = []
+
+    def publishPart(n, start, stop, partStartTime):
+        # Publish progress (see ProgressPublisher)
+        publishProgress(generalSettings, 'rfSweep', {'event': 'part', 'part': n, 'parts': len(listParts), 'Frequency (Hz)': frequency[start:stop], 'LockIn Signal (V)': lockinSignal[start:stop], 
+                                                    'LockIn Signal Std. Error (V)': standardError[start:stop], 'partTime (s)': time.time() - partStartTime})
+
+    for n, (start, stop) in enumerate(listParts):
+        partStartTime = time.time()
+        if n > 0:
+            # Load and start next part of the list
+            sg.setRFFrequencyMode('CW')
+            listUploads.append(sg.defineFrequencyPowerList(None, *buildSweepList(freqList[start:stop], powList[start:stop], shape), sweepScheme['acquisitionTime (s)']))
+            sg.setRFFrequencyMode('LIST')
+        if repetitions > 1:
+            rawBlocks = []
+            averager = acquireRepeatedSweep(generalSettings, daq, frequencyList[start:stop], sweepScheme['acquisitionTime (s)'], repetitions, targetStandardError, outlierThreshold, rawTrace=rawBlocks)
+            if recordRaw:
+                rawTraces.append(np.concatenate(rawBlocks, axis=1) if len(rawBlocks) > 0 else np.zeros((2, 0)))
+            numberPasses[start:stop] = averager.statistics.getCount()
+            frequency[start:stop] = np.where(numberPasses[start:stop] > 0, frequencyList[start:stop], 0)
+            lockinSignal[start:stop] = np.nan_to_num(averager.statistics.getMean())
+            standardError[start:stop] = averager.statistics.getStandardError()
+            rejectedPasses.append(averager.rejectedPasses)
+            publishPart(n, start, stop, partStartTime)
+            continue
+
+        numberSteps = 2*(stop - start) - 1 if shape == 'TRI' else stop - start
+        acquisitionTime = numberSteps * sweepScheme['acquisitionTime (s)']
+        daqData = daq.readAnalog([generalSettings['DAQ_InputChannel_LockIn'], generalSettings['DAQ_InputChannel_SignalValid']], acquisitionTime)
+        if recordRaw:
+            rawTraces.append(daqData)
+        # Convert to Frequency vs LockIn Signal
+        if shape == 'TRI':
+            frequency[start:stop], lockinSignal[start:stop], lockinSignalUp[start:stop], lockinSignalDown[start:stop], fitResidual[start:stop], timeConstant = evaluateTriangleSweepData(generalSettings, daqData, frequencyList[start:stop], returnFit=True)
+        else:
+            frequency[start:stop], lockinSignal[start:stop], fitResidual[start:stop], timeConstant = evaluateSweepData(generalSettings, daqData, frequencyList[start:stop], returnFit=True)
+        timeConstants.append(timeConstant)
+        publishPart(n, start, stop, partStartTime)
 
     # Turn off all signals and switch to CW mode
     sg.switchRFOutputOff()
@@ -598,17 +960,36 @@ def measureFrequencySweep(generalSettings, sweepScheme, mode='SWE', freqList=Non
     sg.setRFFrequencyMode('CW')
 
     # Disconnect
-    sg.disconnect()
+    disconnectInstrument(sg)
 
     # Save data
     if save == True:
         if freqList is None and powList is None:
             freqList = []
             powList = []
-            additionalInformation = {'mode': mode, 'freqList': freqList, 'powList': powList}
+            additionalInformation = {'mode': mode, 'freqList': freqList, 'powList': powList, 'shape': shape}
         else:
-            additionalInformation = {'mode': mode, 'freqList': freqList.tolist(), 'powList': powList.tolist()}
+            additionalInformation = {'mode': mode, 'freqList': freqList.tolist(), 'powList': powList.tolist(), 'listUploads': listUploads, 'shape': shape}
         data = {'Frequency (Hz)': frequency.tolist(), 'LockIn Signal (V)': lockinSignal.tolist()}
-        saveData(generalSettings, sweepScheme, comment, additionalInformation, data)
-
+        if shape == 'TRI':
+            data['LockIn Signal Up (V)'] = lockinSignalUp.tolist()
+            data['LockIn Signal Down (V)'] = lockinSignalDown.tolist()
+        if repetitions > 1:
+            additionalInformation.update({'repetitions': repetitions, 'targetStandardError': targetStandardError, 'outlierThreshold': outlierThreshold, 'rejectedPasses': rejectedPasses})
+            data['LockIn Signal Std. Error (V)'] = standardError.tolist()
+            data['Number of Passes (1)'] = numberPasses.tolist()
+        elif 'LockIn_FilterOrder' in generalSettings:
+            # One time constant for each part of the list
+            additionalInformation['lockinTimeConstant (s)'] = timeConstants
+            data['LockIn Fit Residual (V)'] = fitResidual.tolist()
+        additionalInformation['rawTraces'] = recordRaw
+        filename = saveData(generalSettings, sweepScheme, comment, additionalInformation, data)
+        if recordRaw:
+            # Written in the background (see flushBackgroundWriter)
+            getBackgroundWriter().submit(saveRawTraces, filename, rawTraces, daq.getSamplingRate(), ['LockIn', 'SignalValid'], {'values': frequencyList, 'parts': listParts})
+
+    if returnPasses:
+        # Up and down pass of a triangle sweep
+        passes = {'LockIn Signal Up (V)': lockinSignalUp, 'LockIn Signal Down (V)': lockinSignalDown} if shape == 'TRI' else {}
+        return frequency, lockinSignal, passes
     return frequency, lockinSignal
\ No newline at end of file
@@ -0,0 +1,244 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .Calibration import loadCalibrationModel
+from .DataManagement import *
+from .PumpProbe import calculateBlockStatistics
+from .RF import averageRepeatedSweep, evaluateSweepData, evaluateTriangleSweepData
+from .SignalProcessing import SoftwareLockIn, convertToPolar
+
+
+def getSweepPowerAndFrequency(measurement, values):
+    """Determines the source power and frequency of each point of a recorded power or frequency sweep.
+
+    Args:
+        measurement (dict): Measurement data (see loadData).
+        values (ndarray): Recorded power or frequency values.
+
+    Returns:
+        ndarray, ndarray: Frequency in Hz, Source power in dBm.
+    """    
+    generalSettings = measurement['GeneralSettings']
+    scheme = measurement['Scheme']
+    additionalInformation = measurement['additionalInformation']
+    if 'Power (dBm)' in measurement['Data']:
+        return np.full(len(values), scheme['powerSweepFrequency (Hz)']), np.asarray(values)
+    if 'mode' in additionalInformation and additionalInformation['mode'] == 'LIST':
+        return np.asarray(values), np.asarray(additionalInformation['powList'])
+    if 'frequencySweepPower (dBm)' in scheme:
+        return np.asarray(values), np.full(len(values), scheme['frequencySweepPower (dBm)'])
+    return np.asarray(values), np.full(len(values), generalSettings['SG_PowerMin (dBm)'])
+
+def replaySweep(path, filename, generalSettings={}, calibration=None):
+    """Evaluates the recorded raw traces of a power or frequency sweep (see measurePowerSweep and measureFrequencySweep with recordRaw=True) again.
+    The same decoding and binning as during the measurement is used, e.g. with a different 'LockIn_DataDropOff' or settling model.
+
+    Args:
+        path (str): Path of the file.
+        filename (str): Filename without file extension.
+        generalSettings (dict, optional): General settings replacing the recorded ones, e.g. {'LockIn_DataDropOff': 0.3}. Defaults to {}.
+        calibration (CalibrationModel, optional): Calibration applied to the lock-in signal (see CalibrationModel.applyCalibration). Defaults to None.
+
+    Returns:
+        ndarray, ndarray, dict: Power or frequency values (0 for points without data), Lock-In signal, 
+                                Frequency and source power of every point ('Frequency (Hz)', 'Source Power (dBm)') and with calibration the calibrated data.
+    """    
+    measurement = loadData(path, filename)
+    traces, _, _, arrays = loadRawTraces(path, filename)
+    settings = dict(measurement['GeneralSettings'])
+    settings.update(generalSettings)
+    additionalInformation = measurement['additionalInformation']
+    shape = additionalInformation['shape'] if 'shape' in additionalInformation else 'SAWT'
+    repetitions = additionalInformation['repetitions'] if 'repetitions' in additionalInformation else 1
+
+    valueList = arrays['values']
+    values = np.zeros(len(valueList))
+    lockinSignal = np.zeros(len(valueList))
+    for (start, stop), trace in zip(arrays['parts'], traces):
+        if repetitions > 1:
+            averager = averageRepeatedSweep(settings, [trace], stop - start, repetitions, additionalInformation['targetStandardError'], additionalInformation['outlierThreshold'])
+            values[start:stop] = np.where(averager.statistics.getCount() > 0, valueList[start:stop], 0)
+            lockinSignal[start:stop] = np.nan_to_num(averager.statistics.getMean())
+        elif shape == 'TRI':
+            values[start:stop], lockinSignal[start:stop], _, _ = evaluateTriangleSweepData(settings, trace, valueList[start:stop])
+        else:
+            values[start:stop], lockinSignal[start:stop] = evaluateSweepData(settings, trace, valueList[start:stop])
+
+    frequency, power = getSweepPowerAndFrequency(measurement, valueList)
+    results = {'Frequency (Hz)': frequency, 'Source Power (dBm)': power}
+    if calibration is not None:
+        results.update(calibration.applyCalibration(frequency, power, lockinSignal))
+    return values, lockinSignal, results
+
+def replayPumpProbe(path, filename, blockTime=None, harmonics=None, timeConstant=None, filterOrder=1):
+    """Evaluates the recorded raw traces of a pump-probe measurement (see measurePumpProbe with recordRaw=True) again.
+    Traces of the software lock-in are demodulated again with the given settings.
+
+    Args:
+        path (str): Path of the file.
+        filename (str): Filename without file extension.
+        blockTime (float, optional): Duration of one block in seconds for the standard error estimation. Defaults to None: Recorded block time.
+        harmonics (list, optional): Harmonics demodulated by the software lock-in. Defaults to None: Recorded harmonics.
+        timeConstant (float, optional): Time constant of the low-pass filter of the software lock-in in seconds. Defaults to None: Values of the individual periods.
+        filterOrder (int, optional): Order of the low-pass filter of the software lock-in. Defaults to 1.
+
+    Returns:
+        ndarrays: Sweep numbers, Lock-in signal, Standard error of the lock-in signal. For the software lock-in additionally: R and phase (deg) for all harmonics.
+    """    
+    measurement = loadData(path, filename)
+    traces, samplingRate, _, _ = loadRawTraces(path, filename)
+    additionalInformation = measurement['additionalInformation']
+    softwareLockIn = 'softwareLockIn' in additionalInformation and additionalInformation['softwareLockIn']
+    if blockTime is None:
+        blockTime = additionalInformation['blockTime']
+    if harmonics is None and softwareLockIn:
+        harmonics = additionalInformation['harmonics']
+
+    numberSteps = len(traces)
+    sweepNumber = np.arange(numberSteps)
+    lockinSignal = np.zeros(numberSteps)
+    standardError = np.zeros(numberSteps)
+    if softwareLockIn:
+        harmonicsX = np.zeros((numberSteps, len(harmonics)))
+        harmonicsY = np.zeros((numberSteps, len(harmonics)))
+    for i, trace in enumerate(traces):
+        if softwareLockIn:
+            lockin = SoftwareLockIn(samplingRate, harmonics, timeConstant, filterOrder)
+            t, x, y = lockin.process(trace[0], trace[1])
+            if len(t) == 0:
+                continue
+            harmonicsX[i] = np.mean(x, axis=1)
+            harmonicsY[i] = np.mean(y, axis=1)
+            # Number of periods per block
+            periodsPerBlock = blockTime / np.median(np.diff(t)) if len(t) > 1 else 1
+            lockinSignal[i], standardError[i] = calculateBlockStatistics(x[0], periodsPerBlock)
+        else:
+            lockinSignal[i], standardError[i] = calculateBlockStatistics(trace[0], blockTime * samplingRate)
+
+    if softwareLockIn:
+        harmonicsR, harmonicsPhase = convertToPolar(harmonicsX, harmonicsY)
+        return sweepNumber, lockinSignal, standardError, harmonicsR, harmonicsPhase
+    return sweepNumber, lockinSignal, standardError
+
+def reanalyzeRun(filename, calibrationSettings, interpolation='linear'):
+    """Applies a new transfer function and/or crosstalk calibration to a saved RF run and saves the results next to the original (<run>_recalibrated.json).
+    The uncorrected lock-in signal is taken from the raw traces (see replaySweep), from uncorrected sweeps directly or it is reconstructed 
+    for constant amplitude sweeps by adding the crosstalk of the original calibration again.
+
+    Args:
+        filename (str): Path and filename of the JSON file of the run.
+        calibrationSettings (dict): Calibration settings replacing the ones of the run ('TF_Folder', 'TF_File', 'CT_Folder', 'CT_File', 'UseCT').
+        interpolation (str, optional): 'linear' or 'spline' interpolation in frequency. Defaults to 'linear'.
+
+    Returns:
+        str: Path and filename of the saved results.
+    """    
+    path, name = os.path.split(os.path.abspath(filename))
+    name = os.path.splitext(name)[0]
+    measurement = loadData(path, name)
+    data = measurement['Data']
+    generalSettings = measurement['GeneralSettings']
+    additionalInformation = measurement['additionalInformation']
+
+    if 'rawTraces' in additionalInformation and additionalInformation['rawTraces']:
+        values, lockinSignal, sweep = replaySweep(path, name)
+        frequency, power = sweep['Frequency (Hz)'], sweep['Source Power (dBm)']
+        valid = values != 0
+    elif 'Junction Amplitude (V)' in data:
+        # Constant amplitude sweep: Lock-in signal is corrected by the crosstalk of the original calibration
+        frequency = np.asarray(data['Frequency (Hz)'], dtype=np.float64)
+        if 'Source Power (dBm)' in data:
+            power = np.asarray(data['Source Power (dBm)'], dtype=np.float64)
+        else:
+            power = loadCalibrationModel(generalSettings, interpolation=interpolation).calculateSourcePower(frequency, measurement['Scheme']['junctionAmplitude (V)'])
+        originalCalibration = loadCalibrationModel(generalSettings, useTF=False, interpolation=interpolation)
+        lockinSignal = np.asarray(data['LockIn Signal (V)'], dtype=np.float64) + originalCalibration.calculateCrosstalk(frequency, power)
+        valid = frequency != 0
+    else:
+        values = np.asarray(data['Power (dBm)'] if 'Power (dBm)' in data else data['Frequency (Hz)'], dtype=np.float64)
+        lockinSignal = np.asarray(data['LockIn Signal (V)'], dtype=np.float64)
+        if 'mode' in additionalInformation and additionalInformation['mode'] == 'LIST':
+            frequency, power = getSweepPowerAndFrequency(measurement, additionalInformation['freqList'])
+        elif 'Power (dBm)' in data:
+            numberPoints = int((measurement['Scheme']['endPower (dBm)'] - measurement['Scheme']['startPower (dBm)'])/measurement['Scheme']['powerStep (dBm)']) + 1
+            frequency, power = getSweepPowerAndFrequency(measurement, np.linspace(measurement['Scheme']['startPower (dBm)'], measurement['Scheme']['endPower (dBm)'], numberPoints))
+        else:
+            numberPoints = int((measurement['Scheme']['endFrequency (Hz)'] - measurement['Scheme']['startFrequency (Hz)'])/measurement['Scheme']['frequencyStep (Hz)']) + 1
+            frequency, power = getSweepPowerAndFrequency(measurement, np.linspace(measurement['Scheme']['startFrequency (Hz)'], measurement['Scheme']['endFrequency (Hz)'], numberPoints))
+        valid = values != 0
+
+    settings = dict(generalSettings)
+    settings.update(calibrationSettings)
+    calibration = loadCalibrationModel(settings, useTF='TF_File' in settings, interpolation=interpolation)
+    results = calibration.applyCalibration(frequency, power, lockinSignal)
+    results['Frequency (Hz)'] = np.where(valid, frequency, 0)
+    results['Source Power (dBm)'] = power
+    results['Uncorrected LockIn Signal (V)'] = lockinSignal
+
+    content = {'Timestamp': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()), 'Original': os.path.join(path, name + '.json'), 'OriginalChecksum': measurement['Checksum'] if 'Checksum' in measurement else None,
+                'CalibrationSettings': calibrationSettings, 'interpolation': interpolation, 'Data': {key: np.asarray(value).tolist() for key, value in results.items()}}
+    content['Checksum'] = calculateChecksum(content['Data'])
+    outputFilename = os.path.join(path, '{}_recalibrated.json'.format(name))
+    writeJSONAtomic(outputFilename, content)
+    return outputFilename
+
+def reanalyzeRuns(filenames, calibrationSettings, interpolation='linear', processes=None):
+    """Applies a new calibration to many saved RF runs in parallel on a process pool (see reanalyzeRun).
+
+    Args:
+        filenames (list): Paths and filenames of the JSON files of the runs.
+        calibrationSettings (dict): Calibration settings replacing the ones of the runs ('TF_Folder', 'TF_File', 'CT_Folder', 'CT_File', 'UseCT').
+        interpolation (str, optional): 'linear' or 'spline' interpolation in frequency. Defaults to 'linear'.
+        processes (int, optional): Number of processes. Defaults to None: Number of processors. 1: No process pool.
+
+    Returns:
+        list: Paths and filenames of the saved results (None for failed runs).
+    """    
+    outputFilenames = []
+    if processes == 1:
+        for filename in filenames:
+            try:
+                outputFilenames.append(reanalyzeRun(filename, calibrationSettings, interpolation))
+            except Exception as e:
+                print('Reanalysis of {} failed: {}'.format(filename, e))
+                outputFilenames.append(None)
+        return outputFilenames
+
+    with ProcessPoolExecutor(processes) as executor:
+        futures = [executor.submit(reanalyzeRun, filename, calibrationSettings, interpolation) for filename in filenames]
+        for filename, future in zip(filenames, futures):
+            try:
+                outputFilenames.append(future.result())
+            except Exception as e:
+                print('Reanalysis of {} failed: {}'.format(filename, e))
+                outputFilenames.append(None)
+    return outputFilenames
+
+
+if __name__ == '__main__':
+    # Reanalysis: python -m QuPE.Replay run1.json run2.json --tf-folder TF --tf-file 2023-01-10/10-00-00 --ct-folder CT --ct-file 2023-01-10/11-00-00
+    parser = argparse.ArgumentParser(description='Applies a new transfer function / crosstalk calibration to saved RF runs.')
+    parser.add_argument('files', nargs='+', help='JSON files of the runs')
+    parser.add_argument('--tf-folder', help='Folder of the transfer function')
+    parser.add_argument('--tf-file', help='Transfer function file (without extension)')
+    parser.add_argument('--ct-folder', help='Folder of the crosstalk calibration')
+    parser.add_argument('--ct-file', help='Crosstalk file (without extension)')
+    parser.add_argument('--no-ct', action='store_true', help='No crosstalk correction')
+    parser.add_argument('--interpolation', default='linear', choices=['linear', 'spline'])
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    calibrationSettings = {}
+    if args.tf_file is not None:
+        calibrationSettings.update({'TF_Folder': args.tf_folder, 'TF_File': args.tf_file})
+    if args.ct_file is not None:
+        calibrationSettings.update({'CT_Folder': args.ct_folder, 'CT_File': args.ct_file, 'UseCT': True})
+    if args.no_ct:
+        calibrationSettings['UseCT'] = False
+    outputFilenames = reanalyzeRuns(args.files, calibrationSettings, args.interpolation, args.processes)
+    print('{}/{} runs reanalyzed'.format(sum(f is not None for f in outputFilenames), len(outputFilenames)))
@@ -1,16 +1,30 @@
 # Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
 
+import hashlib
+import time
+
 import numpy as np
 import pyvisa
 
 
 class SMB100B():
+    # Maximum number of entries of a list file
+    maxListLength = 10000
+
     def __init__(self, VisaResourceString):
         self.rm = pyvisa.ResourceManager()
         self.VisaResourceString = VisaResourceString
         self.connected = False
         self.maxOutputPower = None
         self.minOutputPower = None
+        # Transfer list values as binary blocks
+        self.binaryListTransfer = True
+        # List files on the instrument (None: not queried yet)
+        self.listCatalog = None
+        # Maximum number of list files with names derived from their content (qupe_*) kept on the instrument
+        self.maxStoredLists = 32
+        # List files with derived names used since the connection (least recently used first)
+        self.usedLists = []
 
     def connect(self):
         """Connects to the Rohde&Schwarz Signal Generator SMA100B.
@@ -21,6 +35,8 @@ class SMB100B():
             self.inst.read_termination = '\n'
             self.inst.timeout = 5000
             self.connected = True
+            self.listCatalog = None
+            self.usedLists = []
         except pyvisa.VisaIOError:
             resp = 'Could not connect to Rohde&Schwarz SMA100B.\nPlease check the device settings.'
             print(resp)
@@ -52,6 +68,77 @@ class SMB100B():
                 resp = 'Could not write to instrument.'
                 print(resp)
             
+    def writeBinary(self, cmd, values):
+        """Writes values as IEEE 488.2 binary block (8-byte floating point, least significant byte first).
+
+        Args:
+            cmd (str): Command preceding the binary block.
+            values (ndarray): Values to be transferred.
+
+        Returns:
+            int: Number of transferred bytes. None if the transfer failed.
+        """        
+        if self.connected:
+            try:
+                return self.inst.write_binary_values(cmd, values, datatype='d', is_big_endian=False)
+            except pyvisa.Error:
+                resp = 'Could not write binary data to instrument.'
+                print(resp)
+        return None
+
+    def getListCatalog(self):
+        """Returns the names of the list files stored in /var/user/ on the instrument. The catalog is queried once per connection.
+
+        Returns:
+            set: Names of the list files without file extension.
+        """        
+        if self.listCatalog is None:
+            self.write(':MMEM:CDIR "/var/user/"')
+            err, resp = self.query(':SOUR:LIST:CAT?')
+            self.listCatalog = set()
+            if err == False:
+                for name in resp.split(','):
+                    name = name.strip().strip('"')
+                    if name.endswith('.lsw'):
+                        name = name[:-4]
+                    if len(name) > 0:
+                        self.listCatalog.add(name)
+        return self.listCatalog
+
+    def deleteList(self, filename):
+        """Deletes a list file in /var/user/ on the instrument.
+
+        Args:
+            filename (str): Name of the list file without file extension.
+        """        
+        self.write(':SOUR:LIST:DEL "/var/user/{}.lsw"'.format(filename))
+        if self.listCatalog is not None:
+            self.listCatalog.discard(filename)
+        if filename in self.usedLists:
+            self.usedLists.remove(filename)
+
+    def cleanupLists(self, keep=[]):
+        """Deletes list files with names derived from their content (qupe_*, see defineFrequencyPowerList) if more than maxStoredLists are stored.
+        Lists which were not used since the connection are deleted first, then the least recently used lists.
+
+        Args:
+            keep (list, optional): Names of list files which are not deleted (e.g. the selected list). Defaults to [].
+
+        Returns:
+            list: Names of the deleted list files.
+        """        
+        stored = [name for name in self.getListCatalog() if name.startswith('qupe_')]
+        if len(stored) <= self.maxStoredLists:
+            return []
+        candidates = sorted(name for name in stored if name not in self.usedLists) + [name for name in self.usedLists if name in stored]
+        candidates = [name for name in candidates if name not in keep]
+        deleted = candidates[:len(stored) - self.maxStoredLists]
+        for name in deleted:
+            self.deleteList(name)
+        if len(deleted) > 0:
+            print('Deleted {} list files from the instrument'.format(len(deleted)))
+        return deleted
+
     def setPowerLimits(self, minPower, maxPower):
         """Sets an lower and upper limit for the RF output power.
 
@@ -282,22 +369,91 @@ class SMB100B():
         """        
         self.write(':SOUR:SWE:POW:STEP:LOG {}'.format(step))
     
+    @staticmethod
+    def getListName(frequency, power, minPower=None, maxPower=None):
+        """Returns the name of a list file derived from its content (qupe_*). The powers are clipped to the power limits first, as in defineFrequencyPowerList.
+        The name can be calculated without an instrument, e.g. as cache key.
+
+        Args:
+            frequency (list[float]): List of frequencies in Hertz (Hz).
+            power (list[float]): List of power levels in dBm.
+            minPower (float, optional): Lower limit for the RF output in dBm. Defaults to None: No limits.
+            maxPower (float, optional): Upper limit for the RF output in dBm. Defaults to None: No limits.
+
+        Returns:
+            str: Name of the list file.
+        """        
+        frequency = np.asarray(frequency, dtype=np.float64)
+        power = np.asarray(power, dtype=np.float64)
+        if minPower is not None and maxPower is not None:
+            power = np.clip(power, minPower, maxPower)
+        return 'qupe_{}'.format(hashlib.sha1(frequency.tobytes() + power.tobytes()).hexdigest()[:16])
+
     def defineFrequencyPowerList(self, filename, frequency, power, dwell):
         """Write the frequency and level values in the selected list file. Existing data is overwritten.
+        Without a filename, the list is stored under a name derived from its content. If such a list already exists on the instrument, it is only selected and not uploaded again.
+        At most maxStoredLists of these lists are kept on the instrument (see cleanupLists).
 
         Args:
-            filename (str): Name of the list file.
+            filename (str): Name of the list file. None: Name is derived from the content of the list.
             frequency (list[float]): List of frequencies in Hertz (Hz).
             power (list[float]): List of power levels in dBm.
             dwell (float): Global list dwell time in seconds (s).
+
+        Raises:
+            Exception: List exceeds the maximum list length.
+
+        Returns:
+            dict: Information about the upload: Filename, number of points, transferred bytes, duration in seconds, and whether an existing list was reused.
         """ 
+        frequency = np.asarray(frequency, dtype=np.float64)
+        power = np.asarray(power, dtype=np.float64)
+        if len(frequency) > self.maxListLength:
+            raise Exception('List with {} points exceeds the maximum list length of {} points.'.format(len(frequency), self.maxListLength))
         # Clip/limit output power
         if self.maxOutputPower is not None and self.minOutputPower is not None:
-            power = np.clip(np.array(power), self.minOutputPower, self.maxOutputPower).tolist()
-        # Generate sweep list
-        freqs = ', '.join([str(f) for f in frequency])
-        pows = ', '.join([str(p) for p in power])
+            power = np.clip(power, self.minOutputPower, self.maxOutputPower)
+
+        reused = False
+        derivedName = filename is None
+        if derivedName:
+            filename = self.getListName(frequency, power)
+            reused = filename in self.getListCatalog()
+
+        start = time.perf_counter()
+        transferredBytes = 0
         self.write('SOUR:LIST:SEL "/var/user/{}.lsw"'.format(filename))
-        self.write(':SOUR:LIST:FREQ {}'.format(freqs))
-        self.write(':SOUR:LIST:POW {}'.format(pows))
-        self.write(':SOUR:LIST:DWEL {}'.format(dwell))
\ No newline at end of file
+        if not reused:
+            # Generate sweep list
+            binaryTransfer = False
+            if self.binaryListTransfer:
+                self.write(':FORM:BORD NORM')
+                self.write(':FORM:DATA PACK')
+                bytesFrequency = self.writeBinary(':SOUR:LIST:FREQ ', frequency)
+                bytesPower = self.writeBinary(':SOUR:LIST:POW ', power)
+                self.write(':FORM:DATA ASC')
+                if bytesFrequency is not None and bytesPower is not None:
+                    binaryTransfer = True
+                    transferredBytes = bytesFrequency + bytesPower
+            if not binaryTransfer:
+                freqs = ', '.join([str(f) for f in frequency])
+                pows = ', '.join([str(p) for p in power])
+                self.write(':SOUR:LIST:FREQ {}'.format(freqs))
+                self.write(':SOUR:LIST:POW {}'.format(pows))
+                transferredBytes = len(freqs) + len(pows)
+            if self.listCatalog is not None:
+                self.listCatalog.add(filename)
+        self.write(':SOUR:LIST:DWEL {}'.format(dwell))
+        duration = time.perf_counter() - start
+        if derivedName:
+            if filename in self.usedLists:
+                self.usedLists.remove(filename)
+            self.usedLists.append(filename)
+            self.cleanupLists(keep=[filename])
+
+        if reused:
+            print('List {}: {} points, already on instrument'.format(filename, len(frequency)))
+        else:
+            print('List {}: {} points, {} bytes uploaded in {:.3f} s'.format(filename, len(frequency), transferredBytes, duration))
+
+        return {'filename': filename, 'points': len(frequency), 'bytes': transferredBytes, 'duration (s)': duration, 'reused': reused}
@@ -0,0 +1,464 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import difflib
+import hashlib
+import json
+import types
+
+import numpy as np
+
+from .Calibration import loadCalibrationModel
+from .PumpProbe import calculatePulseParameters, calculateSegmentEdges, calculateSegmentParameter
+from .RF import buildCrosstalkList, buildCrosstalkMapList, buildSweepList
+from .SMB100B import SMB100B
+
+number = (int, float)
+
+# Keys of the pulse scheme and the pulses: Type
+pulseSchemeKeys = {'pulses': list, 'repetitions': int, 'resolution (s)': number, 'modulationFreq (Hz)': number, 'sweepSteps': int}
+pulseKeys = {'name': str, 'type': str, 'cycle': str, 'startTime (s)': number, 'endTime (s)': number, 'sweepTime': bool, 'startDuration (s)': number,
+            'endDuration (s)': number, 'sweepDuration': bool, 'startAmplitude (V)': number, 'endAmplitude (V)': number, 'sweepAmplitude': bool}
+
+# Keys of the sweep scheme: Type
+sweepSchemeKeys = {'junctionAmplitude (V)': number, 'frequencySweepPower (dBm)': number, 'startFrequency (Hz)': number, 'endFrequency (Hz)': number,
+                'frequencyStep (Hz)': number, 'powerSweepFrequency (Hz)': number, 'startPower (dBm)': number, 'endPower (dBm)': number, 'powerStep (dBm)': number,
+                'modulationFrequency (Hz)': number, 'acquisitionTime (s)': number, 'adaptiveTolerance (relative)': number, 'adaptiveRefinements': int,
+                'minimumFrequencyStep (Hz)': number, 'mapFrequencyStep (Hz)': number}
+powerSweepKeys = ['powerSweepFrequency (Hz)', 'startPower (dBm)', 'endPower (dBm)', 'powerStep (dBm)', 'modulationFrequency (Hz)', 'acquisitionTime (s)']
+frequencySweepKeys = ['startFrequency (Hz)', 'endFrequency (Hz)', 'frequencyStep (Hz)', 'modulationFrequency (Hz)', 'acquisitionTime (s)']
+# Required keys of the sweep scheme for each measurement
+requiredSweepKeys = {'powerSweep': powerSweepKeys, 'frequencySweep': frequencySweepKeys,
+                    'constantAmplitudeSweep': frequencySweepKeys + ['junctionAmplitude (V)'],
+                    'crosstalk': powerSweepKeys + frequencySweepKeys + ['frequencySweepPower (dBm)'],
+                    'crosstalkMap': powerSweepKeys + frequencySweepKeys + ['frequencySweepPower (dBm)'],
+                    'transferFunction': powerSweepKeys + frequencySweepKeys + ['frequencySweepPower (dBm)', 'junctionAmplitude (V)']}
+
+# Keys of the general settings: Type
+generalSettingsKeys = {'AWG_Name': str, 'AWG_VisaResource': str, 'AWG_ModeBit': int, 'AWG_Format': str, 'AWG_MinimumSegmentSize': int, 'AWG_VectorSize': int,
+                    'AWG_SamplingFrequencyMax (1/s)': number, 'AWG_SamplingFrequencyMin (1/s)': number, 'AWG_Route': str, 'AWG_Channel': int,
+                    'AWG_Amplitude (V)': number, 'AWG_SampleMarkerAmplitude (V)': number, 'AWG_TriggerLevel (V)': number,
+                    'SG_Name': str, 'SG_VisaResource': str, 'SG_PowerMin (dBm)': number, 'SG_PowerMax (dBm)': number,
+                    'DAQ_Device': str, 'DAQ_SamplingRate (1/s)': number, 'DAQ_InputChannel_LockIn': str, 'DAQ_InputChannel_SignalValid': str,
+                    'DAQ_InputChannel_Signal': str, 'DAQ_InputChannel_Reference': str, 'DAQ_OutputChannel_TriggerAWG': str, 'DAQ_OutputAmplitude_TriggerAWG (V)': number,
+                    'LockIn_DataDropOff': number, 'LockIn_FilterOrder': int, 'LockIn_TimeConstant (s)': number,
+                    'Data_Folder': str, 'Data_Format': str, 'Data_Compression': str, 'Catalog_File': str, 'Plot_Mode': str, 'Progress_Port': int,
+                    'TF_Folder': str, 'TF_File': str, 'UseTF': bool, 'CT_Folder': str, 'CT_File': str, 'UseCT': bool}
+requiredPumpProbeSettings = ['AWG_VisaResource', 'AWG_ModeBit', 'AWG_Format', 'AWG_MinimumSegmentSize', 'AWG_VectorSize', 'AWG_SamplingFrequencyMax (1/s)',
+                            'AWG_SamplingFrequencyMin (1/s)', 'AWG_Route', 'AWG_Channel', 'AWG_Amplitude (V)', 'AWG_SampleMarkerAmplitude (V)', 'AWG_TriggerLevel (V)',
+                            'DAQ_Device', 'DAQ_SamplingRate (1/s)', 'DAQ_InputChannel_LockIn', 'DAQ_OutputChannel_TriggerAWG', 'DAQ_OutputAmplitude_TriggerAWG (V)', 'Data_Folder']
+requiredRFSettings = ['SG_VisaResource', 'SG_PowerMin (dBm)', 'SG_PowerMax (dBm)', 'DAQ_Device', 'DAQ_SamplingRate (1/s)', 'DAQ_InputChannel_LockIn',
+                    'DAQ_InputChannel_SignalValid', 'LockIn_DataDropOff', 'Data_Folder']
+
+# Setup times of the measurement functions in seconds (waiting times for the instruments)
+pumpProbeSetupTime = 10
+pumpProbeStepTime = 1
+sweepSetupTime = 5
+
+
+def checkKeys(parameters, knownKeys, requiredKeys, name):
+    """Checks the keys and types of a settings or scheme dictionary. Unknown keys, which are similar to a known key, are treated as typos.
+
+    Args:
+        parameters (dict): Settings or scheme.
+        knownKeys (dict): Known keys and their types.
+        requiredKeys (list): Required keys.
+        name (str): Name used in the messages, e.g. 'pulseScheme'.
+
+    Returns:
+        list, list: Errors, Warnings.
+    """    
+    errors = []
+    warnings = []
+    for key in requiredKeys:
+        if key not in parameters:
+            errors.append('{}: Missing key {!r}.'.format(name, key))
+    for key, value in parameters.items():
+        if key in knownKeys:
+            expectedType = knownKeys[key]
+            if isinstance(value, bool) and expectedType is not bool:
+                errors.append('{}: {!r} must be {}, not bool.'.format(name, key, getattr(expectedType, '__name__', 'a number')))
+            elif not isinstance(value, expectedType) and not (expectedType is int and isinstance(value, float) and value.is_integer()):
+                errors.append('{}: {!r} must be {}, not {}.'.format(name, key, getattr(expectedType, '__name__', 'a number'), type(value).__name__))
+        else:
+            matches = difflib.get_close_matches(key, knownKeys, n=1, cutoff=0.8)
+            if len(matches) > 0:
+                errors.append('{}: Unknown key {!r}, did you mean {!r}?'.format(name, key, matches[0]))
+            else:
+                warnings.append('{}: Unknown key {!r}.'.format(name, key))
+    return errors, warnings
+
+def freezeValue(value):
+    """Converts a value into an immutable value: Dictionaries become read-only mappings, lists and arrays become tuples.
+
+    Args:
+        value (object): Value.
+
+    Returns:
+        object: Immutable value.
+    """    
+    if isinstance(value, dict):
+        return types.MappingProxyType({key: freezeValue(v) for key, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freezeValue(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return freezeValue(value.tolist())
+    return value
+
+def thawValue(value):
+    """Converts an immutable value (see freezeValue) back into dictionaries and lists.
+
+    Args:
+        value (object): Immutable value.
+
+    Returns:
+        object: Mutable copy.
+    """    
+    if isinstance(value, types.MappingProxyType):
+        return {key: thawValue(v) for key, v in value.items()}
+    if isinstance(value, tuple):
+        return [thawValue(v) for v in value]
+    return value
+
+def calculateContentHash(content):
+    """Calculates a hash of JSON-compatible content, independent of the order of the keys.
+
+    Args:
+        content (object): Content.
+
+    Returns:
+        str: SHA-256 hash (hexadecimal).
+    """    
+    def convert(value):
+        if isinstance(value, types.MappingProxyType):
+            return thawValue(value)
+        return np.asarray(value).tolist()
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=convert).encode('utf8')).hexdigest()
+
+
+class CompiledScheme():
+    def __init__(self, measurement, generalSettings, scheme, arguments, plan, warnings):
+        """Validated and immutable measurement: General settings, scheme, further arguments of the measurement function and the execution plan.
+        Compiled schemes are hashable and equal if their content is equal (see getHash). Use compilePumpProbeScheme or compileSweepScheme.
+
+        Args:
+            measurement (str): Measurement, e.g. 'pumpProbe' or 'frequencySweep'.
+            generalSettings (dict): General settings.
+            scheme (dict): Pulse or sweep scheme.
+            arguments (dict): Further arguments of the measurement function.
+            plan (dict): Execution plan.
+            warnings (list): Warnings of the validation.
+        """    
+        object.__setattr__(self, 'measurement', measurement)
+        object.__setattr__(self, 'generalSettings', freezeValue(generalSettings))
+        object.__setattr__(self, 'scheme', freezeValue(scheme))
+        object.__setattr__(self, 'arguments', freezeValue(arguments))
+        object.__setattr__(self, 'plan', freezeValue(plan))
+        object.__setattr__(self, 'warnings', tuple(warnings))
+        object.__setattr__(self, 'hash', calculateContentHash({'measurement': measurement, 'GeneralSettings': generalSettings, 'Scheme': scheme, 'Arguments': arguments}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledScheme is immutable.')
+
+    def __hash__(self):
+        return int(self.hash[:16], 16)
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledScheme) and self.hash == other.hash
+
+    def __repr__(self):
+        return 'CompiledScheme({}, {}, {:.0f} s)'.format(self.measurement, self.hash[:12], self.getEstimatedTime())
+
+    def getHash(self):
+        """Returns the content hash of the measurement, e.g. as cache key.
+
+        Returns:
+            str: SHA-256 hash (hexadecimal).
+        """    
+        return self.hash
+
+    def getGeneralSettings(self):
+        """Returns a copy of the general settings for the measurement functions.
+
+        Returns:
+            dict: General settings.
+        """    
+        return thawValue(self.generalSettings)
+
+    def getScheme(self):
+        """Returns a copy of the pulse or sweep scheme for the measurement functions.
+
+        Returns:
+            dict: Scheme.
+        """    
+        return thawValue(self.scheme)
+
+    def getPlan(self):
+        """Returns a copy of the execution plan.
+
+        Returns:
+            dict: Execution plan: 'steps' (list) and the estimates 'Time (s)', 'DAQ Samples (1)', 'Raw Data (bytes)'.
+        """    
+        return thawValue(self.plan)
+
+    def getEstimatedTime(self):
+        """Returns the estimated wall time of the measurement.
+
+        Returns:
+            float: Time in seconds.
+        """    
+        return self.plan['Time (s)']
+
+    def getDataVolume(self):
+        """Returns the estimated data volume of the raw DAQ traces (see recordRaw of the measurement functions).
+
+        Returns:
+            int: Data volume in bytes.
+        """    
+        return self.plan['Raw Data (bytes)']
+
+    def printPlan(self):
+        """Prints a summary of the execution plan.
+        """    
+        print('{}: {} steps, estimated time {:.0f} s, {} DAQ samples ({:.1f} MB raw data)'.format(self.measurement, len(self.plan['steps']), self.getEstimatedTime(),
+                                                                                                self.plan['DAQ Samples (1)'], self.getDataVolume() / 1e6))
+        for warning in self.warnings:
+            print('Warning: {}'.format(warning))
+
+def raiseErrors(errors):
+    """Raises an exception with all validation errors.
+
+    Args:
+        errors (list): Errors.
+
+    Raises:
+        Exception: Invalid settings or scheme.
+    """    
+    if len(errors) > 0:
+        raise Exception('Invalid measurement:\n' + '\n'.join(errors))
+
+def compilePumpProbeScheme(generalSettings, pulseScheme, acquisitionTime, settlingTime, **arguments):
+    """Validates a pump-probe measurement and checks every sweep step before the measurement is started: Segment parameters and AWG limits,
+    pulses outside of the segment and clipping of the DAC values (also of overlapping pulses).
+
+    Args:
+        generalSettings (dict): General settings of the AWG.
+        pulseScheme (dict): Definition of the pulse sequence.
+        acquisitionTime (float): Measurement time per sweep step in seconds (see measurePumpProbe).
+        settlingTime (float): Settling time per sweep step in seconds.
+        **arguments: Further arguments of measurePumpProbe (e.g. softwareLockIn=True).
+
+    Raises:
+        Exception: Invalid settings or scheme. The message contains all errors.
+
+    Returns:
+        CompiledScheme: Compiled measurement. The plan contains the pulse parameters of every sweep step.
+    """    
+    requiredSettings = list(requiredPumpProbeSettings)
+    if 'softwareLockIn' in arguments and arguments['softwareLockIn']:
+        requiredSettings += ['DAQ_InputChannel_Signal', 'DAQ_InputChannel_Reference']
+    errors, warnings = checkKeys(generalSettings, generalSettingsKeys, requiredSettings, 'generalSettings')
+    schemeErrors, schemeWarnings = checkKeys(pulseScheme, pulseSchemeKeys, list(pulseSchemeKeys), 'pulseScheme')
+    errors += schemeErrors
+    warnings += schemeWarnings
+    if 'pulses' in pulseScheme and isinstance(pulseScheme['pulses'], list):
+        for pulse in pulseScheme['pulses']:
+            name = 'pulse {}'.format(pulse['name'] if 'name' in pulse else '?')
+            pulseErrors, pulseWarnings = checkKeys(pulse, pulseKeys, list(pulseKeys), name)
+            errors += pulseErrors
+            warnings += pulseWarnings
+            if 'type' in pulse and pulse['type'] != 'DC':
+                warnings.append('{}: Type {!r} is not generated.'.format(name, pulse['type']))
+            if 'cycle' in pulse and pulse['cycle'] not in ['A', 'B']:
+                errors.append("{}: Cycle must be 'A' or 'B'.".format(name))
+    raiseErrors(errors)
+    if pulseScheme['sweepSteps'] < 2:
+        errors.append('pulseScheme: At least 2 sweep steps are required.')
+    raiseErrors(errors)
+
+    try:
+        points_per_segment, sampling_frequency = calculateSegmentParameter(generalSettings, pulseScheme)
+    except Exception as e:
+        raiseErrors([str(e)])
+
+    # Maximum DAC value and conversion of the amplitude to DAC values (see genPumpProbeSegments)
+    maxDAC = 2**(generalSettings['AWG_ModeBit']-1)
+    scalingAmplitude = 2 * maxDAC / generalSettings['AWG_Amplitude (V)']
+    cycle_duration = (1/pulseScheme['modulationFreq (Hz)'])/2
+    segment_duration = cycle_duration / pulseScheme['repetitions']
+    ppt = points_per_segment / segment_duration
+
+    channels = 2 if 'softwareLockIn' in arguments and arguments['softwareLockIn'] else 1
+    samplesPerStep = int(acquisitionTime * generalSettings['DAQ_SamplingRate (1/s)']) * channels
+    steps = []
+    for i in range(pulseScheme['sweepSteps']):
+        pulseParameters = calculatePulseParameters(pulseScheme, i)
+        for pulse, (start_time, duration, amplitude) in zip(pulseScheme['pulses'], pulseParameters):
+            if pulse['type'] != 'DC':
+                continue
+            if start_time < 0 or round(ppt * (start_time + duration)) > points_per_segment:
+                errors.append('Step {}: Pulse {} ({} s to {} s) exceeds the segment (0 s to {} s).'.format(i, pulse['name'], start_time, start_time + duration, segment_duration))
+            elif round(ppt * (start_time + duration)) <= round(ppt * start_time):
+                warnings.append('Step {}: Pulse {} is shorter than one sample.'.format(i, pulse['name']))
+            if round(amplitude * scalingAmplitude) >= maxDAC or round(amplitude * scalingAmplitude) < -maxDAC:
+                errors.append('Step {}: Amplitude of pulse {} ({} V) is clipped by the AWG (maximum {} V).'.format(i, pulse['name'], amplitude, generalSettings['AWG_Amplitude (V)'] / 2))
+        edges = calculateSegmentEdges(generalSettings, pulseScheme, i)
+        for cycle in ['A', 'B']:
+            levels = np.round(edges[cycle][1] * scalingAmplitude)
+            if np.any(levels >= maxDAC) or np.any(levels < -maxDAC):
+                errors.append('Step {}: Overlapping pulses exceed the DAC range in cycle {}.'.format(i, cycle))
+        parameters = {pulse['name']: {'time (s)': p[0], 'duration (s)': p[1], 'amplitude (V)': p[2]} for pulse, p in zip(pulseScheme['pulses'], pulseParameters)}
+        steps.append({'step': i, 'parameters': parameters, 'Time (s)': pumpProbeStepTime + settlingTime + acquisitionTime, 'DAQ Samples (1)': samplesPerStep})
+    raiseErrors(errors)
+
+    plan = {'steps': steps, 'points_per_segment': points_per_segment, 'sampling_frequency': sampling_frequency,
+            'Segment Data (bytes)': 2 * 2 * points_per_segment * len(steps),
+            'Time (s)': pumpProbeSetupTime + sum(step['Time (s)'] for step in steps),
+            'DAQ Samples (1)': samplesPerStep * len(steps), 'Raw Data (bytes)': 8 * samplesPerStep * len(steps)}
+    arguments = dict(arguments, acquisitionTime=acquisitionTime, settlingTime=settlingTime)
+    return CompiledScheme('pumpProbe', generalSettings, pulseScheme, arguments, plan, warnings)
+
+def buildListKeys(generalSettings, frequency, power, shape='SAWT'):
+    """Returns the names of the list files under which the SG stores a list sweep (see SMB100B.defineFrequencyPowerList and SMB100B.getListName), e.g. as cache keys.
+
+    Args:
+        generalSettings (dict): General settings of the SG (power limits).
+        frequency (ndarray): Frequencies in Hz.
+        power (ndarray): Powers in dBm.
+        shape (str, optional): 'SAWT' or 'TRI'. Defaults to 'SAWT'.
+
+    Returns:
+        list: Names of the list files (one for each part of the list).
+    """    
+    maxPartLength = (SMB100B.maxListLength + 1)//2 if shape == 'TRI' else SMB100B.maxListLength
+    keys = []
+    for start in range(0, len(frequency), maxPartLength):
+        partFrequency, partPower = buildSweepList(frequency[start:start + maxPartLength], power[start:start + maxPartLength], shape)
+        keys.append(SMB100B.getListName(partFrequency, partPower, generalSettings['SG_PowerMin (dBm)'], generalSettings['SG_PowerMax (dBm)']))
+    return keys
+
+def compileSweepScheme(measurement, generalSettings, sweepScheme, **arguments):
+    """Validates an RF measurement and checks the source powers of all points against the limits of the SG before the measurement is started.
+    For constant amplitude sweeps the source powers are calculated from the transfer function (see calculatePowerConstantJunctionAmplitude).
+
+    Args:
+        measurement (str): 'powerSweep', 'frequencySweep', 'constantAmplitudeSweep', 'crosstalk', 'crosstalkMap' or 'transferFunction'.
+        generalSettings (dict): General settings of the SG.
+        sweepScheme (dict): Definition of the sweep scheme.
+        **arguments: Further arguments of the measurement function (e.g. repetitions=4 or iterations=3).
+
+    Raises:
+        Exception: Invalid settings or scheme. The message contains all errors.
+
+    Returns:
+        CompiledScheme: Compiled measurement. The plan contains the frequencies and powers of every sweep and the names of the list files ('listKeys').
+    """    
+    if measurement not in requiredSweepKeys:
+        raise Exception('Unknown measurement: {}'.format(measurement))
+    requiredSettings = list(requiredRFSettings)
+    if measurement == 'constantAmplitudeSweep' or (measurement == 'transferFunction' and 'UseTF' in generalSettings and generalSettings['UseTF']):
+        requiredSettings += ['TF_Folder', 'TF_File']
+    if measurement in ['constantAmplitudeSweep', 'transferFunction']:
+        requiredSettings += ['UseCT', 'CT_Folder', 'CT_File'] if 'UseCT' in generalSettings and generalSettings['UseCT'] else ['UseCT']
+    if measurement == 'transferFunction':
+        requiredSettings.append('UseTF')
+    errors, warnings = checkKeys(generalSettings, generalSettingsKeys, requiredSettings, 'generalSettings')
+    schemeErrors, schemeWarnings = checkKeys(sweepScheme, sweepSchemeKeys, requiredSweepKeys[measurement], 'sweepScheme')
+    errors += schemeErrors
+    warnings += schemeWarnings
+    raiseErrors(errors)
+
+    def powerSweep():
+        numberPoints = int((sweepScheme['endPower (dBm)'] - sweepScheme['startPower (dBm)'])/sweepScheme['powerStep (dBm)']) + 1
+        power = np.linspace(sweepScheme['startPower (dBm)'], sweepScheme['endPower (dBm)'], numberPoints)
+        return {'name': 'powerSweep', 'Frequency (Hz)': np.full(numberPoints, sweepScheme['powerSweepFrequency (Hz)'], dtype=np.float64), 'Power (dBm)': power, 'listKeys': []}
+
+    def frequencySweep(power=None):
+        numberPoints = int((sweepScheme['endFrequency (Hz)'] - sweepScheme['startFrequency (Hz)'])/sweepScheme['frequencyStep (Hz)']) + 1
+        frequency = np.linspace(sweepScheme['startFrequency (Hz)'], sweepScheme['endFrequency (Hz)'], numberPoints)
+        if power is None:
+            power = sweepScheme['frequencySweepPower (dBm)'] if 'frequencySweepPower (dBm)' in sweepScheme else generalSettings['SG_PowerMin (dBm)']
+        return {'name': 'frequencySweep', 'Frequency (Hz)': frequency, 'Power (dBm)': np.full(numberPoints, power, dtype=np.float64), 'listKeys': []}
+
+    def listSweep(name, frequency, power):
+        return {'name': name, 'Frequency (Hz)': frequency, 'Power (dBm)': power, 'listKeys': buildListKeys(generalSettings, frequency, power, arguments['shape'] if 'shape' in arguments else 'SAWT')}
+
+    sweeps = []
+    if measurement == 'powerSweep':
+        sweeps.append(powerSweep())
+    elif measurement == 'frequencySweep' and 'freqList' in arguments and arguments['freqList'] is not None:
+        sweeps.append(listSweep('frequencySweep', np.asarray(arguments['freqList'], dtype=np.float64), np.asarray(arguments['powList'], dtype=np.float64)))
+    elif measurement == 'frequencySweep':
+        sweeps.append(frequencySweep())
+    elif measurement == 'constantAmplitudeSweep':
+        frequency = frequencySweep()['Frequency (Hz)']
+        try:
+            calibration = loadCalibrationModel(generalSettings)
+            sweeps.append(listSweep('constantAmplitudeSweep', frequency, calibration.calculateSourcePower(frequency, sweepScheme['junctionAmplitude (V)'])))
+        except (OSError, KeyError, ValueError) as e:
+            raiseErrors(['Calibration could not be loaded ({}).'.format(e)])
+    elif measurement == 'crosstalk':
+        freqList, powList, _, _ = buildCrosstalkList(sweepScheme)
+        sweeps.append(listSweep('crosstalk', freqList, powList))
+    elif measurement == 'crosstalkMap':
+        freqList, powList, _, _ = buildCrosstalkMapList(sweepScheme)
+        sweeps.append(listSweep('crosstalkMap', freqList, powList))
+    elif measurement == 'transferFunction':
+        sweeps.append(powerSweep())
+        if generalSettings['UseTF']:
+            # Source powers of the iterations at constant junction amplitude are known from the given transfer function
+            frequency = frequencySweep()['Frequency (Hz)']
+            try:
+                calibration = loadCalibrationModel(generalSettings, useCT=False)
+                power = calibration.calculateSourcePower(frequency, sweepScheme['junctionAmplitude (V)'])
+            except (OSError, KeyError, ValueError) as e:
+                raiseErrors(['Transfer function could not be loaded ({}).'.format(e)])
+        else:
+            sweeps.append(frequencySweep())
+            warnings.append('Source powers of the iterations depend on the measured transfer function and are not checked.')
+            frequency = sweeps[-1]['Frequency (Hz)']
+            power = sweeps[-1]['Power (dBm)']
+        numberIterations = arguments['iterations'] if 'iterations' in arguments else 1
+        for i in range(numberIterations if generalSettings['UseTF'] else numberIterations - 1):
+            sweeps.append(listSweep('iteration {}'.format(i), frequency, power) if generalSettings['UseTF'] else
+                        {'name': 'iteration {}'.format(i + 1), 'Frequency (Hz)': frequency, 'Power (dBm)': np.full(len(frequency), np.nan), 'listKeys': []})
+    if 'adaptiveTolerance (relative)' in sweepScheme:
+        warnings.append('The adaptive frequency grid is refined during the measurement. The plan contains the initial grid.')
+
+    # Source powers within the limits of the SG
+    for sweep in sweeps:
+        power = sweep['Power (dBm)']
+        outside = (power < generalSettings['SG_PowerMin (dBm)']) | (power > generalSettings['SG_PowerMax (dBm)'])
+        if np.any(outside):
+            frequency = sweep['Frequency (Hz)'][outside]
+            errors.append('{}: {} of {} points outside of the SG power limits ({} dBm to {} dBm), {:.6g} Hz to {:.6g} Hz, {:.3g} dBm to {:.3g} dBm.'.format(
+                            sweep['name'], np.sum(outside), len(power), generalSettings['SG_PowerMin (dBm)'], generalSettings['SG_PowerMax (dBm)'],
+                            np.min(frequency), np.max(frequency), np.min(power[outside]), np.max(power[outside])))
+    raiseErrors(errors)
+
+    repetitions = arguments['repetitions'] if 'repetitions' in arguments else 1
+    passes = 2 if 'shape' in arguments and arguments['shape'] == 'TRI' else repetitions
+    samplingRate = generalSettings['DAQ_SamplingRate (1/s)']
+    steps = []
+    for sweep in sweeps:
+        sweepTime = len(sweep['Frequency (Hz)']) * sweepScheme['acquisitionTime (s)'] * passes
+        steps.append({'name': sweep['name'], 'Frequency (Hz)': sweep['Frequency (Hz)'].tolist(), 'Power (dBm)': sweep['Power (dBm)'].tolist(), 'listKeys': sweep['listKeys'],
+                    'Time (s)': sweepSetupTime + sweepTime, 'DAQ Samples (1)': 2 * int(sweepTime * samplingRate)})
+    plan = {'steps': steps, 'Time (s)': sum(step['Time (s)'] for step in steps), 'DAQ Samples (1)': sum(step['DAQ Samples (1)'] for step in steps)}
+    plan['Raw Data (bytes)'] = 8 * plan['DAQ Samples (1)']
+    return CompiledScheme(measurement, generalSettings, sweepScheme, arguments, plan, warnings)
+
+def compileScheme(measurement, generalSettings, scheme, **arguments):
+    """Compiles a pump-probe ('pumpProbe', see compilePumpProbeScheme) or RF measurement (see compileSweepScheme).
+
+    Args:
+        measurement (str): Measurement, e.g. 'pumpProbe' or 'frequencySweep'.
+        generalSettings (dict): General settings.
+        scheme (dict): Pulse or sweep scheme.
+        **arguments: Further arguments of the measurement function.
+
+    Returns:
+        CompiledScheme: Compiled measurement.
+    """    
+    if measurement == 'pumpProbe':
+        return compilePumpProbeScheme(generalSettings, scheme, **arguments)
+    return compileSweepScheme(measurement, generalSettings, scheme, **arguments)
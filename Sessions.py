@@ -0,0 +1,145 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class InstrumentSessions():
+    def __init__(self):
+        """Instrument connections shared by several measurements (e.g. the jobs of a JobQueue). While the sessions are active (see activate or 'with'),
+        connectInstrument returns the open connection of an instrument instead of connecting again and disconnectInstrument keeps it open.
+        """    
+        self.instruments = {}
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def activate(self):
+        """Uses these sessions for all following measurements.
+        """    
+        global activeSessions
+        activeSessions = self
+
+    def getInstrument(self, instrumentClass, resource):
+        """Returns the connection to an instrument. The instrument is connected on the first call.
+
+        Args:
+            instrumentClass (class): Instrument class, e.g. SMB100B.
+            resource (str): VISA resource string.
+
+        Returns:
+            object: Connected instrument.
+        """    
+        key = (instrumentClass.__name__, resource)
+        if key not in self.instruments or not self.instruments[key].connected:
+            instrument = instrumentClass(resource)
+            instrument.connect()
+            self.instruments[key] = instrument
+        return self.instruments[key]
+
+    def connectAll(self, instruments):
+        """Connects several instruments concurrently, so that the startup takes as long as the slowest instrument.
+
+        Args:
+            instruments (list): Instrument classes and VISA resource strings, e.g. [(M8190A, 'TCPIP0::...'), (SMB100B, 'TCPIP0::...')].
+
+        Returns:
+            list: Connected instruments.
+        """    
+        return startInstruments([lambda instrumentClass=instrumentClass, resource=resource: self.getInstrument(instrumentClass, resource) 
+                                 for instrumentClass, resource in instruments])
+
+    def isShared(self, instrument):
+        """Checks if an instrument belongs to these sessions.
+
+        Args:
+            instrument (object): Instrument.
+
+        Returns:
+            bool: True if the instrument is shared.
+        """    
+        return any(instrument is shared for shared in self.instruments.values())
+
+    def close(self):
+        """Disconnects all instruments and deactivates the sessions.
+        """    
+        global activeSessions
+        for instrument in self.instruments.values():
+            if instrument.connected:
+                try:
+                    instrument.disconnect()
+                except Exception as e:
+                    print('Could not disconnect {} ({})'.format(instrument.VisaResourceString, e))
+        self.instruments = {}
+        if activeSessions is self:
+            activeSessions = None
+
+activeSessions = None
+
+def connectInstrument(instrumentClass, resource):
+    """Connects to an instrument. If shared sessions are active (see InstrumentSessions), the open connection is used.
+
+    Args:
+        instrumentClass (class): Instrument class, e.g. SMB100B or M8190A.
+        resource (str): VISA resource string.
+
+    Returns:
+        object: Connected instrument.
+    """    
+    if activeSessions is not None:
+        return activeSessions.getInstrument(instrumentClass, resource)
+    instrument = instrumentClass(resource)
+    instrument.connect()
+    return instrument
+
+def disconnectInstrument(instrument):
+    """Disconnects from an instrument unless it belongs to the active shared sessions.
+
+    Args:
+        instrument (object): Instrument.
+    """    
+    if activeSessions is not None and activeSessions.isShared(instrument):
+        return
+    instrument.disconnect()
+
+def startInstruments(setupFunctions):
+    """Executes the setup functions of independent instruments (e.g. AWG and DAQ) concurrently and waits until all are ready.
+    Each function must only use its own instrument.
+
+    Args:
+        setupFunctions (list): Functions without arguments, e.g. connecting and configuring one instrument.
+
+    Raises:
+        Exception: The first error of a setup function (after all functions have finished).
+
+    Returns:
+        list: Return values of the setup functions (same order).
+    """    
+    if len(setupFunctions) == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=len(setupFunctions)) as executor:
+        futures = [executor.submit(function) for function in setupFunctions]
+    return [future.result() for future in futures]
+
+def waitUntilReady(instrument, timeout=5, interval=0.1):
+    """Waits until an instrument has completed all pending operations ('*OPC?') instead of a fixed waiting time.
+
+    Args:
+        instrument (object): Instrument, e.g. SMB100B or M8190A.
+        timeout (float, optional): Maximum waiting time in s. Defaults to 5.
+        interval (float, optional): Time between queries in s, if the instrument does not answer. Defaults to 0.1.
+
+    Returns:
+        bool: True if the instrument is ready, False after the timeout.
+    """    
+    startTime = time.perf_counter()
+    while time.perf_counter() - startTime < timeout:
+        err, resp = instrument.query('*OPC?')
+        if not err and resp.strip() == '1':
+            return True
+        time.sleep(interval)
+    print('{} not ready after {} s.'.format(instrument.VisaResourceString, timeout))
+    return False
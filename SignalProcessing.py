@@ -0,0 +1,579 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import warnings
+
+import numpy as np
+
+
+class RunningStatistics():
+    def __init__(self, shape=()):
+        """Running mean and variance (Welford's algorithm) for one or several quantities.
+
+        Args:
+            shape (tuple, optional): Shape of the tracked quantities. Defaults to (): Single quantity.
+        """        
+        self.shape = shape
+        self.reset()
+
+    def reset(self):
+        """Discards all accumulated observations.
+        """        
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+
+    def update(self, observations):
+        """Adds observations. NaN values are ignored.
+
+        Args:
+            observations (float, ndarray): Single observation of shape 'shape' or several observations of shape 'shape' + (n,).
+        """        
+        observations = np.asarray(observations, dtype=np.float64)
+        if observations.ndim == len(self.shape):
+            observations = observations[..., np.newaxis]
+
+        valid = ~np.isnan(observations)
+        countBlock = np.sum(valid, axis=-1)
+        if not np.any(countBlock):
+            return
+        # Combine statistics of the new block with the accumulated statistics (Chan et al.)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            meanBlock = np.where(countBlock > 0, np.nansum(observations, axis=-1) / countBlock, 0)
+            m2Block = np.nansum((observations - meanBlock[..., np.newaxis])**2, axis=-1)
+            countTotal = self.count + countBlock
+            delta = meanBlock - self.mean
+            self.mean = np.where(countTotal > 0, self.mean + delta * countBlock / countTotal, 0)
+            self.m2 = np.where(countTotal > 0, self.m2 + m2Block + delta**2 * self.count * countBlock / countTotal, 0)
+        self.count = countTotal
+
+    def getCount(self):
+        """Returns the number of observations.
+
+        Returns:
+            int, ndarray: Number of observations.
+        """        
+        return self.count
+
+    def getMean(self):
+        """Returns the mean of all observations.
+
+        Returns:
+            float, ndarray: Mean value(s).
+        """        
+        return np.where(self.count > 0, self.mean, np.nan)
+
+    def getVariance(self):
+        """Returns the (unbiased) sample variance of all observations.
+
+        Returns:
+            float, ndarray: Variance(s). NaN if less than two observations are available.
+        """        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    def getStandardError(self):
+        """Returns the standard error of the mean.
+
+        Returns:
+            float, ndarray: Standard error(s). NaN if less than two observations are available.
+        """        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.getVariance() / self.count)
+
+def decodeSignalValid(dataSignalValid):
+    """Determines the sweep step for each sample of the signal valid output of the SG.
+    A new step begins with the last sample of each invalid (low) period.
+
+    Args:
+        dataSignalValid (ndarray): Output signal that determines the valid signal times (valid level and frequency) for all analog modulations.
+
+    Returns:
+        ndarray: Number of the sweep step (counted from 0) for each sample.
+    """    
+    # Normalize to +1 and -1
+    level = np.sign(dataSignalValid - np.max(dataSignalValid)/2)
+    invalid = level == -1
+    # Transitions from invalid to valid
+    newStep = np.zeros(len(level), dtype=np.int64)
+    newStep[:-1] = invalid[:-1] & ~invalid[1:]
+    return np.cumsum(newStep)
+
+def binSweepData(lockinData, stepIndex, numberPoints, dataDropOff=0):
+    """Averages the lock-in signal for each sweep point. Repeated passes of the sweep are assigned to the same points.
+
+    Args:
+        lockinData (ndarray): Lock-in signal.
+        stepIndex (ndarray): Number of the sweep step for each sample (see decodeSignalValid).
+        numberPoints (int): Number of points per sweep pass.
+        dataDropOff (float, optional): Fraction of the samples at the beginning of each point which is discarded (0...1). Defaults to 0.
+
+    Returns:
+        ndarray, ndarray: Averaged lock-in signal, True for points with data.
+    """    
+    lockinSignal = np.zeros(numberPoints)
+    found = np.zeros(numberPoints, dtype=bool)
+
+    # Group sample indices by sweep point
+    point = np.asarray(stepIndex) % numberPoints
+    order = np.argsort(point, kind='stable')
+    boundaries = np.searchsorted(point[order], np.arange(numberPoints + 1))
+    for i in range(numberPoints):
+        idx = order[boundaries[i]:boundaries[i+1]]
+        if len(idx) > 0:
+            found[i] = True
+            # Drop some percentage of LockIn Data at beginning
+            if dataDropOff > 0 and dataDropOff < 1:
+                stardIdxDrop = int(len(idx) * dataDropOff)
+                idx = idx[stardIdxDrop:-1]
+            lockinSignal[i] = np.mean(lockinData[idx])
+
+    return lockinSignal, found
+
+
+def testStationarity(blockMeans, threshold=2):
+    """Tests whether a series of block means is stationary: The slope of a linear fit has to be compatible with zero 
+    (t-test with the scatter of the block means around the fit) and the scatter of the first and second half must be consistent.
+
+    Args:
+        blockMeans (ndarray): Consecutive block means (at least 4).
+        threshold (float, optional): Threshold for the test statistics in standard deviations. Defaults to 2.
+
+    Returns:
+        bool: True if no trend is detected.
+    """    
+    y = np.asarray(blockMeans, dtype=np.float64)
+    n = len(y)
+    if n < 4:
+        return False
+    x = np.arange(n) - (n - 1)/2
+    slope = np.sum(x * y) / np.sum(x**2)
+    residual = y - np.mean(y) - slope * x
+    scatter = np.sqrt(np.sum(residual**2) / (n - 2))
+    if scatter == 0:
+        return slope == 0
+    # Trend
+    if np.abs(slope) > threshold * scatter / np.sqrt(np.sum(x**2)):
+        return False
+    # Variance: a decaying transient leaves a larger scatter in the first half
+    firstHalf = np.std(residual[:n//2])
+    secondHalf = np.std(residual[n//2:])
+    return firstHalf <= threshold**2 * max(secondHalf, scatter / np.sqrt(n))
+
+
+class SignalValidDecoder():
+    def __init__(self):
+        """Decodes the signal valid output of the SG block by block (see decodeSignalValid). 
+        The last sample of each block is held back until the next block, since it may start a new step.
+        """        
+        self.maximum = -np.inf
+        self.step = 0
+        self.pendingLockIn = np.zeros(0)
+        self.pendingSignalValid = np.zeros(0)
+
+    def process(self, lockinData, dataSignalValid):
+        """Decodes the next block of samples.
+
+        Args:
+            lockinData (ndarray): Lock-in signal.
+            dataSignalValid (ndarray): Signal valid output of the SG.
+
+        Returns:
+            ndarray, ndarray: Lock-in signal of the decoded samples, Number of the sweep step (counted from 0) for each decoded sample.
+        """        
+        lockinData = np.concatenate((self.pendingLockIn, lockinData))
+        dataSignalValid = np.concatenate((self.pendingSignalValid, dataSignalValid))
+        if len(dataSignalValid) == 0:
+            return lockinData, np.zeros(0, dtype=np.int64)
+
+        self.maximum = max(self.maximum, np.max(dataSignalValid))
+        invalid = dataSignalValid < self.maximum/2
+        # Transitions from invalid to valid
+        stepIndex = self.step + np.cumsum(invalid[:-1] & ~invalid[1:])
+        if len(stepIndex) > 0:
+            self.step = stepIndex[-1]
+
+        self.pendingLockIn = lockinData[-1:]
+        self.pendingSignalValid = dataSignalValid[-1:]
+        return lockinData[:-1], stepIndex
+
+
+class SweepAverager():
+    def __init__(self, numberPoints, dataDropOff=0, outlierThreshold=None, outlierTolerance=0, maxConsecutiveRejections=3):
+        """Bins repeated passes of a sweep as they are acquired and keeps the running mean and variance for each point.
+        With an outlier threshold, values deviating from the median of the previous passes by more than the threshold times the spread are rejected. 
+        The spread is the median absolute deviation of the previous passes (scaled to a standard deviation), but at least the standard deviation 
+        of the samples within the point and the absolute tolerance. Points without spread (within the numerical precision) are not judged.
+        A pass is rejected completely if more than half of its points are outliers (e.g. tip changes). After several consecutive rejected passes 
+        (e.g. drift or a permanent tip change) the previous passes are no longer used as reference and the rejected passes become the new reference.
+
+        Args:
+            numberPoints (int): Number of points per pass.
+            dataDropOff (float, optional): Fraction of the samples at the beginning of each point which is discarded (0...1). Defaults to 0.
+            outlierThreshold (float, optional): Threshold for outliers in standard deviations. Defaults to None: No outlier rejection.
+            outlierTolerance (float, optional): Minimum spread in V, e.g. the resolution of the DAQ. Defaults to 0.
+            maxConsecutiveRejections (int, optional): Number of consecutive rejected passes after which the reference is renewed. Defaults to 3.
+        """        
+        self.numberPoints = numberPoints
+        self.dataDropOff = dataDropOff
+        self.outlierThreshold = outlierThreshold
+        self.outlierTolerance = outlierTolerance
+        self.maxConsecutiveRejections = maxConsecutiveRejections
+        self.statistics = RunningStatistics((numberPoints,))
+        self.currentPass = 0
+        self.bufferLockIn = np.zeros(0)
+        self.bufferStep = np.zeros(0, dtype=np.int64)
+        self.rejectedPasses = []
+        self.rejectedPoints = 0
+        # Binned values of the passes used as reference for the outlier rejection
+        self.referencePasses = []
+
+    def add(self, lockinData, stepIndex):
+        """Adds decoded samples and evaluates all completed passes.
+
+        Args:
+            lockinData (ndarray): Lock-in signal.
+            stepIndex (ndarray): Number of the sweep step for each sample (counted over all passes).
+
+        Returns:
+            int: Number of passes completed by these samples.
+        """        
+        self.bufferLockIn = np.concatenate((self.bufferLockIn, lockinData))
+        self.bufferStep = np.concatenate((self.bufferStep, stepIndex))
+        completed = 0
+        while len(self.bufferStep) > 0 and self.bufferStep[-1] >= (self.currentPass + 1) * self.numberPoints:
+            self.evaluatePass()
+            completed += 1
+        return completed
+
+    def finish(self):
+        """Evaluates the samples of the current (incomplete) pass.
+        """        
+        if len(self.bufferStep) > 0:
+            self.evaluatePass()
+
+    def evaluatePass(self):
+        """Bins the samples of the current pass and adds them to the running statistics.
+        """        
+        passEnd = (self.currentPass + 1) * self.numberPoints
+        inPass = self.bufferStep < passEnd
+        lockinData = self.bufferLockIn[inPass]
+        stepIndex = self.bufferStep[inPass] - self.currentPass * self.numberPoints
+        values, found = binSweepData(lockinData, stepIndex, self.numberPoints, self.dataDropOff)
+        values[~found] = np.nan
+        self.bufferLockIn = self.bufferLockIn[~inPass]
+        self.bufferStep = self.bufferStep[~inPass]
+
+        if self.outlierThreshold is not None:
+            # Standard deviation of the samples within each point
+            sampleVariance, _ = binSweepData((lockinData - values[stepIndex % self.numberPoints])**2, stepIndex, self.numberPoints, self.dataDropOff)
+            sampleDeviation = np.sqrt(sampleVariance)
+            outlier = np.zeros(self.numberPoints, dtype=bool)
+            judged = np.zeros(self.numberPoints, dtype=bool)
+            # The spread is only judged with at least three previous passes
+            if len(self.referencePasses) >= 3:
+                reference = np.array(self.referencePasses)
+                with warnings.catch_warnings():
+                    # Points without data in all reference passes
+                    warnings.simplefilter('ignore', RuntimeWarning)
+                    median = np.nanmedian(reference, axis=0)
+                    spread = 1.4826 * np.nanmedian(np.abs(reference - median), axis=0)
+                spread = np.fmax(np.fmax(spread, sampleDeviation), self.outlierTolerance)
+                with np.errstate(invalid='ignore'):
+                    judged = ~np.isnan(values) & ~np.isnan(median) & (np.sum(~np.isnan(reference), axis=0) >= 3) & (spread > 1e-9 * np.abs(median))
+                    outlier = judged & (np.abs(values - median) > self.outlierThreshold * spread)
+            # Rejected passes are part of the reference, so that the median follows a drift
+            self.referencePasses.append(np.array(values))
+            if np.sum(judged) > 0 and np.sum(outlier) > np.sum(judged)/2:
+                self.rejectedPasses.append(self.currentPass)
+                print('Pass {} rejected: {} of {} points are outliers.'.format(self.currentPass + 1, np.sum(outlier), np.sum(judged)))
+                consecutive = self.rejectedPasses[-self.maxConsecutiveRejections:]
+                if len(consecutive) == self.maxConsecutiveRejections and consecutive[0] == self.currentPass - self.maxConsecutiveRejections + 1:
+                    # The signal has changed permanently: The rejected passes become the new reference
+                    print('{} consecutive passes rejected: Outlier reference renewed.'.format(self.maxConsecutiveRejections))
+                    self.referencePasses = self.referencePasses[-self.maxConsecutiveRejections:]
+                values[:] = np.nan
+            else:
+                self.rejectedPoints += int(np.sum(outlier))
+                values[outlier] = np.nan
+
+        self.statistics.update(values)
+        self.currentPass += 1
+
+    def getNumberPasses(self):
+        """Returns the number of evaluated passes (including rejected passes).
+
+        Returns:
+            int: Number of passes.
+        """        
+        return self.currentPass
+
+    def getNumberAcceptedPasses(self):
+        """Returns the number of averaged passes (without rejected passes).
+
+        Returns:
+            int: Number of passes.
+        """        
+        return self.currentPass - len(self.rejectedPasses)
+
+def fitSettlingSteps(lockinData, stepIndex, samplingRate, timeConstant, filterOrder=1):
+    """Fits the settling model to each sweep step. The output of a lock-in filter of order n (cascade of n identical RC filters) 
+    approaches the steady-state value as a linear combination of (t/tau)^k/k! * exp(-t/tau) with k = 0...n-1 for any previous state.
+    The steady-state value and the amplitudes are determined by linear least squares. The first step is usually incomplete and is described by a constant.
+
+    Args:
+        lockinData (ndarray): Lock-in signal.
+        stepIndex (ndarray): Number of the sweep step for each sample (see decodeSignalValid).
+        samplingRate (float): Sampling rate of the DAQ in samples per second.
+        timeConstant (float): Time constant of the lock-in in seconds.
+        filterOrder (int, optional): Filter order of the lock-in (e.g. 6 dB/oct: 1, 24 dB/oct: 4). Defaults to 1.
+
+    Returns:
+        ndarray, ndarray, ndarray: Steady-state value, sum of squared residuals and number of fitted samples for each step (index: step - first step).
+    """    
+    lockinData = np.asarray(lockinData, dtype=np.float64)
+    stepIndex = np.asarray(stepIndex)
+    if len(stepIndex) == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    # The last sample of each step is already the beginning of the next step (see binSweepData)
+    keep = np.ones(len(stepIndex), dtype=bool)
+    keep[:-1] = stepIndex[:-1] == stepIndex[1:]
+    step = stepIndex - stepIndex[0]
+    numberSteps = step[-1] + 1
+    position = np.arange(len(step)) - np.searchsorted(step, step, side='left')
+
+    # Basis functions: constant and transient terms
+    x = position / (samplingRate * timeConstant)
+    basis = [np.ones(len(x))]
+    term = np.exp(-x)
+    for k in range(int(filterOrder)):
+        basis.append(np.where(step == 0, 0, term))
+        term = term * x / (k + 1)
+    basis = np.array(basis)[:, keep]
+    y, step = lockinData[keep], step[keep]
+
+    # Normal equations of all steps at once
+    numberParameters = len(basis)
+    gram = np.zeros((numberSteps, numberParameters, numberParameters))
+    projection = np.zeros((numberSteps, numberParameters))
+    for i in range(numberParameters):
+        projection[:, i] = np.bincount(step, weights=basis[i]*y, minlength=numberSteps)
+        for j in range(i, numberParameters):
+            gram[:, i, j] = gram[:, j, i] = np.bincount(step, weights=basis[i]*basis[j], minlength=numberSteps)
+    count = gram[:, 0, 0]
+    coefficients = np.einsum('nij,nj->ni', np.linalg.pinv(gram, rcond=1e-10), projection)
+    residual = np.bincount(step, weights=y*y, minlength=numberSteps) - np.einsum('ni,ni->n', coefficients, projection)
+    residual = np.maximum(residual, 0)
+    steady = coefficients[:, 0]
+    # Too few samples for the transient: Mean value
+    tooShort = count <= numberParameters
+    with np.errstate(invalid='ignore', divide='ignore'):
+        steady[tooShort] = projection[tooShort, 0] / count[tooShort]
+        residual[tooShort] = np.maximum(np.bincount(step, weights=y*y, minlength=numberSteps)[tooShort] - steady[tooShort] * projection[tooShort, 0], 0)
+    steady[count == 0] = np.nan
+    return steady, residual, count
+
+def fitSettlingData(lockinData, stepIndex, numberPoints, samplingRate, timeConstant=None, filterOrder=1):
+    """Determines the steady-state lock-in signal of each sweep point from the settling transient instead of discarding the beginning of each point.
+    If no time constant is given, the time constant is fitted (one value for all steps).
+
+    Args:
+        lockinData (ndarray): Lock-in signal.
+        stepIndex (ndarray): Number of the sweep step for each sample (see decodeSignalValid).
+        numberPoints (int): Number of points per sweep pass.
+        samplingRate (float): Sampling rate of the DAQ in samples per second.
+        timeConstant (float, optional): Time constant of the lock-in in seconds. Defaults to None: Time constant is fitted.
+        filterOrder (int, optional): Filter order of the lock-in. Defaults to 1.
+
+    Returns:
+        ndarray, ndarray, ndarray, float: Steady-state lock-in signal, True for points with data, RMS residual of the fit, time constant in seconds.
+    """    
+    lockinSignal = np.zeros(numberPoints)
+    found = np.zeros(numberPoints, dtype=bool)
+    residualRMS = np.full(numberPoints, np.nan)
+    stepIndex = np.asarray(stepIndex)
+    if len(stepIndex) == 0:
+        return lockinSignal, found, residualRMS, timeConstant
+
+    if timeConstant is None:
+        # Search on a logarithmic grid between one sample and the median step duration, then refine around the minimum
+        stepLength = np.bincount(stepIndex - stepIndex[0])
+        longest = max(np.median(stepLength[stepLength > 0]), 2) / samplingRate
+        candidates = np.geomspace(0.1 / samplingRate, longest, 40)
+        for _ in range(2):
+            cost = [np.sum(fitSettlingSteps(lockinData, stepIndex, samplingRate, tc, filterOrder)[1]) for tc in candidates]
+            best = int(np.argmin(cost))
+            candidates = np.geomspace(candidates[max(best-1, 0)], candidates[min(best+1, len(candidates)-1)], 20)
+        timeConstant = candidates[int(np.argmin([np.sum(fitSettlingSteps(lockinData, stepIndex, samplingRate, tc, filterOrder)[1]) for tc in candidates]))]
+
+    steady, residual, count = fitSettlingSteps(lockinData, stepIndex, samplingRate, timeConstant, filterOrder)
+    # Combine repeated passes of the same point
+    point = (np.arange(len(steady)) + stepIndex[0]) % numberPoints
+    valid = count > 0
+    countPoint = np.bincount(point[valid], weights=count[valid], minlength=numberPoints)
+    found = countPoint > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lockinSignal = np.bincount(point[valid], weights=steady[valid] * count[valid], minlength=numberPoints) / countPoint
+        residualRMS = np.sqrt(np.bincount(point[valid], weights=residual[valid], minlength=numberPoints) / countPoint)
+    lockinSignal[~found] = 0
+    residualRMS[~found] = np.nan
+    return lockinSignal, found, residualRMS, timeConstant
+
+class SoftwareLockIn():
+    def __init__(self, samplingRate, harmonics=[1], timeConstant=None, filterOrder=1):
+        """Demodulates a raw signal with a square-wave reference (e.g. marker of the AWG or pulse generator output of the SG) block by block.
+        The phase of the reference is interpolated between its rising edges. The mixed signal is integrated over each reference period, 
+        which suppresses the DC part and all other harmonics. The period values can additionally be smoothed by an RC low-pass filter.
+        Samples after the last rising edge are held back until the next block.
+
+        Args:
+            samplingRate (float): Sampling rate in samples per second.
+            harmonics (list, optional): Harmonics of the reference frequency to demodulate. Defaults to [1].
+            timeConstant (float, optional): Time constant of the low-pass filter in seconds. Defaults to None: Values of the individual periods.
+            filterOrder (int, optional): Order of the low-pass filter. Defaults to 1.
+        """        
+        self.samplingRate = samplingRate
+        self.harmonics = np.asarray(harmonics, dtype=np.float64)
+        self.timeConstant = timeConstant
+        self.filterOrder = filterOrder
+        self.reset()
+
+    def reset(self):
+        """Discards all held back samples and the state of the low-pass filter.
+        """        
+        self.signal = np.zeros(0)
+        self.reference = np.zeros(0)
+        self.offset = 0
+        self.referenceMin = np.inf
+        self.referenceMax = -np.inf
+        self.filterState = None
+        self.lastTime = None
+
+    def process(self, signal, reference):
+        """Demodulates the next block of samples.
+
+        Args:
+            signal (ndarray): Raw signal.
+            reference (ndarray): Reference signal (square wave).
+
+        Returns:
+            ndarray, ndarray, ndarray: Time of the completed reference periods in seconds (center, counted from the first sample), 
+            In-phase component X and quadrature component Y (RMS values) with shape (number of harmonics, number of periods).
+        """        
+        self.signal = np.concatenate((self.signal, np.asarray(signal, dtype=np.float64)))
+        self.reference = np.concatenate((self.reference, np.asarray(reference, dtype=np.float64)))
+        numberHarmonics = len(self.harmonics)
+        if len(self.reference) > 0:
+            self.referenceMin = min(self.referenceMin, np.min(self.reference))
+            self.referenceMax = max(self.referenceMax, np.max(self.reference))
+
+        # Rising edges with linear interpolation between the samples
+        threshold = (self.referenceMin + self.referenceMax)/2
+        high = self.reference >= threshold
+        crossing = np.flatnonzero(~high[:-1] & high[1:])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = (threshold - self.reference[crossing]) / (self.reference[crossing+1] - self.reference[crossing])
+        edges = crossing + np.nan_to_num(fraction)
+
+        if len(edges) < 2:
+            # Keep the samples from the last edge
+            keepFrom = crossing[-1] if len(crossing) > 0 else max(len(self.reference) - 1, 0)
+            self.discard(keepFrom)
+            return np.zeros(0), np.zeros((numberHarmonics, 0)), np.zeros((numberHarmonics, 0))
+
+        # Phase of each sample between the first and the last edge
+        index = np.arange(int(np.ceil(edges[0])), int(np.ceil(edges[-1])))
+        cycle = np.interp(index, edges, np.arange(len(edges)))
+        period = np.minimum(cycle.astype(np.int64), len(edges) - 2)
+        phase = 2*np.pi * (cycle - period)
+        numberPeriods = len(edges) - 1
+        counts = np.bincount(period, minlength=numberPeriods)
+        x = np.zeros((numberHarmonics, numberPeriods))
+        y = np.zeros((numberHarmonics, numberPeriods))
+        for k, harmonic in enumerate(self.harmonics):
+            x[k] = np.bincount(period, weights=self.signal[index] * np.cos(harmonic * phase), minlength=numberPeriods)
+            y[k] = np.bincount(period, weights=self.signal[index] * np.sin(harmonic * phase), minlength=numberPeriods)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x = np.sqrt(2) * x / counts
+            y = -np.sqrt(2) * y / counts
+        t = (self.offset + (edges[:-1] + edges[1:])/2) / self.samplingRate
+
+        if self.timeConstant is not None:
+            x, y = self.filter(t, x, y)
+
+        self.discard(crossing[-1])
+        return t, x, y
+
+    def discard(self, numberSamples):
+        """Discards processed samples.
+
+        Args:
+            numberSamples (int): Number of samples to discard.
+        """        
+        self.signal = self.signal[numberSamples:]
+        self.reference = self.reference[numberSamples:]
+        self.offset += numberSamples
+
+    def filter(self, t, x, y):
+        """Smoothes the period values with a cascade of RC low-pass filters.
+
+        Args:
+            t (ndarray): Time of the periods in seconds.
+            x (ndarray): In-phase components.
+            y (ndarray): Quadrature components.
+
+        Returns:
+            ndarray, ndarray: Filtered in-phase and quadrature components.
+        """        
+        z = x + 1j*y
+        if self.filterState is None:
+            self.filterState = np.repeat(z[:, :1], self.filterOrder, axis=1)
+            self.lastTime = t[0]
+        output = np.zeros_like(z)
+        for n in range(len(t)):
+            weight = 1 - np.exp(-(t[n] - self.lastTime) / self.timeConstant)
+            value = z[:, n]
+            for stage in range(self.filterOrder):
+                self.filterState[:, stage] += weight * (value - self.filterState[:, stage])
+                value = self.filterState[:, stage]
+            output[:, n] = value
+            self.lastTime = t[n]
+        return output.real, output.imag
+
+def convertToPolar(x, y):
+    """Converts in-phase and quadrature components to amplitude and phase.
+
+    Args:
+        x (ndarray): In-phase component.
+        y (ndarray): Quadrature component.
+
+    Returns:
+        ndarray, ndarray: Amplitude R, Phase in degrees.
+    """    
+    return np.hypot(x, y), np.degrees(np.arctan2(y, x))
+
+def decimateMinMax(signal, maxPoints):
+    """Decimates a signal for displaying: The signal is divided into buckets and the minimum and maximum of every bucket are kept in their original order.
+    The envelope of the signal (e.g. short pulses) is preserved at any number of points.
+
+    Args:
+        signal (ndarray): Signal.
+        maxPoints (int): Maximum number of points after decimation.
+
+    Returns:
+        ndarray, ndarray: Sample indices of the kept points, Kept points.
+    """    
+    signal = np.asarray(signal)
+    if len(signal) <= maxPoints:
+        return np.arange(len(signal)), signal
+    bucketSize = int(np.ceil(len(signal) / max(1, maxPoints // 2)))
+    numberBuckets = len(signal) // bucketSize
+    buckets = signal[:numberBuckets * bucketSize].reshape(numberBuckets, bucketSize)
+    offsets = np.arange(numberBuckets) * bucketSize
+    indices = [offsets + np.argmin(buckets, axis=1), offsets + np.argmax(buckets, axis=1)]
+    if numberBuckets * bucketSize < len(signal):
+        # Incomplete last bucket
+        rest = signal[numberBuckets * bucketSize:]
+        indices.append(numberBuckets * bucketSize + np.array([np.argmin(rest), np.argmax(rest)]))
+    # Sorted and without duplicates (flat buckets)
+    indices = np.unique(np.concatenate(indices))
+    return indices, signal[indices]
@@ -39,7 +39,7 @@ Probe = {'name': 'Probe', 'type': 'DC', 'cycle': 'A',
         'startAmplitude (V)': 20e-3, 'endAmplitude (V)': 20e-3, 'sweepAmplitude': False}
 
 pulseScheme = {'pulses': [Pump, Probe], 'repetitions': 200000, 
-                'resolution (s)': 100e-12, 'odulationFreq (Hz)': 90,
+                'resolution (s)': 100e-12, 'modulationFreq (Hz)': 90,
                 'sweepSteps': 9}
 
 
@@ -0,0 +1,11 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import os
+import sys
+import types
+
+# The modules use relative imports: Register the repository as package QuPE independent of the name of the folder
+if 'QuPE' not in sys.modules:
+    package = types.ModuleType('QuPE')
+    package.__path__ = [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    sys.modules['QuPE'] = package
@@ -0,0 +1,26 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import json
+
+import pytest
+
+pytest.importorskip('pyvisa')
+pytest.importorskip('nidaqmx')
+
+from QuPE.Jobs import JobQueue
+from QuPE.Sessions import startInstruments
+
+
+def test_startInstruments_withoutInstruments():
+    assert startInstruments([]) == []
+
+def test_JobQueue_rerunFinishedQueue(tmp_path):
+    # A finished queue is executed again without connecting any instrument
+    stateFile = tmp_path / 'queue.json'
+    job = {'File': str(tmp_path / 'job.json'), 'Type': 'pumpProbe', 'GeneralSettings': {'AWG_VisaResource': 'TCPIP0::localhost::INSTR'}, 'Scheme': {}, 
+           'Comment': {}, 'Arguments': {}, 'Status': 'done', 'Attempts': 1}
+    stateFile.write_text(json.dumps({'Jobs': [job]}))
+    assert JobQueue(str(stateFile)).run() == ['done']
+
+def test_JobQueue_runEmptyQueue(tmp_path):
+    assert JobQueue(str(tmp_path / 'queue.json')).run() == []
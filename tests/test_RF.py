@@ -0,0 +1,98 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyvisa')
+pytest.importorskip('nidaqmx')
+
+from QuPE.RF import averageRepeatedSweep
+
+
+def generateSweepBlocks(numberPoints, numberPasses, samplesPerPoint=20, blockSize=30):
+    # Signal valid output: Every point except the first starts with a low pulse
+    signalValid = []
+    lockinSignal = []
+    for sweepPass in range(numberPasses):
+        for point in range(numberPoints):
+            valid = np.full(samplesPerPoint, 5.0)
+            if sweepPass + point > 0:
+                valid[:3] = 0
+            signalValid.append(valid)
+            lockinSignal.append(np.full(samplesPerPoint, point + 0.1*sweepPass))
+    signalValid = np.concatenate(signalValid)
+    lockinSignal = np.concatenate(lockinSignal)
+    return [np.array([lockinSignal[i:i+blockSize], signalValid[i:i+blockSize]]) for i in range(0, len(signalValid), blockSize)]
+
+def test_averageRepeatedSweep_keepsLastPassAtEndOfStream():
+    # Target error not reached before the stream ends: The last pass must not be discarded
+    blocks = generateSweepBlocks(5, 4)
+    averager = averageRepeatedSweep({'LockIn_DataDropOff': 0.2}, blocks, 5, 10, targetStandardError=1e-9, minimumPasses=2)
+    assert averager.getNumberPasses() == 4
+    assert np.all(averager.statistics.getCount() == 4)
+
+def test_averageRepeatedSweep_stopsAfterRepetitions():
+    blocks = generateSweepBlocks(5, 4)
+    averager = averageRepeatedSweep({'LockIn_DataDropOff': 0.2}, blocks, 5, 3)
+    assert averager.getNumberPasses() == 3
+
+def test_measureTransferFunction_resumesAfterLastIteration(tmp_path, monkeypatch):
+    import QuPE.RF as RF
+    from QuPE.Calibration import convertPowerToVoltage
+
+    frequencies = np.linspace(1e9, 2e9, 11)
+    transmission = lambda frequency: 0.5 + 0.1*frequency/1e9
+    calls = {'powerSweep': 0, 'list': 0}
+    interruptAt = [2]
+
+    class Crosstalk():
+        def calculateCrosstalk(self, frequency, power):
+            return np.zeros(np.broadcast(frequency, power).shape)
+
+    def measurePowerSweep(generalSettings, sweepScheme, save=True):
+        calls['powerSweep'] += 1
+        power = np.linspace(-20, 0, 21)
+        return power, convertPowerToVoltage(power)*transmission(sweepScheme['powerSweepFrequency (Hz)'])
+
+    def measureFrequencySweep(generalSettings, sweepScheme, mode='SWEEP', freqList=None, powList=None, save=True):
+        if mode == 'LIST':
+            calls['list'] += 1
+            if calls['list'] == interruptAt[0]:
+                raise KeyboardInterrupt()
+            return freqList, convertPowerToVoltage(powList)*transmission(freqList)
+        return frequencies, convertPowerToVoltage(sweepScheme['frequencySweepPower (dBm)'])*transmission(frequencies)
+
+    monkeypatch.setattr(RF, 'measurePowerSweep', measurePowerSweep)
+    monkeypatch.setattr(RF, 'measureFrequencySweep', measureFrequencySweep)
+    monkeypatch.setattr(RF, 'loadCalibrationModel', lambda generalSettings, useTF=False: Crosstalk())
+    monkeypatch.setattr(RF, 'showPlot', lambda *args, **kwargs: None)
+    monkeypatch.setattr(RF, 'publishProgress', lambda *args, **kwargs: None)
+
+    generalSettings = {'UseTF': False, 'SG_PowerMin (dBm)': -30, 'SG_PowerMax (dBm)': 10}
+    sweepScheme = {'powerSweepFrequency (Hz)': 1e9, 'frequencySweepPower (dBm)': -10, 'junctionAmplitude (V)': 0.05}
+    calibrationValues = {'SourcePower': -10, 'junctionAmplitude (V)': float(convertPowerToVoltage(-10)*transmission(1e9)), 'CurrentChange': 1}
+    checkpoint = str(tmp_path / 'tf_checkpoint.json')
+
+    # Interrupted in the third iteration: The first two iterations are kept
+    with pytest.raises(KeyboardInterrupt):
+        RF.measureTransferFunction(generalSettings, sweepScheme, calibrationValues, iterations=3, save=False, checkpoint=checkpoint)
+    with open(checkpoint) as json_file:
+        assert json.load(json_file)['completedIterations'] == 2
+
+    # Resumed: Only the third iteration is measured
+    interruptAt[0] = -1
+    calls.update({'powerSweep': 0, 'list': 0})
+    frequency, tfTransmission = RF.measureTransferFunction(generalSettings, sweepScheme, calibrationValues, iterations=3, save=False, checkpoint=checkpoint)
+    assert calls == {'powerSweep': 0, 'list': 1}
+    assert not os.path.exists(checkpoint)
+    np.testing.assert_allclose(frequency, frequencies)
+    np.testing.assert_allclose(tfTransmission, transmission(frequencies), rtol=1e-3)
+
+    # A different measurement must not continue the checkpoint
+    with open(checkpoint, 'w') as json_file:
+        json.dump({'GeneralSettings': generalSettings, 'Scheme': sweepScheme, 'calibrationValues': calibrationValues, 'iterations': 2, 'resistance': 50, 'tolerance': None}, json_file)
+    with pytest.raises(Exception, match='different measurement'):
+        RF.measureTransferFunction(generalSettings, sweepScheme, calibrationValues, iterations=3, save=False, checkpoint=checkpoint)
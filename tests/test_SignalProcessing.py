@@ -0,0 +1,41 @@
+# Copyright (c) 2022-2023 Taner Esat <t.esat@fz-juelich.de>
+
+import numpy as np
+
+from QuPE.SignalProcessing import SweepAverager
+
+
+def addPasses(averager, passValues, samplesPerPoint=10, noise=0, seed=0):
+    # Samples of consecutive passes with the step index counted over all passes
+    rng = np.random.default_rng(seed)
+    numberPoints = len(passValues[0])
+    for sweepPass, values in enumerate(passValues):
+        lockinData = np.repeat(values, samplesPerPoint) + rng.normal(0, noise, numberPoints * samplesPerPoint) if noise > 0 else np.repeat(values, samplesPerPoint)
+        stepIndex = np.repeat(np.arange(numberPoints), samplesPerPoint) + sweepPass * numberPoints
+        averager.add(lockinData, stepIndex)
+    averager.finish()
+
+def test_SweepAverager_followsDrift():
+    # Offset of 1 % after three passes: Only the passes until the reference is renewed are rejected
+    signal = np.linspace(1, 2, 20)
+    averager = SweepAverager(20, outlierThreshold=5)
+    addPasses(averager, [signal] * 3 + [signal * 1.01] * 7, noise=1e-4)
+    assert averager.getNumberPasses() == 10
+    assert averager.rejectedPasses == [3, 4, 5]
+    assert averager.getNumberAcceptedPasses() == 7
+
+def test_SweepAverager_rejectsSinglePass():
+    signal = np.linspace(1, 2, 20)
+    averager = SweepAverager(20, outlierThreshold=5)
+    addPasses(averager, [signal] * 4 + [signal + 0.1] + [signal] * 3, noise=1e-4)
+    assert averager.rejectedPasses == [4]
+
+def test_SweepAverager_identicalPasses():
+    # Without spread (identical quantized passes) points are not judged
+    signal = np.round(np.linspace(1, 2, 20), 2)
+    averager = SweepAverager(20, outlierThreshold=5)
+    addPasses(averager, [signal] * 4 + [signal + 0.01])
+    assert averager.rejectedPasses == []
+    averager = SweepAverager(20, outlierThreshold=5, outlierTolerance=0.001)
+    addPasses(averager, [signal] * 4 + [signal + 0.01] + [signal])
+    assert averager.rejectedPasses == [4]